@@ -0,0 +1,104 @@
+"""Benchmark ContentExtractor over a directory of saved pages.
+
+Compares the working tree against the extractor at a git ref (HEAD by
+default) and reports per-page time and peak allocations for both.
+Allocations are the Python heap as tracemalloc sees it; memory that lxml
+allocates in C is not counted.
+
+    python benchmarks/extraction_benchmark.py path/to/pages --ref HEAD --repeat 3
+"""
+import argparse
+import asyncio
+import importlib.util
+import logging
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from utils.content_extractor import ContentExtractor  # noqa: E402
+
+def load_extractor_at(ref: str):
+    """Import ContentExtractor from utils/content_extractor.py as it was at `ref`."""
+    source = subprocess.run(
+        ["git", "show", f"{ref}:./utils/content_extractor.py"],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True
+    ).stdout
+    # The module is fully executed on import; the file is not needed afterwards
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "baseline_content_extractor.py"
+        path.write_text(source)
+        spec = importlib.util.spec_from_file_location("baseline_content_extractor", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module.ContentExtractor()
+
+def make_runner(extractor, loop):
+    # Older extractors only expose the async entry point
+    if hasattr(extractor, "extract"):
+        return extractor.extract
+    return lambda html, url: loop.run_until_complete(extractor.extract_content(html, url))
+
+def measure(run, pages, repeat: int):
+    """Median seconds and mean peak KiB allocated per page."""
+    times, peaks = [], []
+    for path, html in pages:
+        url = path.as_uri()
+        best = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(html, url)
+            best.append(time.perf_counter() - start)
+        times.append(min(best))
+
+        tracemalloc.start()
+        run(html, url)
+        peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+    return times, peaks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path, help="directory of saved .html pages (searched recursively)")
+    parser.add_argument("--ref", default="HEAD", help="git ref of the baseline extractor")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per page; the fastest counts")
+    parser.add_argument("--limit", type=int, default=200, help="maximum number of pages")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    paths = sorted(args.corpus.rglob("*.html"))[:args.limit]
+    if not paths:
+        parser.error(f"no .html files under {args.corpus}")
+    pages = [(path, path.read_text(encoding="utf-8", errors="replace")) for path in paths]
+    total_kb = sum(len(html) for _, html in pages) / 1024
+    print(f"{len(pages)} pages, {total_kb / len(pages):.1f} KiB average")
+
+    loop = asyncio.new_event_loop()
+    results = {}
+    for label, extractor in (("before", load_extractor_at(args.ref)), ("after", ContentExtractor())):
+        run = make_runner(extractor, loop)
+        run(pages[0][1], pages[0][0].as_uri())  # warm up lazy imports
+        results[label] = measure(run, pages, args.repeat)
+    loop.close()
+
+    print(f"{'':8}{'median ms':>12}{'p90 ms':>10}{'total s':>10}{'peak KiB':>12}")
+    for label, (times, peaks) in results.items():
+        p90 = sorted(times)[int(len(times) * 0.9) - 1] if len(times) >= 10 else max(times)
+        print(
+            f"{label:8}{statistics.median(times) * 1000:>12.2f}{p90 * 1000:>10.2f}"
+            f"{sum(times):>10.2f}{statistics.mean(peaks):>12.0f}"
+        )
+    before, after = results["before"], results["after"]
+    print(
+        f"speedup {sum(before[0]) / sum(after[0]):.2f}x, "
+        f"allocations {statistics.mean(after[1]) / statistics.mean(before[1]):.2f}x of before"
+    )
+
+if __name__ == "__main__":
+    main()
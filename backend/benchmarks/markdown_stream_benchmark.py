@@ -0,0 +1,127 @@
+"""Self-check and microbenchmark for the streaming Markdown segmenter.
+
+Checks, over randomly generated documents cut into random chunks, that:
+  * joining the emitted segments gives back the input exactly, and
+  * segments only end at line ends, at word boundaries inside paragraph
+    lines, or after a complete fenced code block.
+Then times the segmenter on growing documents to show the cost per
+character stays flat (linear time).
+
+    python benchmarks/markdown_stream_benchmark.py --cases 2000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.markdown_stream import FENCE_RE, STRUCTURAL_RE, MarkdownSegmenter  # noqa: E402
+
+WORDS = "the model streams tokens into blocks with **bold** `code` and [links](http://x) é 漢字 🚀".split()
+
+def random_block(rng: random.Random) -> str:
+    words = lambda n: " ".join(rng.choice(WORDS) for _ in range(n))  # noqa: E731
+    kind = rng.randrange(8)
+    if kind == 0:
+        return f"{'#' * rng.randint(1, 6)} {words(rng.randint(1, 6))}\n"
+    if kind == 1:
+        return "".join(f"{rng.choice('-*+')} {words(rng.randint(1, 10))}\n" for _ in range(rng.randint(1, 5)))
+    if kind == 2:
+        return "".join(f"{i + 1}. {words(rng.randint(1, 10))}\n" for i in range(rng.randint(1, 5)))
+    if kind == 3:
+        fence = rng.choice(["```", "~~~", "````"])
+        body = "".join(f"    {words(rng.randint(0, 6))}\n" for _ in range(rng.randint(0, 6)))
+        return f"{fence}{rng.choice(['', 'python', ' js'])}\n{body}{fence}\n"
+    if kind == 4:
+        return "".join(f"| {words(2)} | {words(2)} |\n" for _ in range(rng.randint(1, 4)))
+    if kind == 5:
+        return f"> {words(rng.randint(1, 20))}\n"
+    if kind == 6:
+        return "\n"
+    return words(rng.randint(1, 80)) + rng.choice(["\n", "\n\n", ""])
+
+def random_document(rng: random.Random) -> str:
+    return "".join(random_block(rng) for _ in range(rng.randint(0, 30)))
+
+def random_chunks(rng: random.Random, text: str):
+    i = 0
+    while i < len(text):
+        n = rng.choice([1, 1, 2, 3, 5, 8, 20, 200])
+        yield text[i:i + n]
+        i += n
+
+def segment(text_chunks, max_hold_chars=4000):
+    segmenter = MarkdownSegmenter(max_hold_chars)
+    segments = []
+    for chunk in text_chunks:
+        segments.extend(segmenter.feed(chunk))
+    segments.extend(segmenter.flush())
+    return [s for s in segments if s]
+
+def allowed_boundaries(text: str) -> set:
+    """Offsets where a segment may end: line ends, paragraph word breaks, after fences."""
+    allowed = {0, len(text)}
+    offset = 0
+    fence = None
+    for line in text.splitlines(keepends=True):
+        end = offset + len(line)
+        if fence is not None:
+            closing = line.strip()
+            if closing.startswith(fence) and closing == closing[0] * len(closing):
+                fence = None
+                allowed.add(end)
+        else:
+            match = FENCE_RE.match(line)
+            if match:
+                fence = match.group(1)
+            else:
+                allowed.add(end)
+                if not STRUCTURAL_RE.match(line):
+                    allowed.update(offset + i + 1 for i, ch in enumerate(line) if ch in " \t")
+        offset = end
+    return allowed
+
+def self_check(cases: int, seed: int):
+    rng = random.Random(seed)
+    for case in range(cases):
+        text = random_document(rng)
+        segments = segment(random_chunks(rng, text))
+        assert "".join(segments) == text, f"case {case}: output differs from input"
+        # A tiny hold limit forces early sends; text must still round-trip
+        assert "".join(segment(random_chunks(rng, text), max_hold_chars=64)) == text, f"case {case}: forced sends lost text"
+        allowed = allowed_boundaries(text)
+        position = 0
+        for piece in segments[:-1]:
+            position += len(piece)
+            assert position in allowed, f"case {case}: segment ends inside a block at {position}: {text[max(0, position - 30):position + 30]!r}"
+    print(f"self-check passed: {cases} random documents, output equals input, blocks kept whole")
+
+def benchmark(seed: int):
+    rng = random.Random(seed)
+    unit = "".join(random_block(rng) for _ in range(200))
+    print(f"{'doc KiB':>8}{'chunk':>7}{'ms':>10}{'ns/char':>10}{'segments':>10}")
+    for repeat in (1, 10, 100):
+        text = unit * repeat
+        for size in (1, 4, 32):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            start = time.perf_counter()
+            segments = segment(chunks)
+            elapsed = time.perf_counter() - start
+            assert "".join(segments) == text
+            print(f"{len(text) / 1024:>8.0f}{size:>7}{elapsed * 1000:>10.1f}{elapsed / len(text) * 1e9:>10.0f}{len(segments):>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=2000, help="random documents to check")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-benchmark", action="store_true")
+    args = parser.parse_args()
+
+    self_check(args.cases, args.seed)
+    if not args.skip_benchmark:
+        benchmark(args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Measure llama-server decode throughput with 1..N concurrent streams.
+
+Starts `concurrency` streaming chat completions at once, each generating
+exactly --tokens tokens, and reports aggregate and per-stream tokens per
+second. Run it against a server started by ModelManager (--parallel with
+--cont-batching) to see what the web pipeline gains from summarizing all
+sources at once; levels above the server's slot count just queue.
+
+    python benchmarks/slot_throughput_benchmark.py --url http://127.0.0.1:8080 --levels 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from config import settings  # noqa: E402
+
+PROMPT = "Summarize the history of the printing press in a few paragraphs."
+
+async def stream_one(client: httpx.AsyncClient, tokens: int, index: int) -> int:
+    """Number of streamed content chunks (one per token on llama-server)."""
+    received = 0
+    async with client.stream(
+        "POST",
+        "/v1/chat/completions",
+        json={
+            # A different prefix per stream keeps slots from sharing a cached prompt
+            "messages": [{"role": "user", "content": f"[{index}] {PROMPT}"}],
+            "max_tokens": tokens,
+            "temperature": 0.7,
+            "ignore_eos": True,
+            "stream": True
+        }
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            delta = json.loads(line[6:]).get("choices", [{}])[0].get("delta", {})
+            if delta.get("content"):
+                received += 1
+    return received
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, tokens: int):
+    start = time.perf_counter()
+    counts = await asyncio.gather(*[stream_one(client, tokens, i) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    total = sum(counts)
+    return total, elapsed
+
+async def main(url: str, levels, tokens: int, repeat: int):
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        try:
+            props = (await client.get("/props")).json()
+            print(f"server slots: {props.get('total_slots', 'unknown')}")
+        except Exception:
+            pass
+
+        # Warm up: load weights into the page cache before timing anything
+        await stream_one(client, 8, -1)
+
+        print(f"{'streams':>8} {'tokens':>8} {'seconds':>9} {'tok/s':>9} {'per stream':>11} {'speedup':>8}")
+        baseline = None
+        for concurrency in levels:
+            best_total, best_elapsed = 0, float("inf")
+            for _ in range(repeat):
+                total, elapsed = await run_level(client, concurrency, tokens)
+                if elapsed < best_elapsed:
+                    best_total, best_elapsed = total, elapsed
+            rate = best_total / best_elapsed
+            baseline = baseline or rate
+            print(
+                f"{concurrency:>8} {best_total:>8} {best_elapsed:>9.2f} {rate:>9.1f} "
+                f"{rate / concurrency:>11.1f} {rate / baseline:>7.2f}x"
+            )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=settings.LLAMA_SERVER_URL)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, settings.LLAMA_SERVER_SLOTS])
+    parser.add_argument("--tokens", type=int, default=128, help="tokens generated per stream")
+    parser.add_argument("--repeat", type=int, default=2, help="runs per level; the fastest counts")
+    args = parser.parse_args()
+    asyncio.run(main(args.url, sorted(set(args.levels)), args.tokens, args.repeat))
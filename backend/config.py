@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import List
 from pydantic import BaseModel
 from utils.paths import PROJECT_ROOT, DATA_DIR, MODELS_DIR, LLAMA_SERVER
 import os
@@ -21,10 +22,123 @@ class Settings(BaseModel):
     # Database settings
     DB_PATH: Path = DATA_DIR / "chat_history.db"
     DATABASE_URL: str = f"sqlite:///{DB_PATH}"
+    ASYNC_DATABASE_URL: str = f"sqlite+aiosqlite:///{DB_PATH}"
+    DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW: int = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT: float = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+    DB_BUSY_TIMEOUT_MS: int = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+    SESSIONS_PAGE_SIZE: int = int(os.getenv('SESSIONS_PAGE_SIZE', '100'))
+    HISTORY_PAGE_SIZE: int = int(os.getenv('HISTORY_PAGE_SIZE', '100'))
+    MAX_PAGE_SIZE: int = int(os.getenv('MAX_PAGE_SIZE', '500'))
+    DB_MMAP_SIZE: int = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
 
     # Server settings
     LLAMA_SERVER_HOST: str = os.getenv('LLAMA_SERVER_HOST', '127.0.0.1')
     LLAMA_SERVER_PORT: int = int(os.getenv('LLAMA_SERVER_PORT', '8080'))
+    LLAMA_SERVER_URL: str = f"http://{LLAMA_SERVER_HOST}:{LLAMA_SERVER_PORT}"
+    # Parallel slots, decoded together with continuous batching; each keeps the KV cache of one
+    # chat session's prompt prefix. Defaults to one slot per 8 cores (4 on a 32-core host); a model
+    # gets fewer when its weights plus one KV cache per slot would not fit in LLAMA_MEMORY_FRACTION
+    # of physical memory. KV_CACHE_BYTES_PER_TOKEN (f16 K+V over all layers) can be set per model
+    # as "kv_bytes_per_token" in its metadata JSON; the default suits 3B-8B models with GQA.
+    LLAMA_SERVER_SLOTS: int = int(os.getenv('LLAMA_SERVER_SLOTS', str(max(1, min(8, (os.cpu_count() or 8) // 8)))))
+    LLAMA_MEMORY_FRACTION: float = float(os.getenv('LLAMA_MEMORY_FRACTION', '0.75'))
+    KV_CACHE_BYTES_PER_TOKEN: int = int(os.getenv('KV_CACHE_BYTES_PER_TOKEN', str(128 * 1024)))
+    # Embeddings come from a second llama-server on the same model file (the weights are mmapped
+    # and shared), so they never run on, or evict, a chat slot
+    LLAMA_EMBEDDING_PORT: int = int(os.getenv('LLAMA_EMBEDDING_PORT', str(LLAMA_SERVER_PORT + 1)))
+    LLAMA_EMBEDDING_URL: str = f"http://{LLAMA_SERVER_HOST}:{LLAMA_EMBEDDING_PORT}"
+    EMBEDDING_CONTEXT_LENGTH: int = int(os.getenv('EMBEDDING_CONTEXT_LENGTH', '2048'))
+
+    # HTTP connection pool settings (shared clients for llama-server traffic)
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv('HTTP_MAX_CONNECTIONS', '20'))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', '10'))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+    HTTP_USE_HTTP2: bool = os.getenv('HTTP_USE_HTTP2', 'false').lower() == 'true'
+
+    # Prompt budget settings (0 = derive from the server's context window)
+    DEFAULT_CONTEXT_WINDOW: int = int(os.getenv('DEFAULT_CONTEXT_WINDOW', '4096'))
+    HISTORY_PROMPT_BUDGET: int = int(os.getenv('HISTORY_PROMPT_BUDGET', '0'))
+    HISTORY_RESERVED_OUTPUT_TOKENS: int = int(os.getenv('HISTORY_RESERVED_OUTPUT_TOKENS', '1024'))
+    TOKEN_CACHE_SIZE: int = int(os.getenv('TOKEN_CACHE_SIZE', '8192'))
+
+    # Rolling summary settings for long sessions
+    SUMMARY_TRIGGER_TOKENS: int = int(os.getenv('SUMMARY_TRIGGER_TOKENS', '2000'))
+    SUMMARY_KEEP_RECENT_TURNS: int = int(os.getenv('SUMMARY_KEEP_RECENT_TURNS', '4'))
+    SUMMARY_MAX_TOKENS: int = int(os.getenv('SUMMARY_MAX_TOKENS', '512'))
+
+    # Write-behind persistence of streamed responses
+    CHECKPOINT_EVERY_CHARS: int = int(os.getenv('CHECKPOINT_EVERY_CHARS', '256'))
+    CHECKPOINT_EVERY_SECONDS: float = float(os.getenv('CHECKPOINT_EVERY_SECONDS', '2'))
+    DB_WRITE_BATCH_SIZE: int = int(os.getenv('DB_WRITE_BATCH_SIZE', '200'))
+    DB_WRITE_FLUSH_INTERVAL: float = float(os.getenv('DB_WRITE_FLUSH_INTERVAL', '0.05'))
+
+    # How streamed tokens are merged into SSE frames: latency, smooth or bulk
+    STREAM_MODE: str = os.getenv('STREAM_MODE', 'smooth')
+
+    # Upload ingestion: hard size cap, and how much is kept in memory before spooling to disk
+    UPLOAD_MAX_BYTES: int = int(os.getenv('UPLOAD_MAX_BYTES', str(50 * 1024 * 1024)))
+    UPLOAD_SPOOL_MAX_SIZE: int = int(os.getenv('UPLOAD_SPOOL_MAX_SIZE', str(1024 * 1024)))
+    EXTRACTION_CACHE_DIR: Path = DATA_DIR / "extraction_cache"
+    EXTRACTION_CACHE_MAX_BYTES: int = int(os.getenv('EXTRACTION_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+    # Retrieval from uploaded documents (0 = half of the prompt budget)
+    DOCUMENT_CHUNK_CHARS: int = int(os.getenv('DOCUMENT_CHUNK_CHARS', '1200'))
+    DOCUMENT_MAX_CHUNKS: int = int(os.getenv('DOCUMENT_MAX_CHUNKS', '12'))
+    DOCUMENT_CONTEXT_TOKENS: int = int(os.getenv('DOCUMENT_CONTEXT_TOKENS', '0'))
+
+    # Web page extraction worker processes (0 = extract in threads)
+    EXTRACTION_WORKERS: int = int(os.getenv('EXTRACTION_WORKERS', str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+    EXTRACTION_TIMEOUT: float = float(os.getenv('EXTRACTION_TIMEOUT', '10'))
+    EXTRACTION_MAX_PENDING: int = int(os.getenv('EXTRACTION_MAX_PENDING', '32'))
+
+    # Web search fan-out per /chat/web request; summaries are limited across requests
+    WEB_SEARCH_CONCURRENCY: int = int(os.getenv('WEB_SEARCH_CONCURRENCY', '3'))
+    WEB_FETCH_CONCURRENCY: int = int(os.getenv('WEB_FETCH_CONCURRENCY', '6'))
+    WEB_SUMMARY_CONCURRENCY: int = int(os.getenv('WEB_SUMMARY_CONCURRENCY', '0'))  # 0 = all server slots but one
+
+    # Outbound web session (DuckDuckGo and page fetches)
+    WEB_MAX_CONNECTIONS: int = int(os.getenv('WEB_MAX_CONNECTIONS', '100'))
+    WEB_MAX_CONNECTIONS_PER_HOST: int = int(os.getenv('WEB_MAX_CONNECTIONS_PER_HOST', '8'))
+    WEB_DNS_CACHE_TTL: int = int(os.getenv('WEB_DNS_CACHE_TTL', '300'))
+    WEB_KEEPALIVE_TIMEOUT: float = float(os.getenv('WEB_KEEPALIVE_TIMEOUT', '30'))
+    WEB_REQUEST_TIMEOUT: float = float(os.getenv('WEB_REQUEST_TIMEOUT', '30'))
+
+    # Page downloads: only these content types, at most this many bytes, abandoned when too slow
+    WEB_ALLOWED_CONTENT_TYPES: List[str] = os.getenv(
+        'WEB_ALLOWED_CONTENT_TYPES', 'text/html,application/xhtml+xml,text/plain'
+    ).split(',')
+    WEB_MAX_PAGE_BYTES: int = int(os.getenv('WEB_MAX_PAGE_BYTES', str(5 * 1024 * 1024)))
+    WEB_READ_TIMEOUT: float = float(os.getenv('WEB_READ_TIMEOUT', '10'))
+    WEB_DOWNLOAD_TIMEOUT: float = float(os.getenv('WEB_DOWNLOAD_TIMEOUT', '20'))
+
+    # Extracted web pages, shared by all workers; stale entries are revalidated with conditional GETs
+    WEB_CACHE_PATH: Path = DATA_DIR / "web_cache.db"
+    WEB_CACHE_MAX_BYTES: int = int(os.getenv('WEB_CACHE_MAX_BYTES', str(128 * 1024 * 1024)))
+    WEB_CACHE_FRESH_SECONDS: float = float(os.getenv('WEB_CACHE_FRESH_SECONDS', '3600'))
+
+    # Search results by normalized query, kept in the web cache database
+    SEARCH_CACHE_TTL: float = float(os.getenv('SEARCH_CACHE_TTL', '1800'))
+    SEARCH_CACHE_STALE_SECONDS: float = float(os.getenv('SEARCH_CACHE_STALE_SECONDS', '86400'))
+    SEARCH_CACHE_NEGATIVE_TTL: float = float(os.getenv('SEARCH_CACHE_NEGATIVE_TTL', '300'))
+
+    # Only the search hits whose title and snippet match the question are fetched
+    WEB_TRIAGE_MAX_SOURCES: int = int(os.getenv('WEB_TRIAGE_MAX_SOURCES', '4'))
+    WEB_TRIAGE_MIN_SIMILARITY: float = float(os.getenv('WEB_TRIAGE_MIN_SIMILARITY', '0.2'))
+    WEB_TRIAGE_EMBEDDINGS: bool = os.getenv('WEB_TRIAGE_EMBEDDINGS', 'true').lower() == 'true'
+
+    # Fetched pages are split into passages; each summary prompt gets the best ones within a token budget
+    WEB_PASSAGE_CHARS: int = int(os.getenv('WEB_PASSAGE_CHARS', '800'))
+    WEB_SOURCE_CONTEXT_TOKENS: int = int(os.getenv('WEB_SOURCE_CONTEXT_TOKENS', '1500'))
+    # Longest a fetched page waits for slower ones before its passages are ranked and summarized
+    WEB_PASSAGE_WAIT_SECONDS: float = float(os.getenv('WEB_PASSAGE_WAIT_SECONDS', '1.0'))
+
+    # Semantic search over history and artifacts (llama-server embeddings)
+    SEMANTIC_INDEX_DIR: Path = DATA_DIR / "semantic_index"
+    SEMANTIC_INDEX_DTYPE: str = os.getenv('SEMANTIC_INDEX_DTYPE', 'int8')  # int8 or float16
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv('EMBEDDING_BATCH_SIZE', '32'))
+    EMBEDDING_MAX_CHARS: int = int(os.getenv('EMBEDDING_MAX_CHARS', '1500'))
+    SEMANTIC_INDEX_INTERVAL: float = float(os.getenv('SEMANTIC_INDEX_INTERVAL', '30'))
 
     def validate_paths(self):
         """Validate that all required paths exist"""
@@ -51,8 +165,92 @@ def create_default_env():
 LLAMA_SERVER_HOST=127.0.0.1
 LLAMA_SERVER_PORT=8080
 
+# Server Slots (capped by what fits in memory)
+LLAMA_MEMORY_FRACTION=0.75
+KV_CACHE_BYTES_PER_TOKEN={128 * 1024}
+LLAMA_EMBEDDING_PORT=8081
+EMBEDDING_CONTEXT_LENGTH=2048
+
+# HTTP Connection Pool
+HTTP_MAX_CONNECTIONS=20
+HTTP_MAX_KEEPALIVE_CONNECTIONS=10
+HTTP_KEEPALIVE_EXPIRY=30
+HTTP_USE_HTTP2=false
+
+# Prompt Budget (0 = use the context window reported by llama-server)
+HISTORY_PROMPT_BUDGET=0
+HISTORY_RESERVED_OUTPUT_TOKENS=1024
+
+# Rolling Summaries
+SUMMARY_TRIGGER_TOKENS=2000
+SUMMARY_KEEP_RECENT_TURNS=4
+
+# Streamed Response Checkpoints
+CHECKPOINT_EVERY_CHARS=256
+CHECKPOINT_EVERY_SECONDS=2
+
+# Streaming Output (latency, smooth or bulk)
+STREAM_MODE=smooth
+
+# Uploads
+UPLOAD_MAX_BYTES={50 * 1024 * 1024}
+EXTRACTION_CACHE_MAX_BYTES={256 * 1024 * 1024}
+
+# Document Retrieval (0 = half of the prompt budget)
+DOCUMENT_CHUNK_CHARS=1200
+DOCUMENT_MAX_CHUNKS=12
+DOCUMENT_CONTEXT_TOKENS=0
+
+# Web Page Extraction
+EXTRACTION_TIMEOUT=10
+EXTRACTION_MAX_PENDING=32
+
+# Web Search Concurrency
+WEB_SEARCH_CONCURRENCY=3
+WEB_FETCH_CONCURRENCY=6
+WEB_SUMMARY_CONCURRENCY=0
+
+# Outbound Web Session
+WEB_MAX_CONNECTIONS=100
+WEB_MAX_CONNECTIONS_PER_HOST=8
+WEB_DNS_CACHE_TTL=300
+WEB_KEEPALIVE_TIMEOUT=30
+WEB_REQUEST_TIMEOUT=30
+
+# Page Downloads
+WEB_ALLOWED_CONTENT_TYPES=text/html,application/xhtml+xml,text/plain
+WEB_MAX_PAGE_BYTES={5 * 1024 * 1024}
+WEB_READ_TIMEOUT=10
+WEB_DOWNLOAD_TIMEOUT=20
+
+# Web Page Cache
+WEB_CACHE_MAX_BYTES={128 * 1024 * 1024}
+WEB_CACHE_FRESH_SECONDS=3600
+
+# Search Result Cache
+SEARCH_CACHE_TTL=1800
+SEARCH_CACHE_STALE_SECONDS=86400
+SEARCH_CACHE_NEGATIVE_TTL=300
+
+# Search Result Triage
+WEB_TRIAGE_MAX_SOURCES=4
+WEB_TRIAGE_MIN_SIMILARITY=0.2
+WEB_TRIAGE_EMBEDDINGS=true
+
+# Passage Selection
+WEB_PASSAGE_CHARS=800
+WEB_SOURCE_CONTEXT_TOKENS=1500
+WEB_PASSAGE_WAIT_SECONDS=1.0
+
+# Semantic Search
+EMBEDDING_BATCH_SIZE=32
+EMBEDDING_MAX_CHARS=1500
+
 # Database Configuration
 DATABASE_URL=sqlite:///{settings.DB_PATH}
+DB_POOL_SIZE=5
+DB_MAX_OVERFLOW=10
+DB_BUSY_TIMEOUT_MS=5000
 
 # Model Configuration
 MODELS_DIR={settings.MODELS_DIR}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from datetime import datetime
@@ -8,6 +8,10 @@ Base = declarative_base()
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        # Covers the sidebar listing: ORDER BY updated_at DESC, id DESC
+        Index("ix_sessions_updated_at_id", "updated_at", "id", "title", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(String(255), default="New Chat")
@@ -17,25 +21,92 @@ class Session(Base):
     # Relationship with conversations
     conversations: Mapped[List["Conversation"]] = relationship("Conversation", back_populates="session", cascade="all, delete-orphan")
 
+    # Rolling summary of compacted turns
+    summary: Mapped[Optional["SessionSummary"]] = relationship("SessionSummary", back_populates="session", cascade="all, delete-orphan", uselist=False)
+
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Session history ordered by time, and by id for history building and compaction
+        Index("ix_conversations_session_timestamp_id", "session_id", "timestamp", "id"),
+        Index("ix_conversations_session_id_id", "session_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     session_id: Mapped[int] = mapped_column(ForeignKey('sessions.id'))
     user_input: Mapped[str] = mapped_column(Text)
     ai_response: Mapped[str] = mapped_column(Text)
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # "streaming" while the response is generated, then "complete" or "interrupted"
+    status: Mapped[str] = mapped_column(String(20), default="complete", server_default="complete")
 
     # Relationship with session
     session: Mapped["Session"] = relationship("Session", back_populates="conversations")
 
+class SessionSummary(Base):
+    __tablename__ = "session_summaries"
+
+    session_id: Mapped[int] = mapped_column(ForeignKey('sessions.id'), primary_key=True)
+    summary: Mapped[str] = mapped_column(Text, default="")
+    # High-water mark: every conversation with id <= this is folded into the summary
+    last_conversation_id: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    session: Mapped["Session"] = relationship("Session", back_populates="summary")
+
+class ArtifactBlob(Base):
+    __tablename__ = "artifact_blobs"
+
+    # SHA-256 of the uncompressed content; identical artifacts share one blob
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary)  # zlib-compressed
+    size_bytes: Mapped[int] = mapped_column(Integer)
+    compressed_bytes: Mapped[int] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
 class Artifact(Base):
     __tablename__ = "artifacts"
 
     id: Mapped[str] = mapped_column(String(50), primary_key=True)
-    content: Mapped[str] = mapped_column(Text)
+    # Legacy inline content; moved into artifact_blobs at startup
+    content: Mapped[str] = mapped_column(Text, default="")
     title: Mapped[str] = mapped_column(String(255))
     type_desc: Mapped[str] = mapped_column(String(255))
     language: Mapped[str] = mapped_column(String(50))
     size: Mapped[str] = mapped_column(String(50))
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    size_bytes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class Document(Base):
+    __tablename__ = "documents"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # SHA-256 of the uploaded bytes; the same file is stored and chunked once
+    sha256: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    filename: Mapped[str] = mapped_column(String(255))
+    size_chars: Mapped[int] = mapped_column(Integer, default=0)
+    chunk_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    chunks: Mapped[List["DocumentChunk"]] = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+    __table_args__ = (
+        Index("ix_document_chunks_document_position", "document_id", "position"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    document_id: Mapped[int] = mapped_column(ForeignKey('documents.id'))
+    position: Mapped[int] = mapped_column(Integer)
+    text: Mapped[str] = mapped_column(Text)
+
+    document: Mapped["Document"] = relationship("Document", back_populates="chunks")
+
+class SessionDocument(Base):
+    """Documents attached to a session; later turns keep retrieving from them."""
+    __tablename__ = "session_documents"
+
+    session_id: Mapped[int] = mapped_column(ForeignKey('sessions.id'), primary_key=True)
+    document_id: Mapped[int] = mapped_column(ForeignKey('documents.id'), primary_key=True)
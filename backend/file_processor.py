@@ -1,80 +1,144 @@
-import os
-from typing import Union
+import asyncio
+import codecs
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
 from fastapi import UploadFile
 import PyPDF2
 from docx import Document
 import magic
-import base64
 
-async def process_file(file: UploadFile) -> Union[str, None]:
-    try:
-        # Read the file content
-        content = await file.read()
+logger = logging.getLogger(__name__)
 
-        # Detect file type
-        file_type = magic.from_buffer(content, mime=True)
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 8192
 
-        # Reset file cursor
-        await file.seek(0)
+# Bump whenever extract_text changes its output, so cached extractions are not reused
+EXTRACTOR_VERSION = "1"
 
-        # Create temp directory if it doesn't exist
-        os.makedirs('temp', exist_ok=True)
-        temp_path = os.path.join('temp', f"temp_{file.filename}")
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"Upload exceeds the {max_bytes} byte limit")
 
-        try:
-            # Try to decode as text first, regardless of mime type
-            try:
-                return content.decode('utf-8')
-            except UnicodeDecodeError:
-                # If it's not text, continue with other formats
-                pass
-
-            # Handle PDF files
-            if file_type == 'application/pdf':
-                with open(temp_path, 'wb') as f:
-                    f.write(content)
-
-                text = ""
-                with open(temp_path, 'rb') as f:
-                    pdf_reader = PyPDF2.PdfReader(f)
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() + "\n"
-                return text.strip()
-
-            # Handle Word documents
-            elif file_type in [
-                'application/msword',
-                'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-            ]:
-                with open(temp_path, 'wb') as f:
-                    f.write(content)
-
-                doc = Document(temp_path)
-                text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-                return text.strip()
-
-            # For other files, return file info and first few lines if possible
-            else:
-                file_info = (
-                    f"File Information:\n"
-                    f"Filename: {file.filename}\n"
-                    f"File type: {file_type}\n"
-                    f"File size: {len(content)} bytes\n"
-                    f"First 256 bytes (hex): {content[:256].hex()}\n\n"
-                )
-
-                # Try to show first few lines if it might be text
+@dataclass
+class SpooledUpload:
+    """An upload copied into a private temp file, plus what was learned while streaming it."""
+    file: tempfile.SpooledTemporaryFile
+    size: int = 0
+    head: bytes = b""
+    sha256: Any = field(default_factory=hashlib.sha256)
+    text_parts: Optional[List[str]] = field(default_factory=list)  # None once it is not valid UTF-8
+
+    @property
+    def text(self) -> Optional[str]:
+        return "".join(self.text_parts) if self.text_parts is not None else None
+
+async def spool_upload(file: UploadFile, max_bytes: int, spool_max_size: int = 1024 * 1024) -> SpooledUpload:
+    """Stream an upload in chunks into a unique spooled temp file.
+
+    Small files stay in memory, larger ones roll over to disk. The size cap is
+    enforced while reading, and UTF-8 is validated incrementally so text files
+    are decoded in the same pass.
+    """
+    upload = SpooledUpload(tempfile.SpooledTemporaryFile(max_size=spool_max_size))
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            upload.size += len(chunk)
+            if upload.size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            if len(upload.head) < SNIFF_BYTES:
+                upload.head += chunk[:SNIFF_BYTES - len(upload.head)]
+            upload.file.write(chunk)
+            upload.sha256.update(chunk)
+
+            if upload.text_parts is not None:
                 try:
-                    first_lines = content[:1024].decode('utf-8')
-                    return f"{file_info}File Preview:\n{first_lines}"
+                    upload.text_parts.append(decoder.decode(chunk))
                 except UnicodeDecodeError:
-                    return f"{file_info}[Binary content]"
+                    upload.text_parts = None
 
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        if upload.text_parts is not None:
+            try:
+                upload.text_parts.append(decoder.decode(b"", final=True))
+            except UnicodeDecodeError:
+                upload.text_parts = None
+        upload.file.seek(0)
+        return upload
+    except BaseException:
+        upload.file.close()
+        raise
+
+def extract_text(upload: SpooledUpload, filename: str) -> Tuple[str, str]:
+    """Text of a spooled upload and its kind: "text", "document" or "binary".
+
+    Blocking, so run it off the event loop.
+    """
+    # Try text first, regardless of mime type
+    text = upload.text
+    if text is not None:
+        return text, "text"
+
+    # Sniff the type from the first few KB only
+    file_type = magic.from_buffer(upload.head, mime=True)
+
+    # PDF and Word readers take the spooled file directly, no second copy
+    if file_type == 'application/pdf':
+        pdf_reader = PyPDF2.PdfReader(upload.file)
+        return "\n".join(page.extract_text() for page in pdf_reader.pages).strip(), "document"
+
+    elif file_type in [
+        'application/msword',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    ]:
+        doc = Document(upload.file)
+        return "\n".join([paragraph.text for paragraph in doc.paragraphs]).strip(), "document"
+
+    # For other files, return file info and first few lines if possible
+    file_info = (
+        f"File Information:\n"
+        f"Filename: {filename}\n"
+        f"File type: {file_type}\n"
+        f"File size: {upload.size} bytes\n"
+        f"First 256 bytes (hex): {upload.head[:256].hex()}\n\n"
+    )
+    # Try to show first few lines if it might be text
+    try:
+        first_lines = upload.head[:1024].decode('utf-8')
+        return f"{file_info}File Preview:\n{first_lines}", "binary"
+    except UnicodeDecodeError:
+        return f"{file_info}[Binary content]", "binary"
+
+async def process_file(
+    file: UploadFile,
+    max_bytes: int,
+    spool_max_size: int = 1024 * 1024,
+    cache=None
+) -> Dict:
+    """Extract an upload's text, reusing a cached extraction of identical bytes."""
+    upload = await spool_upload(file, max_bytes, spool_max_size)
+    digest = upload.sha256.hexdigest()
+    try:
+        if cache and upload.text is None:
+            cached = await asyncio.to_thread(cache.get, digest)
+            if cached is not None:
+                return {"content": cached, "kind": "document", "sha256": digest, "cached": True}
 
+        text, kind = await asyncio.to_thread(extract_text, upload, file.filename)
+        # Only parsed documents are worth caching; decoding text is already cheap
+        if cache and kind == "document":
+            await asyncio.to_thread(cache.put, digest, text)
+        return {"content": text, "kind": kind, "sha256": digest, "cached": False}
     except Exception as e:
-        print(f"Error processing file: {str(e)}")
-        return f"Error processing file: {str(e)}\n\nFile type: {file_type}\nSize: {len(content)} bytes"
+        logger.error(f"Error processing file {file.filename}: {str(e)}")
+        return {
+            "content": f"Error processing file: {str(e)}\n\nSize: {upload.size} bytes",
+            "kind": "error",
+            "sha256": digest,
+            "cached": False
+        }
+    finally:
+        upload.file.close()
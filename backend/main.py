@@ -1,23 +1,41 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Query, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-import httpx
+from fastapi.responses import StreamingResponse, JSONResponse
 import json
 import asyncio
 from datetime import datetime
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select, delete, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from db_models import Base, Conversation, Session, Artifact
-from typing import Optional
-from file_processor import process_file
+from db_models import Conversation, Session, SessionSummary, SessionDocument, Artifact
+from database import engine, SessionLocal, get_db, init_db, close_db
+from typing import List, Optional
+from file_processor import process_file, UploadTooLarge, EXTRACTOR_VERSION
 from utils.gen_titles import generate_snippet_title
 from pydantic import BaseModel
-from utils.llm_client import LLMClient
+from utils.llm_client import LLMClient, LLMException
+from utils.http_pool import HTTPClientPool
+from utils.history import HistoryBuilder
+from utils.summarizer import SessionCompactor
+from utils.persistence import ConversationWriter
+from utils.artifact_store import ArtifactStore, format_size
+from utils.history_search import HistorySearch
+from utils.extraction_cache import ExtractionCache, SHA256_RE
+from utils.documents import DocumentStore
+from utils.vector_index import VectorIndex
+from utils.semantic_search import SemanticIndexer
+from utils.pagination import encode_cursor, decode_cursor, fetch_keyset_page, InvalidCursor
 from utils.search import WebSearchEnhancer
+from utils.web_client import WebClient
+from utils.page_cache import PageCache
+from utils.search_cache import SearchCache
+from utils.search_triage import SnippetTriage
+from utils.extraction_pool import ExtractionPool
+from utils.streaming import StreamMode, coalesce, get_stream_mode, sse_event
 from model_manager import ModelManager
 from config import settings
 from utils.paths import ensure_path
+from contextlib import asynccontextmanager
 import logging
 import os
 
@@ -35,29 +53,195 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-# Configure CORS
+# Shared connection pool for all llama-server traffic
+http_pool = HTTPClientPool(
+    max_connections=settings.HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    http2=settings.HTTP_USE_HTTP2
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Validate configuration on startup and own shared resources"""
+    try:
+        settings.validate_paths()
+        logger.info(f"Using models directory: {settings.MODELS_DIR}")
+        logger.info(f"Using llama server: {settings.LLAMA_SERVER_PATH}")
+    except Exception as e:
+        logger.error(f"Configuration validation failed: {e}")
+        raise
+
+    await init_db()
+    await history_search.install(engine)
+    async with SessionLocal() as db:
+        await artifact_store.migrate_inline(db)
+    http_pool.get_client(settings.LLAMA_SERVER_URL)
+    await web_client.start()
+    await extraction_pool.start()
+    await compactor.start()
+    await conversation_writer.start()
+    await history_search.start()
+    await semantic_indexer.start()
+    try:
+        yield
+    finally:
+        await semantic_indexer.stop()
+        await history_search.stop()
+        await conversation_writer.stop()
+        await compactor.stop()
+        await extraction_pool.stop()
+        await web_client.close()
+        await search_cache.close()
+        page_cache.close()
+        await http_pool.aclose()
+        await close_db()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized uploads from Content-Length before the body is parsed"""
+    if request.url.path == "/upload":
+        length = request.headers.get("content-length")
+        # Allow some room for multipart framing around the file itself
+        if length and length.isdigit() and int(length) > settings.UPLOAD_MAX_BYTES + 64 * 1024:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File exceeds the {settings.UPLOAD_MAX_BYTES} byte upload limit"}
+            )
+    return await call_next(request)
+
+# Configure CORS (added last so it also wraps responses from the middleware above)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "ETag", "Content-Range", "Accept-Ranges"],
 )
 
-# Database setup
-engine = create_engine(settings.DATABASE_URL)
-Base.metadata.create_all(engine)
-SessionLocal = sessionmaker(bind=engine)
-
-llm_client = LLMClient()
-web_enhancer = WebSearchEnhancer(llm_client, max_tokens_per_chunk=600)
-model_manager = ModelManager()
+model_manager = ModelManager(http_pool=http_pool)
+# Background completions (summaries, compaction, search queries) borrow idle slots
+llm_client = LLMClient(
+    base_url=settings.LLAMA_SERVER_URL,
+    http_pool=http_pool,
+    default_context_window=settings.DEFAULT_CONTEXT_WINDOW,
+    token_cache_size=settings.TOKEN_CACHE_SIZE,
+    slots=model_manager.slots,
+    embedding_url=settings.LLAMA_EMBEDDING_URL
+)
+history_builder = HistoryBuilder(
+    llm_client,
+    prompt_budget=settings.HISTORY_PROMPT_BUDGET,
+    reserved_output_tokens=settings.HISTORY_RESERVED_OUTPUT_TOKENS
+)
+compactor = SessionCompactor(
+    llm_client,
+    SessionLocal,
+    trigger_tokens=settings.SUMMARY_TRIGGER_TOKENS,
+    keep_recent_turns=settings.SUMMARY_KEEP_RECENT_TURNS,
+    summary_max_tokens=settings.SUMMARY_MAX_TOKENS
+)
+def on_turn_complete(session_id: int):
+    """Hand finished turns to the background stages"""
+    compactor.schedule(session_id)
+    semantic_indexer.notify()
+
+conversation_writer = ConversationWriter(
+    SessionLocal,
+    checkpoint_chars=settings.CHECKPOINT_EVERY_CHARS,
+    checkpoint_seconds=settings.CHECKPOINT_EVERY_SECONDS,
+    batch_size=settings.DB_WRITE_BATCH_SIZE,
+    flush_interval=settings.DB_WRITE_FLUSH_INTERVAL,
+    on_turn_complete=on_turn_complete
+)
+# Shared session for all outbound web traffic (search and page fetches)
+web_client = WebClient(
+    max_connections=settings.WEB_MAX_CONNECTIONS,
+    max_connections_per_host=settings.WEB_MAX_CONNECTIONS_PER_HOST,
+    dns_cache_ttl=settings.WEB_DNS_CACHE_TTL,
+    keepalive_timeout=settings.WEB_KEEPALIVE_TIMEOUT,
+    timeout=settings.WEB_REQUEST_TIMEOUT,
+    max_bytes=settings.WEB_MAX_PAGE_BYTES,
+    allowed_types=settings.WEB_ALLOWED_CONTENT_TYPES,
+    read_timeout=settings.WEB_READ_TIMEOUT,
+    download_timeout=settings.WEB_DOWNLOAD_TIMEOUT
+)
+page_cache = PageCache(
+    settings.WEB_CACHE_PATH,
+    max_bytes=settings.WEB_CACHE_MAX_BYTES,
+    fresh_seconds=settings.WEB_CACHE_FRESH_SECONDS
+)
+search_cache = SearchCache(
+    settings.WEB_CACHE_PATH,
+    ttl=settings.SEARCH_CACHE_TTL,
+    stale_seconds=settings.SEARCH_CACHE_STALE_SECONDS,
+    negative_ttl=settings.SEARCH_CACHE_NEGATIVE_TTL
+)
+extraction_pool = ExtractionPool(
+    max_workers=settings.EXTRACTION_WORKERS,
+    timeout=settings.EXTRACTION_TIMEOUT,
+    max_pending=settings.EXTRACTION_MAX_PENDING
+)
+search_triage = SnippetTriage(
+    llm_client,
+    max_sources=settings.WEB_TRIAGE_MAX_SOURCES,
+    min_similarity=settings.WEB_TRIAGE_MIN_SIMILARITY,
+    use_embeddings=settings.WEB_TRIAGE_EMBEDDINGS
+)
+web_enhancer = WebSearchEnhancer(
+    llm_client,
+    max_tokens_per_chunk=600,
+    extraction_pool=extraction_pool,
+    max_concurrent_searches=settings.WEB_SEARCH_CONCURRENCY,
+    max_concurrent_fetches=settings.WEB_FETCH_CONCURRENCY,
+    # Sources summarized at once on borrowed idle slots; one slot stays free for chat
+    max_concurrent_summaries=settings.WEB_SUMMARY_CONCURRENCY or max(1, settings.LLAMA_SERVER_SLOTS - 1),
+    web_client=web_client,
+    page_cache=page_cache,
+    search_cache=search_cache,
+    triage=search_triage,
+    passage_chars=settings.WEB_PASSAGE_CHARS,
+    source_context_tokens=settings.WEB_SOURCE_CONTEXT_TOKENS,
+    passage_wait=settings.WEB_PASSAGE_WAIT_SECONDS
+)
+artifact_store = ArtifactStore()
+history_search = HistorySearch(SessionLocal)
+document_store = DocumentStore(
+    llm_client,
+    chunk_chars=settings.DOCUMENT_CHUNK_CHARS,
+    max_chunks=settings.DOCUMENT_MAX_CHUNKS,
+    context_tokens=settings.DOCUMENT_CONTEXT_TOKENS
+)
+extraction_cache = ExtractionCache(
+    settings.EXTRACTION_CACHE_DIR,
+    version=EXTRACTOR_VERSION,
+    max_bytes=settings.EXTRACTION_CACHE_MAX_BYTES
+)
+semantic_indexer = SemanticIndexer(
+    llm_client,
+    SessionLocal,
+    artifact_store,
+    VectorIndex(settings.SEMANTIC_INDEX_DIR, dtype=settings.SEMANTIC_INDEX_DTYPE),
+    current_model=lambda: model_manager.current_model,
+    batch_size=settings.EMBEDDING_BATCH_SIZE,
+    max_chars=settings.EMBEDDING_MAX_CHARS,
+    interval=settings.SEMANTIC_INDEX_INTERVAL
+)
 
 class ChatMessage(BaseModel):
     message: str
     session_id: Optional[int] = None
     settings: Optional[dict] = None
+    # Uploaded documents to answer from; they stay attached to the session
+    document_ids: Optional[List[int]] = None
+    # "latency", "smooth" or "bulk"; defaults to STREAM_MODE
+    stream_mode: Optional[str] = None
+
+def resolve_stream_mode(chat_message: ChatMessage) -> StreamMode:
+    return get_stream_mode(chat_message.stream_mode, settings.STREAM_MODE)
 
 class SessionCreate(BaseModel):
     title: str = "New Chat"
@@ -65,17 +249,6 @@ class SessionCreate(BaseModel):
 class SessionUpdate(BaseModel):
     title: str
 
-@app.on_event("startup")
-async def startup_event():
-    """Validate configuration on startup"""
-    try:
-        settings.validate_paths()
-        logger.info(f"Using models directory: {settings.MODELS_DIR}")
-        logger.info(f"Using llama server: {settings.LLAMA_SERVER_PATH}")
-    except Exception as e:
-        logger.error(f"Configuration validation failed: {e}")
-        raise
-
 @app.get("/models")
 async def get_models():
     """Get list of available models"""
@@ -88,7 +261,10 @@ async def get_models():
 async def load_model(model_id: str):
     """Load a specific model"""
     try:
-        return await model_manager.load_model(model_id)
+        loaded = await model_manager.load_model(model_id)
+        # New model: new context size and tokenizer
+        llm_client.reset_server_info()
+        return loaded
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -127,80 +303,183 @@ async def health_check():
             }
         )
 
+@app.get("/stats")
+async def get_stats():
+    """Runtime statistics for shared resources"""
+    return {
+        "http_pool": http_pool.get_stats(),
+        "web_client": web_client.get_stats(),
+        "web_cache": page_cache.get_stats(),
+        "search_cache": search_cache.get_stats(),
+        "search_triage": search_triage.get_stats(),
+        "tokens": llm_client.get_token_cache_stats(),
+        "slots": model_manager.slots.get_stats(),
+        "compaction": compactor.get_stats(),
+        "db_writer": conversation_writer.get_stats(),
+        "history_search": history_search.get_stats(),
+        "semantic_index": semantic_indexer.get_stats(),
+        "extraction_cache": extraction_cache.get_stats(),
+        "documents": document_store.get_stats(),
+        "extraction_pool": extraction_pool.get_stats()
+    }
+
 @app.post("/sessions")
-async def create_session():
-    db = SessionLocal()
+async def create_session(db: AsyncSession = Depends(get_db)):
     new_session = Session(title="New Chat")
     db.add(new_session)
-    db.commit()
-    db.refresh(new_session)
+    await db.commit()
     return {
         "id": new_session.id,
         "title": new_session.title,
         "created_at": new_session.created_at
     }
 
+def parse_cursors(before: Optional[str], after: Optional[str]):
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+    try:
+        return decode_cursor(before), decode_cursor(after)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def conversation_to_dict(conv: Conversation) -> dict:
+    return {
+        "id": conv.id,
+        "user_input": conv.user_input,
+        "ai_response": conv.ai_response,
+        "timestamp": conv.timestamp,
+        "status": conv.status
+    }
+
 @app.get("/sessions/{session_id}")
-async def get_session(session_id: int):
-    db = SessionLocal()
-    session = db.query(Session).filter(Session.id == session_id).first()
+async def get_session(
+    session_id: int,
+    limit: Optional[int] = Query(None, ge=1),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Session with a page of its history, newest page by default.
+
+    `before`/`after` take the cursors returned with a previous page.
+    With `stream=true` the whole history (or everything after `after`) is
+    streamed as NDJSON instead.
+    """
+    before_key, after_key = parse_cursors(before, after)
+    session = await db.get(Session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    conversations = db.query(Conversation).filter(
-        Conversation.session_id == session_id
-    ).order_by(Conversation.timestamp).all()
+    session_info = {
+        "id": session.id,
+        "title": session.title,
+        "created_at": session.created_at
+    }
+
+    if stream:
+        return StreamingResponse(
+            stream_history_ndjson(session_info, after_key),
+            media_type="application/x-ndjson"
+        )
+
+    limit = min(limit or settings.HISTORY_PAGE_SIZE, settings.MAX_PAGE_SIZE)
+    conversations, has_older, has_newer = await fetch_keyset_page(
+        db,
+        select(Conversation).where(Conversation.session_id == session_id),
+        (Conversation.timestamp, Conversation.id),
+        limit,
+        before=before_key,
+        after=after_key
+    )
+    conversations.reverse()  # Oldest first for display
 
     return {
-        "session": {
-            "id": session.id,
-            "title": session.title,
-            "created_at": session.created_at
-        },
-        "conversations": [{
-            "user_input": conv.user_input,
-            "ai_response": conv.ai_response,
-            "timestamp": conv.timestamp
-        } for conv in conversations]
+        "session": session_info,
+        "conversations": [conversation_to_dict(conv) for conv in conversations],
+        "cursors": {
+            "before": encode_cursor(conversations[0].timestamp, conversations[0].id) if conversations and has_older else None,
+            "after": encode_cursor(conversations[-1].timestamp, conversations[-1].id) if conversations and has_newer else None
+        }
     }
 
+async def stream_history_ndjson(session_info: dict, after_key=None, batch_size: int = 500):
+    """Yield a session header line, then every conversation oldest first, one JSON object per line."""
+    yield json.dumps({"session": session_info}, default=str) + "\n"
+
+    while True:
+        # Fresh short-lived session per batch so the connection is not held between writes
+        async with SessionLocal() as db:
+            query = select(Conversation).where(Conversation.session_id == session_info["id"])
+            if after_key is not None:
+                query = query.where(tuple_(Conversation.timestamp, Conversation.id) > tuple_(*after_key))
+            batch = (await db.scalars(
+                query.order_by(Conversation.timestamp, Conversation.id).limit(batch_size)
+            )).all()
+
+        for conv in batch:
+            yield json.dumps({"conversation": conversation_to_dict(conv)}, default=str) + "\n"
+        if len(batch) < batch_size:
+            break
+        after_key = (batch[-1].timestamp, batch[-1].id)
+
 @app.put("/sessions/{session_id}")
-async def update_session(session_id: int, session_update: SessionUpdate):
-    db = SessionLocal()
-    session = db.query(Session).filter(Session.id == session_id).first()
+async def update_session(session_id: int, session_update: SessionUpdate, db: AsyncSession = Depends(get_db)):
+    session = await db.get(Session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
     session.title = session_update.title
     session.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
     return {"message": "Session updated successfully"}
 
 @app.delete("/sessions/{session_id}")
-async def delete_session(session_id: int):
-    db = SessionLocal()
+async def delete_session(session_id: int, db: AsyncSession = Depends(get_db)):
+    session = await db.get(Session, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
     try:
-        # First delete associated conversations
-        db.query(Conversation).filter(Conversation.session_id == session_id).delete()
+        # First delete associated conversations and summary
+        await db.execute(delete(Conversation).where(Conversation.session_id == session_id))
+        await db.execute(delete(SessionSummary).where(SessionSummary.session_id == session_id))
+        await db.execute(delete(SessionDocument).where(SessionDocument.session_id == session_id))
 
         # Then delete the session
-        session = db.query(Session).filter(Session.id == session_id).first()
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-
-        db.delete(session)
-        db.commit()
+        await db.execute(delete(Session).where(Session.id == session_id))
+        await db.commit()
+        model_manager.slots.forget(session_id)
         return {"message": "Session deleted successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @app.get("/sessions")
-async def get_sessions():
-    db = SessionLocal()
-    sessions = db.query(Session).order_by(Session.updated_at.desc()).all()
+async def get_sessions(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Most recently updated sessions first; page with the X-Next-Cursor/X-Prev-Cursor headers."""
+    before_key, after_key = parse_cursors(before, after)
+    limit = min(limit or settings.SESSIONS_PAGE_SIZE, settings.MAX_PAGE_SIZE)
+
+    sessions, has_older, has_newer = await fetch_keyset_page(
+        db,
+        select(Session),
+        (Session.updated_at, Session.id),
+        limit,
+        before=before_key,
+        after=after_key
+    )
+    if sessions and has_older:
+        response.headers["X-Next-Cursor"] = encode_cursor(sessions[-1].updated_at, sessions[-1].id)
+    if sessions and has_newer:
+        response.headers["X-Prev-Cursor"] = encode_cursor(sessions[0].updated_at, sessions[0].id)
+
     return [{
         "id": session.id,
         "title": session.title,
@@ -208,15 +487,124 @@ async def get_sessions():
         "updated_at": session.updated_at
     } for session in sessions]
 
+@app.get("/search/history")
+async def search_history(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    session_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Ranked full-text search over past conversations and session titles"""
+    if not history_search.available:
+        raise HTTPException(status_code=503, detail="Full-text search is not available")
+    results = await history_search.search(db, q, limit=limit, offset=offset, session_id=session_id)
+    return {"query": q, **results}
+
+@app.get("/search/semantic")
+async def search_semantic(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    kind: Optional[str] = Query(None, pattern="^(conversation|artifact)$"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Nearest conversations and artifacts by embedding similarity"""
+    if not model_manager.current_model:
+        raise HTTPException(status_code=503, detail="Load a model to use semantic search")
+    try:
+        # Over-fetch a little: vectors of deleted rows stay in the index and are skipped here
+        hits = await semantic_indexer.search(q, limit=limit * 2, kind=kind)
+    except LLMException as e:
+        raise HTTPException(status_code=503, detail=e.message)
+
+    conversation_ids = [int(hit_id) for hit_kind, hit_id, _ in hits if hit_kind == "conversation"]
+    artifact_ids = [hit_id for hit_kind, hit_id, _ in hits if hit_kind == "artifact"]
+    conversations = {}
+    if conversation_ids:
+        rows = (await db.execute(
+            select(Conversation.id, Conversation.session_id, Conversation.user_input, Conversation.timestamp, Session.title)
+            .join(Session, Session.id == Conversation.session_id)
+            .where(Conversation.id.in_(conversation_ids))
+        )).all()
+        conversations = {row.id: row for row in rows}
+    artifacts = {}
+    if artifact_ids:
+        rows = (await db.scalars(select(Artifact).where(Artifact.id.in_(artifact_ids)))).all()
+        artifacts = {art.id: art for art in rows}
+
+    results = []
+    for hit_kind, hit_id, score in hits:
+        if hit_kind == "conversation" and int(hit_id) in conversations:
+            row = conversations[int(hit_id)]
+            results.append({
+                "kind": "conversation",
+                "id": row.id,
+                "session_id": row.session_id,
+                "title": row.title,
+                "user_input": row.user_input[:200],
+                "timestamp": row.timestamp,
+                "score": round(score, 4)
+            })
+        elif hit_kind == "artifact" and hit_id in artifacts:
+            art = artifacts[hit_id]
+            results.append({
+                "kind": "artifact",
+                "id": art.id,
+                "title": art.title,
+                "language": art.language,
+                "type_desc": art.type_desc,
+                "score": round(score, 4)
+            })
+        if len(results) == limit:
+            break
+    return {"query": q, "results": results}
+
+@app.get("/upload/{sha256}")
+async def get_cached_upload(sha256: str, filename: str = "", db: AsyncSession = Depends(get_db)):
+    """Extracted text for bytes the server has seen before; lets clients skip re-sending the file"""
+    if not SHA256_RE.match(sha256):
+        raise HTTPException(status_code=400, detail="Expected a lowercase hex SHA-256")
+
+    document = await document_store.get_by_hash(db, sha256)
+    if document:
+        content = await document_store.get_text(db, document.id)
+    else:
+        content = await asyncio.to_thread(extraction_cache.get, sha256)
+        if content is None:
+            raise HTTPException(status_code=404, detail="Not cached; upload the file")
+        document = await document_store.add(db, sha256, filename, content)
+
+    return {
+        "filename": filename,
+        "content": content,
+        "sha256": sha256,
+        "cached": True,
+        "document_id": document.id,
+        "chunks": document.chunk_count
+    }
+
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    content = await process_file(file)
-    if content is None:
-        raise HTTPException(status_code=400, detail="Could not process file")
+async def upload_file(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    try:
+        result = await process_file(
+            file,
+            settings.UPLOAD_MAX_BYTES,
+            settings.UPLOAD_SPOOL_MAX_SIZE,
+            cache=extraction_cache
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {e.max_bytes} byte upload limit")
+
+    # Text is chunked for retrieval so chats can reference it by id instead of pasting it
+    document = None
+    if result["kind"] in ("text", "document") and result["content"].strip():
+        document = await document_store.add(db, result["sha256"], file.filename, result["content"])
 
     return {
         "filename": file.filename,
-        "content": content
+        **result,
+        "document_id": document.id if document else None,
+        "chunks": document.chunk_count if document else 0
     }
 
 @app.post("/generate_title")
@@ -228,78 +616,111 @@ async def generate_title(request: TitleRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/artifacts")
-async def create_artifact(artifact_data: dict):
-    db = SessionLocal()
+async def create_artifact(artifact_data: dict, db: AsyncSession = Depends(get_db)):
     try:
+        content_hash, size_bytes = await artifact_store.put(db, artifact_data["content"])
         artifact = Artifact(
             id=artifact_data["id"],
-            content=artifact_data["content"],
+            content="",
             title=artifact_data["title"],
             type_desc=artifact_data["type_desc"],
             language=artifact_data["language"],
-            size=artifact_data["size"]
+            size=format_size(size_bytes),
+            content_hash=content_hash,
+            size_bytes=size_bytes
         )
         db.add(artifact)
-        db.commit()
-        return {"message": "Artifact saved successfully"}
+        await db.commit()
+        semantic_indexer.notify()
+        return {"message": "Artifact saved successfully", "content_hash": content_hash}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @app.get("/artifacts")
-async def get_artifacts():
-    db = SessionLocal()
+async def get_artifacts(db: AsyncSession = Depends(get_db)):
+    """Artifact metadata only; fetch bodies with GET /artifacts/{id}"""
+    artifacts = (await db.scalars(select(Artifact).order_by(Artifact.created_at.desc()))).all()
+    return [{
+        "id": art.id,
+        "title": art.title,
+        "type_desc": art.type_desc,
+        "language": art.language,
+        "size": art.size,
+        "size_bytes": art.size_bytes,
+        "content_hash": art.content_hash,
+        "created_at": art.created_at
+    } for art in artifacts]
+
+def parse_range(range_header: str, size: int):
+    """Parse a single 'bytes=start-end' range; returns (start, end) inclusive or None if unsatisfiable."""
     try:
-        artifacts = db.query(Artifact).order_by(Artifact.created_at.desc()).all()
-        return [{
-            "id": art.id,
-            "title": art.title,
-            "type_desc": art.type_desc,
-            "language": art.language,
-            "content": art.content,
-            "size": art.size
-        } for art in artifacts]
-    finally:
-        db.close()
+        unit, _, spec = range_header.partition("=")
+        if unit.strip() != "bytes" or "," in spec:
+            raise ValueError
+        start, _, end = spec.strip().partition("-")
+        if start:
+            start, end = int(start), int(end) if end else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start, end = max(size - int(end), 0), size - 1
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Range header")
+    if start > end or start >= size:
+        return None
+    return start, min(end, size - 1)
+
+@app.get("/artifacts/{artifact_id}")
+async def get_artifact_content(artifact_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Stream an artifact body with ETag and single-range support"""
+    artifact = await db.get(Artifact, artifact_id)
+    if not artifact or not artifact.content_hash:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    blob = await artifact_store.get_blob(db, artifact.content_hash)
+    if not blob:
+        raise HTTPException(status_code=404, detail="Artifact content not found")
+
+    etag = f'"{blob.hash}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=0"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    media_type = "text/plain; charset=utf-8"
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag and blob.size_bytes:
+        byte_range = parse_range(range_header, blob.size_bytes)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{blob.size_bytes}"})
+        start, end = byte_range
+        return StreamingResponse(
+            artifact_store.iter_content(blob, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers={
+                **headers,
+                "Content-Range": f"bytes {start}-{end}/{blob.size_bytes}",
+                "Content-Length": str(end - start + 1)
+            }
+        )
+
+    return StreamingResponse(
+        artifact_store.iter_content(blob),
+        media_type=media_type,
+        headers={**headers, "Content-Length": str(blob.size_bytes)}
+    )
+
+async def get_or_create_session_id(db: AsyncSession, session_id: Optional[int]) -> int:
+    if session_id:
+        return session_id
+    new_session = Session(title="New Chat")
+    db.add(new_session)
+    await db.commit()
+    return new_session.id
 
 @app.post("/chat")
-async def chat(chat_message: ChatMessage):
-    db = SessionLocal()
+async def chat(chat_message: ChatMessage, db: AsyncSession = Depends(get_db)):
     try:
-        session_id = chat_message.session_id
-        if not session_id:
-            title = chat_message.message[:30] + "..." if len(chat_message.message) > 30 else chat_message.message
-            new_session = Session(title="New Chat")
-            db.add(new_session)
-            db.commit()
-            db.refresh(new_session)
-            session_id = new_session.id
-
-        # Get conversation history for this session
-        previous_messages = db.query(Conversation).filter(
-            Conversation.session_id == session_id
-        ).order_by(Conversation.timestamp).all()
-
-        # Build the messages array with conversation history
-        messages = []
-
-        # Add system message to set the context and behavior
-        messages.append({
-            "role": "system",
-            "content": "You are a helpful AI assistant. Be concise and clear in your responses."
-        })
-
-        # Add previous conversations
-        for msg in previous_messages:
-            messages.extend([
-                {"role": "user", "content": msg.user_input},
-                {"role": "assistant", "content": msg.ai_response}
-            ])
-
-        # Add the current message
-        messages.append({"role": "user", "content": chat_message.message})
+        session_id = await get_or_create_session_id(db, chat_message.session_id)
 
         settings = chat_message.settings or {
             "model": "llama-3.2-3b-instruct",
@@ -308,129 +729,142 @@ async def chat(chat_message: ChatMessage):
             "stream": True
         }
 
-        async def stream_response():
-            collected_response = []
-            db_inner = SessionLocal()
-
-            try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    async with client.stream(
-                        "POST",
-                        "http://127.0.0.1:8080/v1/chat/completions",
-                        json={
-                            **settings,
-                            "messages": messages,
-                        },
-                        headers={"Content-Type": "application/json"}
-                    ) as response:
-                        async for line in response.aiter_lines():
-                            if line.strip():
-                                try:
-                                    if line.startswith("data: "):
-                                        line = line[6:]
-                                    if line == "[DONE]":
-                                        continue
-
-                                    json_line = json.loads(line)
-                                    if content := json_line.get('choices', [{}])[0].get('delta', {}).get('content'):
-                                        collected_response.append(content)
-                                        yield f"data: {json.dumps({'content': content})}\n\n"
-                                except json.JSONDecodeError:
-                                    continue
-
-                # Save complete conversation to database
-                complete_response = "".join(collected_response)
-                conversation = Conversation(
-                    session_id=session_id,
-                    user_input=chat_message.message,
-                    ai_response=complete_response
-                )
-                db_inner.add(conversation)
-
-                # Update session's updated_at
-                session = db_inner.query(Session).filter(Session.id == session_id).first()
-                if session:
-                    session.updated_at = datetime.utcnow()
-                db_inner.commit()
-            except Exception as e:
-                db_inner.rollback()
-                raise e
-            finally:
-                db_inner.close()
-
-        return StreamingResponse(
-            stream_response(),
-            media_type="text/event-stream"
+        # Older turns may already be folded into a rolling summary
+        summary = await db.get(SessionSummary, session_id)
+        high_water_mark = summary.last_conversation_id if summary else 0
+
+        system_prompt = "You are a helpful AI assistant. Be concise and clear in your responses."
+        if summary and summary.summary:
+            system_prompt += f"\n\nSummary of the earlier conversation:\n{summary.summary}"
+
+        # Only the document chunks relevant to this message, within their share of the budget.
+        # They go in the new user message; the system prompt and history stay a cacheable prefix.
+        user_message = chat_message.message
+        document_ids = await document_store.attach(db, session_id, chat_message.document_ids or [])
+        if document_ids:
+            prompt_budget = await history_builder.get_budget(settings.get("max_tokens"))
+            excerpts = await document_store.retrieve(
+                db,
+                document_ids,
+                chat_message.message,
+                document_store.context_budget(prompt_budget)
+            )
+            user_message = document_store.format_context(excerpts) + user_message
+
+        async def load_turns(before_id: Optional[int], limit: int):
+            query = select(Conversation).where(
+                Conversation.session_id == session_id,
+                Conversation.id > high_water_mark,
+                Conversation.status != "streaming"
+            )
+            if before_id is not None:
+                query = query.where(Conversation.id < before_id)
+            return (await db.scalars(query.order_by(Conversation.id.desc()).limit(limit))).all()
+
+        # Newest conversation history that fits the prompt budget
+        messages = await history_builder.build(
+            system_prompt=system_prompt,
+            user_message=user_message,
+            load_turns=load_turns,
+            max_output_tokens=settings.get("max_tokens")
         )
-
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
-@app.post("/chat/web")
-async def chat_with_web(chat_message: ChatMessage):
+    async def generate():
+        client = http_pool.get_client(llm_client.base_url)
+        # Same session, same slot: the server reuses the cached prompt prefix
+        with model_manager.slots.session_slot(session_id) as slot:
+            async with client.stream(
+                "POST",
+                "/v1/chat/completions",
+                json={
+                    **settings,
+                    "messages": messages,
+                    "id_slot": slot,
+                    "cache_prompt": True,
+                },
+                headers={"Content-Type": "application/json"},
+                timeout=30.0
+            ) as response:
+                async for line in response.aiter_lines():
+                    if line.strip():
+                        try:
+                            if line.startswith("data: "):
+                                line = line[6:]
+                            if line == "[DONE]":
+                                continue
+
+                            json_line = json.loads(line)
+                            if "timings" in json_line:
+                                model_manager.slots.record_timings(json_line["timings"])
+                            if content := json_line.get('choices', [{}])[0].get('delta', {}).get('content'):
+                                yield content
+                        except json.JSONDecodeError:
+                            continue
+
+    async def stream_response():
+        # Persisted behind the stream: inserted now, checkpointed while streaming
+        turn = conversation_writer.begin(session_id, chat_message.message)
+        status = "interrupted"
+
+        try:
+            # Tokens are merged into fewer, larger SSE frames
+            async for content in coalesce(generate(), resolve_stream_mode(chat_message)):
+                conversation_writer.append(turn, content)
+                yield sse_event(content)
+            status = "complete"
+        finally:
+            # Runs on client disconnect too, so partial responses are kept
+            conversation_writer.finish(turn, status)
+
+    return StreamingResponse(
+        stream_response(),
+        media_type="text/event-stream"
+    )
 
-    db = SessionLocal()
+@app.post("/chat/web")
+async def chat_with_web(chat_message: ChatMessage, db: AsyncSession = Depends(get_db)):
     try:
-        session_id = chat_message.session_id
-        if not session_id:
-            title = chat_message.message[:30] + "..." if len(chat_message.message) > 30 else chat_message.message
-            new_session = Session(title="New Chat")
-            db.add(new_session)
-            db.commit()
-            db.refresh(new_session)
-            session_id = new_session.id
-
-        async def stream_response():
-            collected_response = []
-            db_inner = SessionLocal()
-
-            try:
-                context = [
-                    {"role": "user", "content": msg.user_input}
-                    for msg in db_inner.query(Conversation).filter(
-                        Conversation.session_id == session_id
-                    ).order_by(Conversation.timestamp.desc()).limit(5)
-                ]
-
-                # Get the response generator
-                response_generator = web_enhancer.enhance_response(
-                    chat_message.message,
-                    context=context
-                )
-
-                # Iterate through the responses
-                async for chunk in response_generator:
-                    collected_response.append(chunk)
-                    yield f"data: {json.dumps({'content': chunk})}\n\n"
-                    await asyncio.sleep(0.01)  # Small delay for natural flow
-
-                # Save complete conversation to database
-                complete_response = "".join(collected_response)
-                conversation = Conversation(
-                    session_id=session_id,
-                    user_input=chat_message.message,
-                    ai_response=complete_response
-                )
-                db_inner.add(conversation)
-                db_inner.commit()
-
-            except Exception as e:
-                logger.error(f"Error in stream_response: {str(e)}")
-                db_inner.rollback()
-                yield f"data: {json.dumps({'content': f'Error: {str(e)}'})}\n\n"
-            finally:
-                db_inner.close()
-
-        return StreamingResponse(
-            stream_response(),
-            media_type="text/event-stream"
-        )
-
+        session_id = await get_or_create_session_id(db, chat_message.session_id)
+        context = [
+            {"role": "user", "content": msg.user_input}
+            for msg in (await db.scalars(
+                select(Conversation)
+                .where(Conversation.session_id == session_id)
+                .order_by(Conversation.timestamp.desc())
+                .limit(5)
+            )).all()
+        ]
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
+
+    async def stream_response():
+        turn = conversation_writer.begin(session_id, chat_message.message)
+        status = "interrupted"
+
+        try:
+            # Get the response generator
+            response_generator = web_enhancer.enhance_response(
+                chat_message.message,
+                context=context
+            )
+
+            # Iterate through the responses, merged into fewer, larger SSE frames
+            async for chunk in coalesce(response_generator, resolve_stream_mode(chat_message)):
+                conversation_writer.append(turn, chunk)
+                yield sse_event(chunk)
+            status = "complete"
+
+        except Exception as e:
+            logger.error(f"Error in stream_response: {str(e)}")
+            yield sse_event(f"Error: {str(e)}")
+        finally:
+            conversation_writer.finish(turn, status)
+
+    return StreamingResponse(
+        stream_response(),
+        media_type="text/event-stream"
+    )
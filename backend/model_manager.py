@@ -6,10 +6,19 @@ import asyncio
 import time
 from dataclasses import dataclass
 from config import settings
+from utils.http_pool import HTTPClientPool
+from utils.slots import SlotAffinity
 import logging
 
 logger = logging.getLogger(__name__)
 
+def physical_memory() -> int:
+    """Bytes of RAM on this host, 0 when the platform does not say."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return 0
+
 @dataclass
 class ModelInfo:
     name: str
@@ -20,18 +29,27 @@ class ModelInfo:
     description: str = ""
     parameters: str = ""
     context_length: int = 4096
+    kv_bytes_per_token: int = 0
     requirements: Dict = None
 
 class ModelManager:
-    def __init__(self):
+    def __init__(self, http_pool: Optional[HTTPClientPool] = None):
         self.models_dir = settings.MODELS_DIR
         self.models: Dict[str, ModelInfo] = {}
         self.current_model: Optional[str] = None
         self.llama_server_path = settings.LLAMA_SERVER_PATH
-        self.llama_server_url = f"http://{settings.LLAMA_SERVER_HOST}:{settings.LLAMA_SERVER_PORT}"
+        self.llama_server_url = settings.LLAMA_SERVER_URL
         self.llama_server_process = None
+        self.embedding_process = None
+        self.http_pool = http_pool or HTTPClientPool()
+        self.n_slots = max(1, settings.LLAMA_SERVER_SLOTS)
+        self.slots = SlotAffinity(self.n_slots)
         self.scan_models()
 
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self.http_pool.get_client(self.llama_server_url)
+
     def scan_models(self):
         """Scan the models directory for available models."""
         self.models.clear()
@@ -52,6 +70,7 @@ class ModelManager:
                         description=metadata.get('description', ''),
                         parameters=metadata.get('parameters', 'Unknown'),
                         context_length=metadata.get('context_length', 4096),
+                        kv_bytes_per_token=metadata.get('kv_bytes_per_token', 0),
                         requirements=metadata.get('requirements', {})
                     )
         except Exception as e:
@@ -77,6 +96,27 @@ class ModelManager:
             logger.error(f"Error loading model metadata: {str(e)}")
         return {}
 
+    def slots_for(self, model: ModelInfo) -> int:
+        """Configured slots, fewer if the weights plus one KV cache per slot would not fit in memory."""
+        memory = physical_memory()
+        if not memory:
+            return self.n_slots
+        kv_per_token = model.kv_bytes_per_token or settings.KV_CACHE_BYTES_PER_TOKEN
+        # The embedding server shares the mmapped weights but has its own KV cache
+        budget = (
+            memory * settings.LLAMA_MEMORY_FRACTION
+            - os.path.getsize(model.path)
+            - settings.EMBEDDING_CONTEXT_LENGTH * kv_per_token
+        )
+        per_slot = model.context_length * kv_per_token
+        fits = max(1, int(budget // per_slot)) if per_slot > 0 else self.n_slots
+        if fits < self.n_slots:
+            logger.warning(
+                f"Using {fits} of {self.n_slots} slots for {model.name}: "
+                f"{per_slot / 2**20:.0f} MiB of KV cache per slot, {memory / 2**30:.1f} GiB of memory"
+            )
+        return min(self.n_slots, fits)
+
     async def load_model(self, model_name: str) -> bool:
         """Load a model into the llama.cpp server."""
         if model_name not in self.models:
@@ -92,14 +132,17 @@ class ModelManager:
         try:
             # Build command with proper path handling
             model_path = self.models_dir / f"{model_name}.gguf"
+            # The context is split evenly across slots, so give each slot the model's full context.
+            # Continuous batching decodes all busy slots in one batch per step.
+            n_slots = self.slots_for(model)
             cmd = [
                 str(self.llama_server_path),
                 "-m", str(model_path),
-                "-c", str(model.context_length),
+                "-c", str(model.context_length * n_slots),
+                "--parallel", str(n_slots),
+                "--cont-batching",
                 "--host", settings.LLAMA_SERVER_HOST,
                 "--port", str(settings.LLAMA_SERVER_PORT),
-                "--embedding",  # Enable embedding API
-                "--port-emoji", str(settings.LLAMA_SERVER_PORT + 1),  # Additional port for emoji API
             ]
 
             logger.info(f"Starting llama.cpp server with command: {' '.join(cmd)}")
@@ -115,13 +158,15 @@ class ModelManager:
             start_time = time.time()
             while time.time() - start_time < 30:  # 30 second timeout
                 try:
-                    async with httpx.AsyncClient(timeout=2.0) as client:
-                        response = await client.get(f"{self.llama_server_url}/health")
-                        if response.status_code == 200:
-                            self.current_model = model_name
-                            model.loaded = True
-                            logger.info(f"Model {model_name} loaded successfully")
-                            return True
+                    response = await self.client.get("/health", timeout=2.0)
+                    if response.status_code == 200:
+                        self.current_model = model_name
+                        model.loaded = True
+                        self.slots.reset(n_slots)
+                        await self._start_embedding_server(model_path)
+                        logger.info(f"Model {model_name} loaded successfully")
+                        return True
+                    await asyncio.sleep(1)
                 except:
                     await asyncio.sleep(1)
                     continue
@@ -135,29 +180,66 @@ class ModelManager:
             await self.stop_model()
             return False
 
+    async def _start_embedding_server(self, model_path):
+        """Serve `/v1/embeddings` from a one-slot server so embedding never takes a chat slot.
+
+        Callers fall back (BM25 triage, a later indexing pass) until it is up.
+        """
+        context = str(settings.EMBEDDING_CONTEXT_LENGTH)
+        cmd = [
+            str(self.llama_server_path),
+            "-m", str(model_path),
+            "-c", context,
+            # Each input must fit in one physical batch
+            "-b", context,
+            "-ub", context,
+            "--parallel", "1",
+            "--embedding",
+            "--host", settings.LLAMA_SERVER_HOST,
+            "--port", str(settings.LLAMA_EMBEDDING_PORT),
+        ]
+        logger.info(f"Starting embedding server with command: {' '.join(cmd)}")
+        try:
+            self.embedding_process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+        except Exception as e:
+            logger.warning(f"Embedding server did not start, embeddings are unavailable: {str(e)}")
+
+    @staticmethod
+    async def _terminate(process):
+        # Try graceful shutdown first
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=5.0)
+        except asyncio.TimeoutError:
+            # Force kill if graceful shutdown takes too long
+            process.kill()
+            await process.wait()
+
     async def stop_model(self):
         """Stop the currently running model."""
-        if self.llama_server_process:
+        for attr in ("embedding_process", "llama_server_process"):
+            process = getattr(self, attr)
+            if process is None:
+                continue
             try:
-                # Try graceful shutdown first
-                self.llama_server_process.terminate()
-                try:
-                    await asyncio.wait_for(self.llama_server_process.wait(), timeout=5.0)
-                except asyncio.TimeoutError:
-                    # Force kill if graceful shutdown takes too long
-                    self.llama_server_process.kill()
-                    await self.llama_server_process.wait()
-
+                await self._terminate(process)
             except Exception as e:
                 logger.error(f"Error stopping model: {str(e)}")
             finally:
-                self.llama_server_process = None
+                setattr(self, attr, None)
 
         if self.current_model:
             if self.current_model in self.models:
                 self.models[self.current_model].loaded = False
             self.current_model = None
 
+        # Cached prefixes die with the server process
+        self.slots.reset()
+
     def get_available_models(self) -> List[Dict]:
         """Get list of available models and their status."""
         return [
@@ -178,39 +260,39 @@ class ModelManager:
         """Get current model status and information."""
         try:
             # Check if server is running and responding
-            async with httpx.AsyncClient(timeout=2.0) as client:
-                response = await client.get(f"{self.llama_server_url}/health")
-                if response.status_code == 200:
-                    # Try to get model info from the server
-                    try:
-                        model_info = await client.get(f"{self.llama_server_url}/v1/models")
-                        model_data = model_info.json()
-                        if model_data and "model" in model_data:
-                            # Update current_model if server reports it's loaded
-                            model_name = model_data["model"].split("/")[-1].replace(".gguf", "")
-                            self.current_model = model_name
-                            if model_name in self.models:
-                                self.models[model_name].loaded = True
-                    except:
-                        pass
-
-                    if self.current_model:
-                        model = self.models.get(self.current_model)
-                        return {
-                            "status": "running",
-                            "model": {
-                                "name": model.name,
-                                "size": model.size,
-                                "type": model.type,
-                                "description": model.description,
-                                "parameters": model.parameters,
-                                "context_length": model.context_length
-                            } if model else None
-                        }
+            client = self.client
+            response = await client.get("/health", timeout=2.0)
+            if response.status_code == 200:
+                # Try to get model info from the server
+                try:
+                    model_info = await client.get("/v1/models", timeout=2.0)
+                    model_data = model_info.json()
+                    if model_data and "model" in model_data:
+                        # Update current_model if server reports it's loaded
+                        model_name = model_data["model"].split("/")[-1].replace(".gguf", "")
+                        self.current_model = model_name
+                        if model_name in self.models:
+                            self.models[model_name].loaded = True
+                except:
+                    pass
+
+                if self.current_model:
+                    model = self.models.get(self.current_model)
                     return {
                         "status": "running",
-                        "model": None
+                        "model": {
+                            "name": model.name,
+                            "size": model.size,
+                            "type": model.type,
+                            "description": model.description,
+                            "parameters": model.parameters,
+                            "context_length": model.context_length
+                        } if model else None
                     }
+                return {
+                    "status": "running",
+                    "model": None
+                }
         except Exception as e:
             logger.debug(f"Error checking current model: {str(e)}")
 
@@ -228,21 +310,20 @@ class ModelManager:
         }
 
         try:
-            async with httpx.AsyncClient(timeout=2.0) as client:
-                response = await client.get(f"{self.llama_server_url}/health")
-                if response.status_code == 200:
-                    status["status"] = "running"
-                    if self.current_model:
-                        model = self.models.get(self.current_model)
-                        if model:
-                            status["current_model"] = {
-                                "name": model.name,
-                                "size": model.size,
-                                "type": model.type,
-                                "description": model.description,
-                                "parameters": model.parameters,
-                                "context_length": model.context_length
-                            }
+            response = await self.client.get("/health", timeout=2.0)
+            if response.status_code == 200:
+                status["status"] = "running"
+                if self.current_model:
+                    model = self.models.get(self.current_model)
+                    if model:
+                        status["current_model"] = {
+                            "name": model.name,
+                            "size": model.size,
+                            "type": model.type,
+                            "description": model.description,
+                            "parameters": model.parameters,
+                            "context_length": model.context_length
+                        }
         except Exception as e:
             logger.debug(f"Model status check failed: {str(e)}")
 
@@ -254,11 +335,10 @@ class ModelManager:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=2.0) as client:
-                response = await client.get(f"{self.llama_server_url}/v1/metrics")
-                if response.status_code == 200:
-                    data = response.json()
-                    return data.get("uptime", None)
+            response = await self.client.get("/v1/metrics", timeout=2.0)
+            if response.status_code == 200:
+                data = response.json()
+                return data.get("uptime", None)
         except:
             pass
 
@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import zlib
+from typing import Iterator, Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from db_models import Artifact, ArtifactBlob
+
+logger = logging.getLogger(__name__)
+
+def format_size(size: int) -> str:
+    """Human-readable byte size."""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+class ArtifactStore:
+    """Content-addressed, compressed storage for artifact bodies.
+
+    Bodies are keyed by the SHA-256 of their UTF-8 bytes, so saving the same
+    snippet twice stores it once. Artifact rows only keep metadata and the hash.
+    """
+
+    def __init__(self, compression_level: int = 6, chunk_size: int = 64 * 1024):
+        self.compression_level = compression_level
+        self.chunk_size = chunk_size
+
+    async def put(self, db, content: str) -> tuple:
+        """Store a body if it is new; returns (hash, size in bytes)."""
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        compressed = zlib.compress(data, self.compression_level)
+        # Concurrent saves of the same content race harmlessly
+        await db.execute(
+            insert(ArtifactBlob)
+            .values(
+                hash=digest,
+                data=compressed,
+                size_bytes=len(data),
+                compressed_bytes=len(compressed)
+            )
+            .on_conflict_do_nothing(index_elements=["hash"])
+        )
+        return digest, len(data)
+
+    async def get_blob(self, db, digest: str) -> Optional[ArtifactBlob]:
+        return await db.get(ArtifactBlob, digest)
+
+    def _iter_decompressed(self, data: bytes) -> Iterator[bytes]:
+        decompressor = zlib.decompressobj()
+        pending = data
+        while pending:
+            # max_length keeps each step bounded however well the data compressed
+            chunk = decompressor.decompress(pending, self.chunk_size)
+            pending = decompressor.unconsumed_tail
+            if chunk:
+                yield chunk
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+    def iter_content(self, blob: ArtifactBlob, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Decompress incrementally, yielding bytes [start, end] (inclusive)."""
+        end = blob.size_bytes - 1 if end is None else min(end, blob.size_bytes - 1)
+        position = 0
+        for chunk in self._iter_decompressed(blob.data):
+            chunk_start, position = position, position + len(chunk)
+            if position <= start:
+                continue
+            yield chunk[max(start - chunk_start, 0):end - chunk_start + 1]
+            if position > end:
+                return
+
+    async def migrate_inline(self, db) -> int:
+        """Move bodies still stored inline in artifacts.content into blobs."""
+        artifacts = (await db.scalars(
+            select(Artifact).where(Artifact.content_hash.is_(None))
+        )).all()
+        for artifact in artifacts:
+            artifact.content_hash, artifact.size_bytes = await self.put(db, artifact.content or "")
+            artifact.size = format_size(artifact.size_bytes)
+            artifact.content = ""
+        if artifacts:
+            await db.commit()
+            logger.info(f"Moved {len(artifacts)} artifacts into the content-addressed store")
+        return len(artifacts)
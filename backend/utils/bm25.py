@@ -0,0 +1,64 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Sequence
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having
+he her here hers him his how i if in into is it its itself just me more most my no nor not now of
+off on once only or other our ours out over own same she should so some such than that the their
+theirs them then there these they this those through to too under until up very was we were what
+when where which while who whom why will with would you your yours
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without common English stopwords."""
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of pre-tokenized passages."""
+
+    def __init__(self, passages: Sequence[Sequence[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lengths = [len(tokens) for tokens in passages]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        # Inverted index: term -> [(passage index, term frequency)]
+        self.postings: Dict[str, List[tuple]] = {}
+        for index, tokens in enumerate(passages):
+            for term, freq in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((index, freq))
+
+        n = len(self.lengths)
+        self.idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def scores(self, query_tokens: Sequence[str]) -> List[float]:
+        """Score of every passage for the query; only passages sharing a term are touched."""
+        scores = [0.0] * len(self.lengths)
+        if not self.avg_length:
+            return scores
+        for term in set(query_tokens):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for index, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / self.avg_length)
+                scores[index] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return scores
+
+    def top_k(self, query_tokens: Sequence[str], k: int) -> List[tuple]:
+        """(passage index, score) of the best k passages with a non-zero score."""
+        scores = self.scores(query_tokens)
+        ranked = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i])
+        return [(i, scores[i]) for i in ranked[:k]]
@@ -1,8 +1,11 @@
-from bs4 import BeautifulSoup, Tag, NavigableString
+import lxml.html
+from lxml import etree
+from lxml.html import soupparser
 import trafilatura
 from readability import Document
 import html2text
-from typing import Dict, Optional, TypedDict, Any
+from typing import Dict, List, Optional, TypedDict, Any
+import asyncio
 import re
 import json
 import logging
@@ -10,6 +13,49 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# lxml refuses str input that declares its own encoding (XHTML pages); the text is already decoded
+XML_DECLARATION_RE = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+UNWANTED_TAGS = ['script', 'style', 'nav', 'footer', 'iframe', 'ads', 'noscript']
+
+# Fallback containers for the main content, tried in order (CSS: main, article,
+# [role="main"], #content, .content, #main, .main)
+MAIN_CONTENT_XPATHS = [
+    '//main',
+    '//article',
+    '//*[@role="main"]',
+    '//*[@id="content"]',
+    '//*[contains(concat(" ", normalize-space(@class), " "), " content ")]',
+    '//*[@id="main"]',
+    '//*[contains(concat(" ", normalize-space(@class), " "), " main ")]',
+]
+
+META_TAGS = {
+    'description': ['description', 'og:description'],
+    'keywords': ['keywords'],
+    'author': ['author', 'og:author'],
+    'published_date': ['article:published_time', 'publishedDate'],
+    'modified_date': ['article:modified_time', 'lastModified'],
+}
+
+# Common mojibake from UTF-8 read as Windows-1252
+MOJIBAKE = {'â€™': "'", 'â€"': "—", 'â€œ': '"', 'â€': '"'}
+
+# One pass for all cleanup: whitespace and leftover entities collapse to a single
+# space, or disappear before punctuation; mojibake is mapped back
+CLEAN_RE = re.compile(
+    r'(?P<before_punct>(?:\s|&[a-zA-Z]+;)+(?=[,.!?]))'
+    r'|(?P<space>(?:\s|&[a-zA-Z]+;)+)'
+    r'|(?P<mojibake>â€[™"œ]?)'
+)
+
+def _clean_match(match: re.Match) -> str:
+    if match.lastgroup == 'before_punct':
+        return ''
+    if match.lastgroup == 'space':
+        return ' '
+    return MOJIBAKE[match.group()]
+
 class ContentMetadata(TypedDict):
     description: Optional[str]
     keywords: Optional[str]
@@ -34,20 +80,31 @@ class ContentExtractor:
         self.h2t.ignore_tables = False
 
     async def extract_content(self, html: str, url: str) -> ExtractedContent:
-        """Extract clean, structured content from HTML"""
+        """Extract clean, structured content from HTML without blocking the event loop"""
+        return await asyncio.to_thread(self.extract, html, url)
+
+    def extract(self, html: str, url: str) -> ExtractedContent:
+        """Extract clean, structured content from HTML (CPU-bound; run it in a worker)
+
+        The page is parsed once with lxml and that tree is shared by every step;
+        trafilatura works on its own copy of it. Readability and the container
+        fallbacks only run when trafilatura finds nothing.
+        """
         try:
-            # Create soup object
-            soup = BeautifulSoup(html, 'html.parser')
+            html = XML_DECLARATION_RE.sub('', html, count=1)
+            tree = self._parse(html, url)
+
+            # Metadata first: JSON-LD lives in <script> tags that are removed below
+            metadata = self._extract_metadata(tree)
 
             # Remove unwanted elements
-            for element in soup.find_all(['script', 'style', 'nav', 'footer', 'iframe', 'ads', 'noscript']):
-                element.decompose()
+            etree.strip_elements(tree, *UNWANTED_TAGS, with_tail=False)
 
             content: ExtractedContent = {
-                'title': self._extract_title(soup),
-                'main_content': await self._extract_main_content(soup, html),
-                'metadata': self._extract_metadata(soup),
-                'summary': await self._generate_summary(soup),
+                'title': self._extract_title(tree),
+                'main_content': self._extract_main_content(tree, html),
+                'metadata': metadata,
+                'summary': self._generate_summary(tree),
                 'timestamp': datetime.utcnow().isoformat(),
                 'url': url
             }
@@ -72,31 +129,32 @@ class ContentExtractor:
                 'url': url
             }
 
-    def _extract_title(self, soup: BeautifulSoup) -> str:
+    @staticmethod
+    def _parse(html: str, url: str):
+        try:
+            return lxml.html.document_fromstring(html)
+        except (ValueError, etree.ParserError) as e:
+            # Fall back to BeautifulSoup's more forgiving parser, building the same lxml tree
+            logger.warning(f"lxml could not parse {url}, using BeautifulSoup: {str(e)}")
+            return soupparser.fromstring(html)
+
+    @staticmethod
+    def _first_text(tree, xpath: str) -> str:
+        found = tree.xpath(xpath)
+        return found[0].text_content().strip() if found else ''
+
+    def _extract_title(self, tree) -> str:
         """Extract page title with fallbacks"""
-        # Try meta title first
-        meta_title = soup.find('meta', property='og:title')
-        if meta_title and isinstance(meta_title, Tag):  # Type check
-            content = meta_title.get('content')
-            if content:
-                return content.strip()
-
-        # Try regular title tag
-        title_tag = soup.find('title')
-        if title_tag:
-            return title_tag.text.strip()
-
-        # Try h1 tag
-        h1_tag = soup.find('h1')
-        if h1_tag:
-            return h1_tag.text.strip()
-
-        return ''
+        # Try meta title first, then the title tag, then the first h1
+        og_title = tree.xpath('//meta[@property="og:title"]/@content')
+        if og_title and og_title[0].strip():
+            return og_title[0].strip()
+        return self._first_text(tree, '//title') or self._first_text(tree, '//h1')
 
-    async def _extract_main_content(self, soup: BeautifulSoup, html: str) -> str:
+    def _extract_main_content(self, tree, html: str) -> str:
         """Extract main content using multiple methods"""
-        # Try trafilatura first (usually best results)
-        extracted = trafilatura.extract(html, include_tables=True, include_links=True)
+        # Try trafilatura first (usually best results); it copies the tree instead of re-parsing
+        extracted = trafilatura.extract(tree, include_tables=True, include_links=True)
         if extracted:
             return self._clean_text(extracted)
 
@@ -110,24 +168,19 @@ class ContentExtractor:
             logger.warning(f"Readability extraction failed: {str(e)}")
 
         # Last resort: find main content area
-        main_tags = ['main', 'article', '[role="main"]', '#content', '.content', '#main', '.main']
-        for tag in main_tags:
-            main_content = soup.select_one(tag)
-            if main_content and isinstance(main_content, Tag):  # Type check
-                return self._clean_text(self.h2t.handle(str(main_content)))
+        for xpath in MAIN_CONTENT_XPATHS:
+            found = tree.xpath(xpath)
+            if found:
+                return self._clean_text(self.h2t.handle(lxml.html.tostring(found[0], encoding='unicode')))
 
         # If all else fails, get all paragraphs
-        paragraphs = soup.find_all('p')
+        paragraphs = tree.xpath('//p')
         if paragraphs:
-            texts = []
-            for p in paragraphs:
-                if isinstance(p, Tag):  # Type check
-                    texts.append(p.text)
-            return self._clean_text(' '.join(texts))
+            return self._clean_text(' '.join(p.text_content() for p in paragraphs))
 
         return ''
 
-    def _extract_metadata(self, soup: BeautifulSoup) -> ContentMetadata:
+    def _extract_metadata(self, tree) -> ContentMetadata:
         """Extract metadata from page"""
         metadata: ContentMetadata = {
             'description': None,
@@ -138,73 +191,45 @@ class ContentExtractor:
             'structured_data': None
         }
 
-        # Extract meta tags
-        meta_tags = {
-            'description': ['description', 'og:description'],
-            'keywords': ['keywords'],
-            'author': ['author', 'og:author'],
-            'published_date': ['article:published_time', 'publishedDate'],
-            'modified_date': ['article:modified_time', 'lastModified'],
-        }
-
-        for key, meta_names in meta_tags.items():
+        # Index meta tags once instead of searching the tree per name
+        meta_content: Dict[str, str] = {}
+        for meta in tree.iter('meta'):
+            content = meta.get('content')
+            if not content:
+                continue
+            for attribute in ('name', 'property'):
+                key = meta.get(attribute)
+                if key and key not in meta_content:
+                    meta_content[key] = content
+
+        for key, meta_names in META_TAGS.items():
             for name in meta_names:
-                meta = soup.find('meta', attrs={'name': name}) or soup.find('meta', attrs={'property': name})
-                if meta and isinstance(meta, Tag):  # Type check
-                    content = meta.get('content')
-                    if content:
-                        metadata[key] = content
-                        break
+                if name in meta_content:
+                    metadata[key] = meta_content[name]
+                    break
 
         # Extract structured data
-        for script in soup.find_all('script', type='application/ld+json'):
-            if isinstance(script, Tag):  # Type check
-                try:
-                    if script.string:
-                        data = json.loads(script.string)
-                        metadata['structured_data'] = data
-                        break
-                except:
-                    continue
+        for script in tree.xpath('//script[@type="application/ld+json"]'):
+            try:
+                if script.text:
+                    metadata['structured_data'] = json.loads(script.text)
+                    break
+            except ValueError:
+                continue
 
         return metadata
 
-    async def _generate_summary(self, soup: BeautifulSoup) -> str:
+    def _generate_summary(self, tree) -> str:
         """Generate a brief summary of the content"""
-        # Get the first few paragraphs
-        paragraphs = soup.find_all('p')
+        # Combine the first few paragraphs (up to 3)
+        paragraphs: List = tree.xpath('(//p)[position() <= 3]')
         if not paragraphs:
             return ''
-
-        # Combine first few paragraphs (up to 3)
-        texts = []
-        for p in paragraphs[:3]:
-            if isinstance(p, Tag):  # Type check
-                texts.append(p.text.strip())
-        summary_text = ' '.join(texts)
+        summary_text = ' '.join(p.text_content().strip() for p in paragraphs)
         return self._clean_text(summary_text)[:1000]  # Limit 1000 characters
 
     def _clean_text(self, text: str) -> str:
-        """Clean extracted text"""
+        """Clean extracted text in a single precompiled pass"""
         if not text:
             return ''
-
-        # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text)
-
-        # Remove duplicate newlines
-        text = re.sub(r'\n\s*\n', '\n\n', text)
-
-        # Fix common encoding issues
-        text = text.replace('â€™', "'")
-        text = text.replace('â€"', "—")
-        text = text.replace('â€œ', '"')
-        text = text.replace('â€', '"')
-
-        # Remove any remaining HTML entities
-        text = re.sub(r'&[a-zA-Z]+;', ' ', text)
-
-        # Clean up spaces around punctuation
-        text = re.sub(r'\s+([,.!?])', r'\1', text)
-
-        return text.strip()
+        return CLEAN_RE.sub(_clean_match, text).strip()
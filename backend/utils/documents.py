@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import re
+from typing import Dict, List, Optional, Sequence
+from cachetools import LRUCache
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+
+from db_models import Document, DocumentChunk, SessionDocument
+from .bm25 import BM25Index, tokenize
+
+logger = logging.getLogger(__name__)
+
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+def _split_long(text: str, chunk_chars: int) -> List[str]:
+    """Split an over-long paragraph at sentence ends, then at whitespace."""
+    pieces = []
+    for sentence in SENTENCE_RE.split(text):
+        while len(sentence) > chunk_chars:
+            cut = sentence.rfind(" ", 0, chunk_chars)
+            cut = cut if cut > chunk_chars // 2 else chunk_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            pieces.append(sentence)
+    return pieces
+
+def chunk_text(text: str, chunk_chars: int = 1200) -> List[str]:
+    """Pack paragraphs into chunks of at most `chunk_chars` characters."""
+    chunks: List[str] = []
+    current: List[str] = []
+    length = 0
+    for paragraph in PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pieces = [paragraph] if len(paragraph) <= chunk_chars else _split_long(paragraph, chunk_chars)
+        for piece in pieces:
+            if current and length + len(piece) + 2 > chunk_chars:
+                chunks.append("\n\n".join(current))
+                current, length = [], 0
+            current.append(piece)
+            length += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+class DocumentStore:
+    """Uploaded documents split into chunks, retrieved per question with BM25.
+
+    Only the chunks most relevant to the message, packed into a token budget,
+    go into the prompt, instead of the whole extracted text. BM25 indexes are
+    built on first use and kept in an LRU cache; documents never change once
+    stored, so cached indexes never go stale.
+    """
+
+    def __init__(
+        self,
+        llm_client,
+        chunk_chars: int = 1200,
+        max_chunks: int = 12,
+        context_tokens: int = 0,
+        index_cache_size: int = 32
+    ):
+        self.llm_client = llm_client
+        self.chunk_chars = chunk_chars
+        self.max_chunks = max_chunks
+        self.context_tokens = context_tokens  # 0 = half of the prompt budget
+        self.indexes = LRUCache(maxsize=index_cache_size)
+
+        # Metrics
+        self.retrievals = 0
+        self.chunks_retrieved = 0
+
+    async def get_by_hash(self, db, sha256: str) -> Optional[Document]:
+        return await db.scalar(select(Document).where(Document.sha256 == sha256))
+
+    async def add(self, db, sha256: str, filename: str, text: str) -> Document:
+        """Store and chunk a document; the same bytes are only stored once."""
+        document = await self.get_by_hash(db, sha256)
+        if document:
+            return document
+
+        chunks = chunk_text(text, self.chunk_chars)
+        document = Document(
+            sha256=sha256,
+            filename=filename,
+            size_chars=len(text),
+            chunk_count=len(chunks),
+            chunks=[DocumentChunk(position=i, text=chunk) for i, chunk in enumerate(chunks)]
+        )
+        db.add(document)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Stored by a concurrent upload of the same file
+            await db.rollback()
+            document = await self.get_by_hash(db, sha256)
+        return document
+
+    async def get_text(self, db, document_id: int) -> str:
+        chunks = (await db.scalars(
+            select(DocumentChunk.text)
+            .where(DocumentChunk.document_id == document_id)
+            .order_by(DocumentChunk.position)
+        )).all()
+        return "\n\n".join(chunks)
+
+    async def attach(self, db, session_id: int, document_ids: Sequence[int]) -> List[int]:
+        """Attach documents to a session and return every document the session has."""
+        if document_ids:
+            existing = (await db.scalars(select(Document.id).where(Document.id.in_(document_ids)))).all()
+            if existing:
+                await db.execute(
+                    insert(SessionDocument)
+                    .values([{"session_id": session_id, "document_id": doc_id} for doc_id in existing])
+                    .on_conflict_do_nothing()
+                )
+                await db.commit()
+        return list((await db.scalars(
+            select(SessionDocument.document_id)
+            .where(SessionDocument.session_id == session_id)
+            .order_by(SessionDocument.document_id)
+        )).all())
+
+    async def _get_index(self, db, document_id: int):
+        cached = self.indexes.get(document_id)
+        if cached is None:
+            document = await db.get(Document, document_id)
+            if not document:
+                return None
+            chunks = (await db.scalars(
+                select(DocumentChunk.text)
+                .where(DocumentChunk.document_id == document_id)
+                .order_by(DocumentChunk.position)
+            )).all()
+            index = await asyncio.to_thread(BM25Index, [tokenize(chunk) for chunk in chunks])
+            cached = (document.filename, list(chunks), index)
+            self.indexes[document_id] = cached
+        return cached
+
+    def context_budget(self, prompt_budget: int) -> int:
+        return min(self.context_tokens, prompt_budget) if self.context_tokens else prompt_budget // 2
+
+    async def retrieve(self, db, document_ids: Sequence[int], query: str, token_budget: int) -> List[Dict]:
+        """Best-matching chunks that fit the budget, returned in document order.
+
+        Chunks that share no terms with the question rank after every match, in
+        document order, so broad requests ("summarize this") still get the start.
+        """
+        query_tokens = tokenize(query)
+        candidates = []
+        for doc_rank, document_id in enumerate(document_ids):
+            entry = await self._get_index(db, document_id)
+            if not entry:
+                continue
+            filename, chunks, index = entry
+            scores = index.scores(query_tokens)
+            candidates.extend(
+                (-scores[position], doc_rank, position, document_id, filename, chunks[position])
+                for position in range(len(chunks))
+            )
+        candidates.sort()
+
+        # Count tokens for the leading candidates only; they are all that can fit
+        leading = candidates[:self.max_chunks * 3]
+        counts = await asyncio.gather(*[self.llm_client.count_tokens(c[5]) for c in leading])
+
+        selected = []
+        used = 0
+        for candidate, tokens in zip(leading, counts):
+            if used + tokens > token_budget:
+                continue
+            used += tokens
+            selected.append(candidate)
+            if len(selected) >= self.max_chunks:
+                break
+
+        selected.sort(key=lambda c: (c[1], c[2]))
+        self.retrievals += 1
+        self.chunks_retrieved += len(selected)
+        logger.debug(f"Retrieved {len(selected)} document chunks, {used}/{token_budget} tokens")
+        return [
+            {"document_id": c[3], "filename": c[4], "position": c[2], "score": -c[0], "text": c[5]}
+            for c in selected
+        ]
+
+    @staticmethod
+    def format_context(excerpts: List[Dict]) -> str:
+        """Excerpts to put in front of the new user message.
+
+        They change with every question, so they go after the system prompt and
+        history; that prefix then stays the same and the server's prompt cache hits.
+        """
+        if not excerpts:
+            return ""
+        parts = [f"[{e['filename']}, part {e['position'] + 1}]\n{e['text']}" for e in excerpts]
+        return "Excerpts from the attached documents:\n\n" + "\n\n".join(parts) + "\n\nQuestion:\n"
+
+    def get_stats(self):
+        return {
+            "cached_indexes": len(self.indexes),
+            "retrievals": self.retrievals,
+            "chunks_retrieved": self.chunks_retrieved
+        }
@@ -0,0 +1,109 @@
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+class ExtractionCache:
+    """Disk-backed cache of extracted upload text, keyed by content hash and extractor version.
+
+    Entries are zlib-compressed files named `<sha256>-v<version>.z`, so bumping
+    the extractor version simply stops matching old entries, which then age
+    out. Recency lives in an in-memory LRU rebuilt from file mtimes at
+    startup; the oldest entries are evicted once the total size passes
+    `max_bytes`.
+    """
+
+    def __init__(self, directory: Path, version: str, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.version = version
+        self.max_bytes = max_bytes
+        self.entries: Optional[OrderedDict] = None  # file name -> size, oldest first
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self) -> OrderedDict:
+        if self.entries is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            files = sorted(
+                (entry for entry in os.scandir(self.directory) if entry.name.endswith(".z")),
+                key=lambda entry: entry.stat().st_mtime
+            )
+            self.entries = OrderedDict((entry.name, entry.stat().st_size) for entry in files)
+            self.total_bytes = sum(self.entries.values())
+        return self.entries
+
+    def _name(self, digest: str) -> str:
+        return f"{digest}-v{self.version}.z"
+
+    def get(self, digest: str) -> Optional[str]:
+        if not SHA256_RE.match(digest):
+            return None
+        name = self._name(digest)
+        with self._lock:
+            entries = self._load()
+            if name not in entries:
+                self.misses += 1
+                return None
+            entries.move_to_end(name)
+        path = self.directory / name
+        try:
+            text = zlib.decompress(path.read_bytes()).decode("utf-8")
+            os.utime(path)  # Keeps LRU order across restarts
+        except (OSError, zlib.error, UnicodeDecodeError) as e:
+            logger.warning(f"Dropping unreadable extraction cache entry {name}: {str(e)}")
+            self._remove(name)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text
+
+    def put(self, digest: str, text: str):
+        name = self._name(digest)
+        data = zlib.compress(text.encode("utf-8"))
+        tmp = self.directory / f"{name}.{threading.get_ident()}.tmp"
+        with self._lock:
+            entries = self._load()
+            tmp.write_bytes(data)
+            os.replace(tmp, self.directory / name)
+            self.total_bytes += len(data) - entries.pop(name, 0)
+            entries[name] = len(data)
+            while self.total_bytes > self.max_bytes and len(entries) > 1:
+                oldest, size = entries.popitem(last=False)
+                (self.directory / oldest).unlink(missing_ok=True)
+                self.total_bytes -= size
+                self.evictions += 1
+
+    def _remove(self, name: str):
+        with self._lock:
+            size = self._load().pop(name, None)
+            if size is not None:
+                self.total_bytes -= size
+            (self.directory / name).unlink(missing_ok=True)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            entries = self._load()
+        total = self.hits + self.misses
+        return {
+            "entries": len(entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+            "extractor_version": self.version
+        }
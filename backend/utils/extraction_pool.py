@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from .content_extractor import ContentExtractor, ExtractedContent
+
+logger = logging.getLogger(__name__)
+
+# One extractor per worker process, created by the initializer
+_worker_extractor: Optional[ContentExtractor] = None
+
+def _init_worker():
+    """Import the parsing libraries and build the extractor once per worker."""
+    global _worker_extractor
+    # Ctrl+C reaches the whole process group; shutdown is driven by the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_extractor = ContentExtractor()
+
+def _ping() -> bool:
+    return _worker_extractor is not None
+
+def _extract(html: str, url: str) -> ExtractedContent:
+    return _worker_extractor.extract(html, url)
+
+class ExtractionPool:
+    """Runs HTML extraction in a bounded pool of warm worker processes.
+
+    Parsing with lxml, trafilatura and readability is CPU-bound, so it
+    runs outside the event loop and outside the GIL. At most `max_pending`
+    pages wait for a worker; beyond that, pages are skipped rather than
+    queued without bound. A page that exceeds `timeout` is abandoned and
+    its pool is replaced, since a running task cannot be cancelled inside
+    a worker process; the other pages in flight or queued on the old pool
+    are resubmitted to the new one.
+    """
+
+    def __init__(self, max_workers: int = 2, timeout: float = 10.0, max_pending: int = 32):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.executor: Optional[ProcessPoolExecutor] = None
+        # Keeps a small backlog at the workers; the rest waits here, where it is measurable
+        self.slots = asyncio.Semaphore(max(1, max_workers) * 2)
+
+        # Metrics
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.resubmitted = 0
+        self.total_seconds = 0.0
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: never fork a process that is running an event loop and threads
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+
+    async def start(self):
+        """Start the workers and wait until each has its libraries loaded."""
+        if self.max_workers <= 0 or self.executor is not None:
+            return
+        self.executor = self._create_executor()
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*[
+                loop.run_in_executor(self.executor, _ping) for _ in range(self.max_workers)
+            ])
+            logger.info(f"Extraction pool ready with {self.max_workers} workers")
+        except Exception as e:
+            logger.error(f"Extraction pool failed to start, extracting in threads instead: {str(e)}")
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def stop(self):
+        if self.executor:
+            executor, self.executor = self.executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    def _restart(self):
+        """Replace the pool, killing workers that are stuck on a page."""
+        executor, self.executor = self.executor, self._create_executor()
+        self.restarts += 1
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.kill()
+
+    async def _run_in_pool(self, html: str, url: str) -> Optional[ExtractedContent]:
+        """Run one page in the pool, once more if a sibling's timeout replaced the pool under it."""
+        for attempt in range(2):
+            executor = self.executor
+            if executor is None:
+                raise RuntimeError("extraction pool stopped")
+            future = asyncio.get_running_loop().run_in_executor(executor, _extract, html, url)
+            try:
+                # Shielded, so cancelling this task is told apart from the pool cancelling the job
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                future.cancel()
+                if executor is self.executor:
+                    self._restart()
+                raise
+            except (asyncio.CancelledError, BrokenProcessPool):
+                innocent = future.cancelled() or (future.done() and isinstance(future.exception(), BrokenProcessPool))
+                if not innocent:
+                    # This task itself was cancelled
+                    future.cancel()
+                    raise
+                if executor is self.executor or attempt:
+                    raise RuntimeError("worker pool failed")
+                self.resubmitted += 1
+                logger.info(f"Extraction pool was replaced, resubmitting {url}")
+
+    async def extract(self, html: str, url: str) -> Optional[ExtractedContent]:
+        """Extract a page in a worker; None if it timed out, failed or the queue is full."""
+        if self.waiting >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"Extraction queue full, skipping {url}")
+            return None
+
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        start = time.monotonic()
+        try:
+            if self.executor is None:
+                # No pool (disabled or failed to start): keep the loop free with a thread
+                return await asyncio.wait_for(
+                    asyncio.to_thread(ContentExtractor().extract, html, url), self.timeout
+                )
+            return await self._run_in_pool(html, url)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Extraction timed out after {self.timeout}s: {url}")
+            return None
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Extraction failed for {url}: {str(e)}")
+            return None
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.total_seconds += time.monotonic() - start
+            self.slots.release()
+
+    def get_stats(self) -> Dict:
+        return {
+            "workers": self.max_workers if self.executor else 0,
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "resubmitted": self.resubmitted,
+            "avg_seconds": round(self.total_seconds / self.completed, 3) if self.completed else 0.0
+        }
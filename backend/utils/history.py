@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Loads up to `limit` turns older than `before_id` (None = newest), newest first.
+TurnLoader = Callable[[Optional[int], int], Awaitable[Sequence]]
+
+class HistoryBuilder:
+    """Builds the chat messages for a turn, fitting the newest history into a token budget."""
+
+    def __init__(
+        self,
+        llm_client,
+        prompt_budget: int = 0,
+        reserved_output_tokens: int = 1024,
+        message_overhead: int = 8,
+        page_size: int = 20
+    ):
+        self.llm_client = llm_client
+        self.prompt_budget = prompt_budget  # 0 = derive from the server's context window
+        self.reserved_output_tokens = reserved_output_tokens
+        self.message_overhead = message_overhead  # Chat template tokens per message
+        self.page_size = page_size
+
+    async def get_budget(self, max_output_tokens: Optional[int] = None) -> int:
+        """Prompt tokens available once room for the response is reserved."""
+        n_ctx = await self.llm_client.get_context_window()
+        available = n_ctx - (max_output_tokens or self.reserved_output_tokens)
+        if self.prompt_budget:
+            available = min(available, self.prompt_budget)
+        return max(available, 0)
+
+    async def count_message(self, content: str) -> int:
+        return await self.llm_client.count_tokens(content) + self.message_overhead
+
+    async def build(
+        self,
+        system_prompt: str,
+        user_message: str,
+        load_turns: TurnLoader,
+        max_output_tokens: Optional[int] = None
+    ) -> List[Dict[str, str]]:
+        """Return system prompt, as many recent turns as fit, and the new user message."""
+        budget = await self.get_budget(max_output_tokens)
+        used = await self.count_message(system_prompt) + await self.count_message(user_message)
+        if used > budget:
+            logger.warning(f"Prompt without history already uses {used} of {budget} tokens")
+
+        selected = []
+        before_id = None
+        exhausted = False
+        while not exhausted:
+            turns = await load_turns(before_id, self.page_size)
+            if not turns:
+                break
+            before_id = turns[-1].id
+
+            # Count a page of turns concurrently; repeated texts hit the token cache
+            counts = await asyncio.gather(*[
+                asyncio.gather(self.count_message(turn.user_input), self.count_message(turn.ai_response))
+                for turn in turns
+            ])
+            for turn, (user_tokens, ai_tokens) in zip(turns, counts):
+                turn_tokens = user_tokens + ai_tokens
+                if used + turn_tokens > budget:
+                    exhausted = True
+                    break
+                used += turn_tokens
+                selected.append(turn)
+
+            if len(turns) < self.page_size:
+                break
+
+        logger.debug(f"History: {len(selected)} turns, {used}/{budget} prompt tokens")
+
+        messages = [{"role": "system", "content": system_prompt}]
+        for turn in reversed(selected):
+            messages.extend([
+                {"role": "user", "content": turn.user_input},
+                {"role": "assistant", "content": turn.ai_response}
+            ])
+        messages.append({"role": "user", "content": user_message})
+        return messages
@@ -0,0 +1,252 @@
+import asyncio
+import html
+import logging
+import re
+from typing import Dict, List, Optional
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# External-content FTS5 tables: the index stores tokens only, the text stays in the base tables.
+# Conversations are indexed once they stop streaming, so write-behind checkpoints
+# do not re-index a growing response over and over.
+# Rows the backfill job has not reached yet are left to it, so the triggers
+# never delete or re-add an entry the index does not hold yet.
+NOT_PENDING = (
+    "NOT EXISTS (SELECT 1 FROM search_backfill WHERE name = '{name}' "
+    "AND {row}.id >= next_id AND {row}.id <= upto_id)"
+)
+
+def _pending_guard(name: str, row: str) -> str:
+    return NOT_PENDING.format(name=name, row=row)
+
+# FTS5 wraps matches in these private-use characters; the stored text is escaped
+# before they become <mark> tags, as the UI renders snippets as HTML
+MARK_OPEN, MARK_CLOSE = "\ue000", "\ue001"
+
+def _highlighted_html(marked: Optional[str]) -> Optional[str]:
+    if marked is None:
+        return None
+    return html.escape(marked).replace(MARK_OPEN, "<mark>").replace(MARK_CLOSE, "</mark>")
+
+SEARCH_SCHEMA = [
+    # Backfill progress for rows that existed before the index was created
+    """CREATE TABLE IF NOT EXISTS search_backfill (
+        name TEXT PRIMARY KEY,
+        next_id INTEGER NOT NULL,
+        upto_id INTEGER NOT NULL
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+        user_input, ai_response,
+        content='conversations', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts USING fts5(
+        title,
+        content='sessions', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations
+    WHEN new.status != 'streaming' BEGIN
+        INSERT INTO conversations_fts(rowid, user_input, ai_response)
+        VALUES (new.id, new.user_input, new.ai_response);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations
+    WHEN old.status != 'streaming' AND {_pending_guard('conversations_fts', 'old')} BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, user_input, ai_response)
+        VALUES ('delete', old.id, old.user_input, old.ai_response);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS conversations_fts_update_old AFTER UPDATE ON conversations
+    WHEN old.status != 'streaming' AND {_pending_guard('conversations_fts', 'old')} BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, user_input, ai_response)
+        VALUES ('delete', old.id, old.user_input, old.ai_response);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS conversations_fts_update_new AFTER UPDATE ON conversations
+    WHEN new.status != 'streaming' AND {_pending_guard('conversations_fts', 'new')} BEGIN
+        INSERT INTO conversations_fts(rowid, user_input, ai_response)
+        VALUES (new.id, new.user_input, new.ai_response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sessions_fts_insert AFTER INSERT ON sessions BEGIN
+        INSERT INTO sessions_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS sessions_fts_delete AFTER DELETE ON sessions
+    WHEN {_pending_guard('sessions_fts', 'old')} BEGIN
+        INSERT INTO sessions_fts(sessions_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS sessions_fts_update AFTER UPDATE OF title ON sessions
+    WHEN {_pending_guard('sessions_fts', 'old')} BEGIN
+        INSERT INTO sessions_fts(sessions_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO sessions_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+]
+
+BACKFILL_SOURCES = {
+    "conversations_fts": (
+        "SELECT id, user_input, ai_response FROM conversations "
+        "WHERE id >= :start AND id < :stop AND id <= :upto AND status != 'streaming'",
+        "INSERT INTO conversations_fts(rowid, user_input, ai_response) VALUES (:id, :user_input, :ai_response)",
+        "conversations"
+    ),
+    "sessions_fts": (
+        "SELECT id, title FROM sessions WHERE id >= :start AND id < :stop AND id <= :upto",
+        "INSERT INTO sessions_fts(rowid, title) VALUES (:id, :title)",
+        "sessions"
+    ),
+}
+
+def build_match_query(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+class HistorySearch:
+    """Full-text search over conversation history and session titles (SQLite FTS5)."""
+
+    def __init__(self, session_factory, backfill_batch_size: int = 5000, max_offset: int = 1000):
+        self.session_factory = session_factory
+        self.backfill_batch_size = backfill_batch_size
+        self.max_offset = max_offset
+        self.available = False
+        self.worker: Optional[asyncio.Task] = None
+        self.backfilled_rows = 0
+
+    def _install(self, conn):
+        existing = {
+            row[0] for row in conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE name IN ('conversations_fts', 'sessions_fts')"
+            )
+        }
+        for statement in SEARCH_SCHEMA:
+            conn.exec_driver_sql(statement)
+
+        # New index on an existing database: queue everything already there for backfill.
+        # Triggers created above cover all rows written from now on.
+        for name, (_, _, table) in BACKFILL_SOURCES.items():
+            if name not in existing:
+                upto = conn.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) FROM {table}").scalar()
+                if upto:
+                    conn.exec_driver_sql(
+                        "INSERT OR REPLACE INTO search_backfill(name, next_id, upto_id) VALUES (?, 0, ?)",
+                        (name, upto)
+                    )
+
+    async def install(self, engine):
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(self._install)
+            self.available = True
+        except Exception as e:
+            logger.warning(f"Full-text search disabled, FTS5 unavailable: {str(e)}")
+
+    async def start(self):
+        if self.available and self.worker is None:
+            self.worker = asyncio.create_task(self._backfill())
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    async def _backfill(self):
+        """Index pre-existing rows in small id-range batches so writers are never blocked for long."""
+        try:
+            async with self.session_factory() as db:
+                jobs = (await db.execute(text("SELECT name, next_id, upto_id FROM search_backfill"))).all()
+
+            for name, next_id, upto in jobs:
+                select_sql, insert_sql, _ = BACKFILL_SOURCES[name]
+                while next_id <= upto:
+                    stop = next_id + self.backfill_batch_size
+                    async with self.session_factory() as db:
+                        rows = (await db.execute(
+                            text(select_sql), {"start": next_id, "stop": stop, "upto": upto}
+                        )).mappings().all()
+                        if rows:
+                            await db.execute(text(insert_sql), [dict(row) for row in rows])
+                        await db.execute(
+                            text("UPDATE search_backfill SET next_id = :next_id WHERE name = :name"),
+                            {"next_id": stop, "name": name}
+                        )
+                        await db.commit()
+                    self.backfilled_rows += len(rows)
+                    next_id = stop
+                    await asyncio.sleep(0)
+
+                async with self.session_factory() as db:
+                    await db.execute(text("DELETE FROM search_backfill WHERE name = :name"), {"name": name})
+                    await db.commit()
+                logger.info(f"Backfilled search index {name}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Search index backfill failed: {str(e)}")
+
+    async def search(
+        self,
+        db,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        session_id: Optional[int] = None
+    ) -> Dict[str, List[Dict]]:
+        """Ranked, highlighted hits in conversations and session titles."""
+        match = build_match_query(query)
+        offset = min(offset, self.max_offset)
+        if not match:
+            return {"conversations": [], "sessions": [], "next_offset": None}
+
+        # ORDER BY rank + LIMIT lets FTS5 keep only the top hits instead of sorting every match
+        params = {"match": match, "limit": limit + 1, "offset": offset, "mark_open": MARK_OPEN, "mark_close": MARK_CLOSE}
+        session_filter = ""
+        if session_id is not None:
+            session_filter = "AND c.session_id = :session_id"
+            params["session_id"] = session_id
+        rows = (await db.execute(text(f"""
+            SELECT c.id, c.session_id, s.title, c.timestamp,
+                   snippet(conversations_fts, 0, :mark_open, :mark_close, '…', 16) AS user_snippet,
+                   snippet(conversations_fts, 1, :mark_open, :mark_close, '…', 24) AS ai_snippet,
+                   conversations_fts.rank AS rank
+            FROM conversations_fts
+            JOIN conversations c ON c.id = conversations_fts.rowid
+            JOIN sessions s ON s.id = c.session_id
+            WHERE conversations_fts MATCH :match {session_filter}
+            ORDER BY conversations_fts.rank
+            LIMIT :limit OFFSET :offset
+        """), params)).mappings().all()
+
+        sessions = []
+        if offset == 0 and session_id is None:
+            sessions = (await db.execute(text("""
+                SELECT sessions_fts.rowid AS id,
+                       highlight(sessions_fts, 0, :mark_open, :mark_close) AS title,
+                       sessions_fts.rank AS rank
+                FROM sessions_fts
+                WHERE sessions_fts MATCH :match
+                ORDER BY sessions_fts.rank
+                LIMIT 10
+            """), {"match": match, "mark_open": MARK_OPEN, "mark_close": MARK_CLOSE})).mappings().all()
+
+        conversations = [
+            {**row, "user_snippet": _highlighted_html(row["user_snippet"]), "ai_snippet": _highlighted_html(row["ai_snippet"])}
+            for row in rows[:limit]
+        ]
+        return {
+            "conversations": conversations,
+            "sessions": [{**row, "title": _highlighted_html(row["title"])} for row in sessions],
+            "next_offset": offset + limit if len(rows) > limit and offset + limit <= self.max_offset else None
+        }
+
+    def get_stats(self):
+        return {
+            "available": self.available,
+            "backfilling": self.worker is not None and not self.worker.done(),
+            "backfilled_rows": self.backfilled_rows
+        }
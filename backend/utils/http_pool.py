@@ -0,0 +1,105 @@
+import httpx
+import logging
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class HTTPClientPool:
+    """One long-lived httpx.AsyncClient per upstream base URL.
+
+    Clients keep their connections alive between requests so token streams and
+    health probes reuse TCP connections instead of opening a new one each time.
+    The owner (the FastAPI lifespan) is responsible for calling `aclose()`.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        timeout: float = 30.0
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http2 = http2
+        self.timeout = timeout
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.transports: Dict[str, httpx.AsyncHTTPTransport] = {}
+
+        # Utilization metrics, per upstream
+        self.request_count: Dict[str, int] = {}
+        self.created_at: Dict[str, float] = {}
+
+    def get_client(self, base_url: str) -> httpx.AsyncClient:
+        """Return the shared client for an upstream, creating it on first use."""
+        base_url = base_url.rstrip("/")
+        client = self.clients.get(base_url)
+        if client is None or client.is_closed:
+            transport = httpx.AsyncHTTPTransport(
+                http2=self.http2,
+                limits=self.limits,
+                retries=1  # Retry once on connect errors (e.g. a stale keep-alive socket)
+            )
+
+            async def count_request(request: httpx.Request):
+                self.request_count[base_url] = self.request_count.get(base_url, 0) + 1
+
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                transport=transport,
+                timeout=self.timeout,
+                follow_redirects=True,
+                event_hooks={"request": [count_request]}
+            )
+            self.clients[base_url] = client
+            self.transports[base_url] = transport
+            self.created_at[base_url] = time.time()
+            logger.info(f"Opened HTTP connection pool for {base_url}")
+        return client
+
+    async def aclose(self):
+        """Close every client and its pooled connections."""
+        for base_url, client in list(self.clients.items()):
+            try:
+                await client.aclose()
+                logger.info(f"Closed HTTP connection pool for {base_url}")
+            except Exception as e:
+                logger.error(f"Error closing HTTP client for {base_url}: {str(e)}")
+        self.clients.clear()
+        self.transports.clear()
+
+    def _pool_connections(self, base_url: str) -> Optional[list]:
+        transport = self.transports.get(base_url)
+        # httpx does not expose pool state publicly; httpcore's pool does.
+        pool = getattr(transport, "_pool", None)
+        if pool is None:
+            return None
+        return list(getattr(pool, "connections", []))
+
+    def get_stats(self) -> Dict:
+        """Pool utilization per upstream."""
+        upstreams = {}
+        for base_url, client in self.clients.items():
+            stats = {
+                "closed": client.is_closed,
+                "requests": self.request_count.get(base_url, 0),
+                "uptime": round(time.time() - self.created_at.get(base_url, time.time()), 1),
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+            }
+            connections = self._pool_connections(base_url)
+            if connections is not None:
+                idle = sum(1 for conn in connections if conn.is_idle())
+                stats["open_connections"] = len(connections)
+                stats["idle_connections"] = idle
+                stats["active_connections"] = len(connections) - idle
+            upstreams[base_url] = stats
+        return {
+            "http2": self.http2,
+            "upstreams": upstreams
+        }
@@ -2,10 +2,15 @@ import httpx
 import json
 import logging
 import asyncio
-from typing import Any, Dict, Optional, Union, AsyncGenerator
+import hashlib
+from cachetools import LRUCache
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Union, AsyncGenerator
 from enum import Enum
 from dataclasses import dataclass
 from datetime import datetime
+from .http_pool import HTTPClientPool
+from .slots import SlotAffinity
 
 logger = logging.getLogger(__name__)
 
@@ -39,25 +44,134 @@ class LLMClient:
         base_url: str = "http://127.0.0.1:8080",
         max_retries: int = 3,
         timeout: float = 30.0,
-        backoff_factor: float = 1.5
+        backoff_factor: float = 1.5,
+        http_pool: Optional[HTTPClientPool] = None,
+        default_context_window: int = 4096,
+        token_cache_size: int = 8192,
+        slots: Optional[SlotAffinity] = None,
+        embedding_url: Optional[str] = None
     ):
         self.base_url = base_url
+        # Separate embedding server; None embeds on the chat server
+        self.embedding_url = embedding_url
         self.max_retries = max_retries
         self.timeout = timeout
         self.backoff_factor = backoff_factor
-        self.context_window = 128000
+        self.default_context_window = default_context_window
+        self.context_window = default_context_window
+        self.context_window_discovered = False
         self.default_output_tokens = 4096
 
+        # Token counts keyed by text hash; only exact counts from the server are cached
+        self.token_cache = LRUCache(maxsize=token_cache_size)
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
+
         # Initialize metrics
         self.request_count = 0
         self.error_count = 0
         self.total_tokens = 0
 
-        # Configure client settings
-        self.client_settings = {
-            "timeout": timeout,
-            "follow_redirects": True,
-            "http2": True
+        # Shared, keep-alive connection pool (owned by the app lifespan)
+        self.http_pool = http_pool or HTTPClientPool(timeout=timeout)
+        # Completions without an explicit slot borrow an idle one, so they never
+        # overwrite a chat session's cached prefix behind the affinity map's back
+        self.slots = slots
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self.http_pool.get_client(self.base_url)
+
+    def reset_server_info(self):
+        """Forget per-model state (context size, token counts) after a model change."""
+        self.context_window = self.default_context_window
+        self.context_window_discovered = False
+        self.token_cache.clear()
+
+    async def get_context_window(self, refresh: bool = False) -> int:
+        """Context size per slot as reported by the running llama-server (`/props`)."""
+        if self.context_window_discovered and not refresh:
+            return self.context_window
+
+        try:
+            response = await self.client.get("/props", timeout=2.0)
+            response.raise_for_status()
+            props = response.json()
+            n_ctx = (props.get("default_generation_settings") or {}).get("n_ctx") or props.get("n_ctx")
+            if n_ctx:
+                self.context_window = int(n_ctx)
+                self.context_window_discovered = True
+                logger.info(f"Discovered llama-server context window: {self.context_window} tokens")
+        except Exception as e:
+            logger.debug(f"Could not read context window from server: {str(e)}")
+
+        return self.context_window
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token estimate used when the tokenizer endpoint is unavailable."""
+        return len(text) // 4 + 1
+
+    async def count_tokens(self, text: str) -> int:
+        """Count tokens with the server's tokenizer, cached by text hash."""
+        if not text:
+            return 0
+
+        key = hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+        count = self.token_cache.get(key)
+        if count is not None:
+            self.token_cache_hits += 1
+            return count
+
+        self.token_cache_misses += 1
+        try:
+            response = await self.client.post(
+                "/tokenize",
+                json={"content": text, "add_special": False},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            count = len(response.json().get("tokens", []))
+        except Exception as e:
+            logger.debug(f"Tokenize failed, estimating instead: {str(e)}")
+            return self.estimate_tokens(text)
+
+        self.token_cache[key] = count
+        return count
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts with the embedding server's `/v1/embeddings` endpoint."""
+        try:
+            response = await self.http_pool.get_client(self.embedding_url or self.base_url).post(
+                "/v1/embeddings",
+                json={"input": texts},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            data = sorted(response.json()["data"], key=lambda item: item["index"])
+            return [item["embedding"] for item in data]
+        except httpx.RequestError as e:
+            raise LLMException(f"Connection error: {str(e)}", LLMErrorCode.CONNECTION_ERROR)
+        except Exception as e:
+            raise LLMException(f"Embedding failed: {str(e)}", LLMErrorCode.API_ERROR)
+
+    @asynccontextmanager
+    async def _slot(self, id_slot: Optional[int]) -> AsyncIterator[Optional[int]]:
+        if id_slot is not None or self.slots is None:
+            yield id_slot
+            return
+        async with self.slots.scratch_slot() as slot:
+            yield slot
+
+    def get_token_cache_stats(self) -> Dict[str, Any]:
+        total = self.token_cache_hits + self.token_cache_misses
+        return {
+            "entries": len(self.token_cache),
+            "hits": self.token_cache_hits,
+            "misses": self.token_cache_misses,
+            "hit_rate": round(self.token_cache_hits / total, 3) if total else 0.0,
+            "context_window": self.context_window,
+            "context_window_discovered": self.context_window_discovered
         }
 
     async def _make_request(
@@ -65,53 +179,57 @@ class LLMClient:
         messages: list,
         max_tokens: Optional[int] = None,
         temperature: float = 0.7,
-        retry_count: int = 0
+        retry_count: int = 0,
+        id_slot: Optional[int] = None
     ) -> LLMResponse:
         """Make HTTP request to LLM API with retry logic and proper error handling"""
         start_time = datetime.now()
 
         try:
-            async with httpx.AsyncClient(**self.client_settings) as client:
-                response = await client.post(
-                    f"{self.base_url}/v1/chat/completions",
-                    json={
-                        "model": "llama-3.2-3b-instruct",
-                        "messages": messages,
-                        "temperature": temperature,
-                        "max_tokens": max_tokens or self.default_output_tokens,
-                        "stream": False
-                    },
-                    timeout=self.timeout
-                )
+            payload = {
+                "model": "llama-3.2-3b-instruct",
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens or self.default_output_tokens,
+                "stream": False
+            }
+            if id_slot is not None:
+                payload["id_slot"] = id_slot
 
-                if response.status_code == 429:  # Rate limit
-                    if retry_count < self.max_retries:
-                        wait_time = self.backoff_factor ** retry_count
-                        logger.warning(f"Rate limited. Retrying in {wait_time}s...")
-                        await asyncio.sleep(wait_time)
-                        return await self._make_request(messages, max_tokens, temperature, retry_count + 1)
-                    raise LLMException(
-                        "Rate limit exceeded",
-                        LLMErrorCode.RATE_LIMIT
-                    )
+            response = await self.client.post(
+                "/v1/chat/completions",
+                json=payload,
+                timeout=self.timeout
+            )
 
-                response.raise_for_status()
-                result = response.json()
+            if response.status_code == 429:  # Rate limit
+                if retry_count < self.max_retries:
+                    wait_time = self.backoff_factor ** retry_count
+                    logger.warning(f"Rate limited. Retrying in {wait_time}s...")
+                    await asyncio.sleep(wait_time)
+                    return await self._make_request(messages, max_tokens, temperature, retry_count + 1, id_slot)
+                raise LLMException(
+                    "Rate limit exceeded",
+                    LLMErrorCode.RATE_LIMIT
+                )
 
-                # Calculate latency
-                latency = (datetime.now() - start_time).total_seconds()
+            response.raise_for_status()
+            result = response.json()
 
-                # Update metrics
-                self.request_count += 1
-                if "usage" in result:
-                    self.total_tokens += result["usage"].get("total_tokens", 0)
+            # Calculate latency
+            latency = (datetime.now() - start_time).total_seconds()
 
-                return LLMResponse(
-                    content=result["choices"][0]["message"]["content"],
-                    finish_reason=result["choices"][0].get("finish_reason"),
-                    usage=result.get("usage"),
-                    latency=latency
-                )
+            # Update metrics
+            self.request_count += 1
+            if "usage" in result:
+                self.total_tokens += result["usage"].get("total_tokens", 0)
+
+            return LLMResponse(
+                content=result["choices"][0]["message"]["content"],
+                finish_reason=result["choices"][0].get("finish_reason"),
+                usage=result.get("usage"),
+                latency=latency
+            )
 
         except (httpx.ConnectTimeout, httpx.ReadTimeout, httpx.WriteTimeout) as e:
             self.error_count += 1
@@ -145,20 +263,23 @@ class LLMClient:
             prompt: str,
             max_tokens: Optional[int] = None,
             temperature: float = 0.7,
-            system_prompt: Optional[str] = None
+            system_prompt: Optional[str] = None,
+            id_slot: Optional[int] = None
         ) -> str:
-            """Regular completion method that returns full response as string"""
+            """Regular completion method that returns full response as string; `id_slot` pins a server slot"""
             messages = []
             if system_prompt:
                 messages.append({"role": "system", "content": system_prompt})
             messages.append({"role": "user", "content": prompt})
 
             try:
-                response = await self._make_request(
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    temperature=temperature
-                )
+                async with self._slot(id_slot) as slot:
+                    response = await self._make_request(
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        id_slot=slot
+                    )
                 return response.content
             except LLMException as e:
                 logger.error(
@@ -170,38 +291,44 @@ class LLMClient:
                 )
                 return ""
 
-    async def stream_complete(self, prompt: str, system_prompt: str = None) -> AsyncGenerator[str, None]:
-        """Streaming completion method for more responsive output"""
+    async def stream_complete(
+        self,
+        prompt: str,
+        system_prompt: str = None,
+        id_slot: Optional[int] = None
+    ) -> AsyncGenerator[str, None]:
+        """Streaming completion method for more responsive output; `id_slot` pins a server slot"""
         try:
             messages = []
             if system_prompt:
                 messages.append({"role": "system", "content": system_prompt})
             messages.append({"role": "user", "content": prompt})
 
-            async with httpx.AsyncClient(**self.client_settings) as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/v1/chat/completions",
-                    json={
-                        "model": "llama-3.2-3b-instruct",
-                        "messages": messages,
-                        "temperature": 0.7,
-                        "stream": True
-                    },
-                    timeout=self.timeout
-                ) as response:
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            line = line[6:]
-                        if line == "[DONE]" or not line.strip():
-                            continue
-
-                        try:
-                            json_line = json.loads(line)
-                            if content := json_line.get('choices', [{}])[0].get('delta', {}).get('content'):
-                                yield content
-                        except json.JSONDecodeError:
-                            continue
+            payload = {
+                "model": "llama-3.2-3b-instruct",
+                "messages": messages,
+                "temperature": 0.7,
+                "stream": True
+            }
+
+            async with self._slot(id_slot) as slot, self.client.stream(
+                "POST",
+                "/v1/chat/completions",
+                json=payload if slot is None else {**payload, "id_slot": slot},
+                timeout=self.timeout
+            ) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        line = line[6:]
+                    if line == "[DONE]" or not line.strip():
+                        continue
+
+                    try:
+                        json_line = json.loads(line)
+                        if content := json_line.get('choices', [{}])[0].get('delta', {}).get('content'):
+                            yield content
+                    except json.JSONDecodeError:
+                        continue
 
         except Exception as e:
             logger.error(f"Stream error: {str(e)}")
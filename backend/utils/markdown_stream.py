@@ -0,0 +1,132 @@
+import re
+from typing import AsyncIterator, List, Optional
+
+# Lines whose meaning depends on their start: headings, list items, quotes, table rows
+STRUCTURAL_RE = re.compile(r' {0,3}(?:#{1,6}(?:[ \t]|$)|[-*+][ \t]|\d{1,9}[.)][ \t]|>|\|)')
+FENCE_RE = re.compile(r' {0,3}(`{3,}|~{3,})')
+CONTENT_SPACE_RE = re.compile(r'\S[ \t]')
+
+# Longest line start that STRUCTURAL_RE or FENCE_RE needs to see
+CLASSIFY_CHARS = 16
+
+class MarkdownSegmenter:
+    """Splits streamed Markdown into complete blocks, looking at each character once.
+
+    Headings, list items, quotes and table rows are sent as whole lines and
+    fenced code blocks as whole blocks, so a client never renders half a
+    structure. Plain paragraph text is sent up to the last word boundary as it
+    arrives. Anything held longer than `max_hold_chars` is sent as it is.
+    Joining every emitted segment (plus `flush()`) gives back the input exactly.
+    """
+
+    def __init__(self, max_hold_chars: int = 4000):
+        self.max_hold_chars = max_hold_chars
+        self.parts: List[str] = []  # Unsent text of the current line
+        self.length = 0
+        self.kind: Optional[str] = None  # None until known: "paragraph", "structural" or "fence"
+        self.fence: Optional[str] = None  # Opening fence while inside a code block
+        self.block: List[str] = []  # Lines of the open code block
+        self.block_length = 0
+
+    def feed(self, chunk: str) -> List[str]:
+        out: List[str] = []
+        start = 0
+        while True:
+            newline = chunk.find("\n", start)
+            if newline == -1:
+                break
+            self._add(chunk[start:newline + 1])
+            self._end_line(out)
+            start = newline + 1
+        if start < len(chunk):
+            piece = chunk[start:]
+            self._add(piece)
+            self._partial(piece, out)
+        return out
+
+    def flush(self) -> List[str]:
+        """Whatever is still held, once the stream has ended."""
+        # An unclosed code block and the unfinished line go out together
+        out = ["".join(self.block) + "".join(self.parts)]
+        self.parts, self.length, self.kind = [], 0, None
+        self.fence, self.block, self.block_length = None, [], 0
+        return out
+
+    def _add(self, piece: str):
+        self.parts.append(piece)
+        self.length += len(piece)
+
+    def _take_line(self) -> str:
+        line = "".join(self.parts)
+        self.parts, self.length = [], 0
+        return line
+
+    def _classify(self, line: str) -> str:
+        if FENCE_RE.match(line):
+            return "fence"
+        if STRUCTURAL_RE.match(line):
+            return "structural"
+        return "paragraph"
+
+    def _end_line(self, out: List[str]):
+        line = self._take_line()
+        kind, self.kind = self.kind, None
+
+        if self.fence is not None:
+            self.block.append(line)
+            self.block_length += len(line)
+            stripped = line.lstrip(" ")
+            closing = stripped.rstrip()
+            if (closing.startswith(self.fence) and closing == closing[0] * len(closing)
+                    and len(line) - len(stripped) <= 3):
+                self.fence = None
+            if self.fence is None or self.block_length > self.max_hold_chars:
+                out.append("".join(self.block))
+                self.block, self.block_length = [], 0
+            return
+
+        if kind in (None, "fence"):
+            match = FENCE_RE.match(line)
+            if match:
+                self.fence = match.group(1)
+                self.block, self.block_length = [line], len(line)
+                return
+        out.append(line)
+
+    def _partial(self, piece: str, out: List[str]):
+        if self.kind is None and self.fence is None:
+            # Decide once the start of the line is unambiguous
+            line = "".join(self.parts)
+            if self.length < CLASSIFY_CHARS and not CONTENT_SPACE_RE.search(line):
+                return
+            self.parts = [line]
+            self.kind = self._classify(line)
+            piece = line
+
+        if self.kind == "paragraph":
+            # Send everything up to the last word boundary
+            cut = max(piece.rfind(" "), piece.rfind("\t")) + 1
+            if cut:
+                head = self.parts[:-1]
+                head.append(piece[:cut])
+                out.append("".join(head))
+                rest = piece[cut:]
+                self.parts = [rest] if rest else []
+                self.length = len(rest)
+
+        if self.length + self.block_length > self.max_hold_chars:
+            # Held too long without a line end: send it as it is
+            self.block.append(self._take_line())
+            out.append("".join(self.block))
+            self.block, self.block_length = [], 0
+
+async def segment_markdown(source: AsyncIterator[str], max_hold_chars: int = 4000) -> AsyncIterator[str]:
+    """Re-chunk a stream of Markdown into complete blocks."""
+    segmenter = MarkdownSegmenter(max_hold_chars)
+    async for chunk in source:
+        for segment in segmenter.feed(chunk):
+            if segment:
+                yield segment
+    for segment in segmenter.flush():
+        if segment:
+            yield segment
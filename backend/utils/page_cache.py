@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    content BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_pages_accessed_at ON pages (accessed_at);
+"""
+
+@dataclass
+class CachedPage:
+    content: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+class PageCache:
+    """Extracted web page content in a SQLite file, shared by every worker process.
+
+    Content is stored zlib-compressed with the validators (ETag and
+    Last-Modified) the origin sent. Entries younger than `fresh_seconds` are
+    served as they are; older ones are revalidated with a conditional GET, and
+    a 304 refreshes them without downloading or extracting the page again. The
+    least recently used pages are evicted once the compressed total passes
+    `max_bytes`.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 128 * 1024 * 1024, fresh_seconds: float = 3600):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+        # Metrics (this process only)
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            # WAL lets other workers read while one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(PAGE_CACHE_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def is_fresh(self, page: CachedPage) -> bool:
+        return time.time() - page.fetched_at < self.fresh_seconds
+
+    def _get(self, url: str) -> Optional[CachedPage]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT content, etag, last_modified, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        try:
+            content = zlib.decompress(row[0]).decode("utf-8")
+        except (zlib.error, UnicodeDecodeError) as e:
+            logger.warning(f"Dropping unreadable page cache entry for {url}: {str(e)}")
+            with self._lock:
+                self._connect().execute("DELETE FROM pages WHERE url = ?", (url,))
+            return None
+        return CachedPage(content, row[1], row[2], row[3])
+
+    def _put(self, url: str, content: str, etag: Optional[str], last_modified: Optional[str]):
+        data = zlib.compress(content.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO pages (url, content, size, etag, last_modified, fetched_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, data, len(data), etag, last_modified, now, now)
+                )
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+                if total > self.max_bytes:
+                    # Walk the oldest entries until enough bytes are freed
+                    excess = total - self.max_bytes
+                    victims = []
+                    for victim, size in conn.execute(
+                        "SELECT url, size FROM pages WHERE url != ? ORDER BY accessed_at", (url,)
+                    ):
+                        if excess <= 0:
+                            break
+                        victims.append((victim,))
+                        excess -= size
+                    conn.executemany("DELETE FROM pages WHERE url = ?", victims)
+                    self.evictions += len(victims)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _touch(self, url: str):
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                "UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url)
+            )
+
+    async def get(self, url: str) -> Optional[CachedPage]:
+        try:
+            return await asyncio.to_thread(self._get, url)
+        except sqlite3.Error as e:
+            logger.error(f"Page cache read failed for {url}: {str(e)}")
+            return None
+
+    async def put(self, url: str, content: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        try:
+            await asyncio.to_thread(self._put, url, content, etag, last_modified)
+            self.stores += 1
+        except sqlite3.Error as e:
+            logger.error(f"Page cache write failed for {url}: {str(e)}")
+
+    async def touch(self, url: str):
+        """Mark a page as confirmed unchanged by the origin."""
+        try:
+            await asyncio.to_thread(self._touch, url)
+        except sqlite3.Error as e:
+            logger.error(f"Page cache update failed for {url}: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        try:
+            with self._lock:
+                entries, total = self._connect().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages"
+                ).fetchone()
+        except sqlite3.Error:
+            entries, total = None, None
+        lookups = self.hits + self.revalidated + self.misses
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "fresh_seconds": self.fresh_seconds,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+            "hit_rate": round((self.hits + self.revalidated) / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions
+        }
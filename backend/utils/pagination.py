@@ -0,0 +1,57 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+from sqlalchemy import tuple_
+
+Cursor = Tuple[datetime, int]
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque cursor for a (timestamp, id) sort key."""
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+
+async def fetch_keyset_page(
+    db,
+    query,
+    keys: Sequence,
+    limit: int,
+    before: Optional[Cursor] = None,
+    after: Optional[Cursor] = None
+):
+    """Fetch one page ordered by `keys` (unique together), newest first.
+
+    `before` returns rows with keys strictly below the cursor (older),
+    `after` rows strictly above it (newer). Seeks on a matching index instead
+    of scanning with OFFSET, so every page costs the same.
+    Returns (rows newest first, has_older, has_newer).
+    """
+    key = tuple_(*keys)
+    if after is not None:
+        rows = (await db.scalars(
+            query.where(key > tuple_(*after))
+            .order_by(*[column.asc() for column in keys])
+            .limit(limit + 1)
+        )).all()
+        has_newer = len(rows) > limit
+        return list(reversed(rows[:limit])), True, has_newer
+
+    if before is not None:
+        query = query.where(key < tuple_(*before))
+    rows = (await db.scalars(
+        query.order_by(*[column.desc() for column in keys]).limit(limit + 1)
+    )).all()
+    return list(rows[:limit]), len(rows) > limit, before is not None
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .bm25 import BM25Index, tokenize
+from .documents import chunk_text
+
+logger = logging.getLogger(__name__)
+
+class PassageCorpus:
+    """The pages fetched for one question, split into passages and ranked with one BM25 index.
+
+    Indexing the pages together gives each term its document frequency over
+    everything fetched, so words all pages repeat (usually the topic itself)
+    count for less than the ones that set a passage apart. Pages can arrive
+    one by one: `expect()` each page, `add()` it once fetched (empty text if
+    the fetch failed) and `seal()` once no more pages will be expected.
+    `select()` waits at most `max_wait` seconds for the pages still expected,
+    then ranks with the pages that have arrived, so one slow host does not
+    hold back every summary.
+    """
+
+    def __init__(self, query: str, passage_chars: int = 800, max_wait: float = 1.0):
+        self.query_tokens = tokenize(query)
+        self.passage_chars = passage_chars
+        self.max_wait = max_wait
+        self.pages: Dict[str, List[str]] = {}
+        self.pending: Set[str] = set()
+        self.sealed = False
+        self.ready = asyncio.Event()
+        self._build_lock = asyncio.Lock()
+        # Bumped by every add(); the index is rebuilt when it has fallen behind
+        self.version = 0
+        self.built_version = -1
+        self.index: Optional[BM25Index] = None
+        self.scores: Dict[str, List[float]] = {}
+
+    def expect(self, key: str):
+        if key not in self.pages:
+            self.pending.add(key)
+
+    def add(self, key: str, text: str):
+        self.pages[key] = chunk_text(text, self.passage_chars) if text else []
+        self.pending.discard(key)
+        self.version += 1
+        self._check()
+
+    def seal(self):
+        self.sealed = True
+        self._check()
+
+    def _check(self):
+        if self.sealed and not self.pending:
+            self.ready.set()
+
+    def _build(self, pages: Dict[str, List[str]]):
+        passages = [passage for chunks in pages.values() for passage in chunks]
+        index = BM25Index([tokenize(passage) for passage in passages])
+        scores = index.scores(self.query_tokens)
+        page_scores = {}
+        start = 0
+        for key, chunks in pages.items():
+            page_scores[key] = scores[start:start + len(chunks)]
+            start += len(chunks)
+        self.index, self.scores = index, page_scores
+
+    async def _ensure_index(self):
+        """Index the pages fetched so far, after waiting at most `max_wait` for the rest."""
+        if not self.ready.is_set():
+            try:
+                await asyncio.wait_for(self.ready.wait(), self.max_wait)
+            except asyncio.TimeoutError:
+                logger.debug(f"Ranking passages without {len(self.pending)} pages still loading")
+        async with self._build_lock:
+            if self.built_version != self.version:
+                # Snapshot on the loop thread; add() may run while the index builds
+                version, pages = self.version, dict(self.pages)
+                await asyncio.to_thread(self._build, pages)
+                self.built_version = version
+
+    async def page_score(self, key: str) -> float:
+        """Score of the page's best passage."""
+        await self._ensure_index()
+        return max(self.scores.get(key) or [0.0])
+
+    async def select(self, key: str, token_budget: int, count_tokens: Callable[[str], Awaitable[int]]) -> str:
+        """The page's best passages that fit `token_budget`, in page order.
+
+        Passages that share no terms with the question rank after every match,
+        in page order, so broad questions still get the start of the page.
+        """
+        await self._ensure_index()
+        passages = self.pages.get(key) or []
+        scores = self.scores.get(key) or []
+        ranked = sorted(range(len(passages)), key=lambda i: (-scores[i], i))
+
+        # Count tokens only for passages that could plausibly fit
+        leading: List[int] = []
+        estimate = 0
+        for i in ranked:
+            if estimate > token_budget * 2:
+                break
+            leading.append(i)
+            estimate += len(passages[i]) // 4 + 1
+        counts = await asyncio.gather(*[count_tokens(passages[i]) for i in leading])
+
+        selected: List[Tuple[int, int]] = []
+        used = 0
+        for i, tokens in zip(leading, counts):
+            if used + tokens > token_budget:
+                continue
+            used += tokens
+            selected.append((i, tokens))
+        selected.sort()
+
+        parts = []
+        for n, (i, _) in enumerate(selected):
+            # Mark where passages were left out
+            if n and i != selected[n - 1][0] + 1:
+                parts.append("[...]")
+            parts.append(passages[i])
+        logger.debug(f"Selected {len(selected)} of {len(passages)} passages from {key}, {used}/{token_budget} tokens")
+        return "\n\n".join(parts)
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import update
+
+from db_models import Conversation, Session
+
+logger = logging.getLogger(__name__)
+
+class PendingTurn:
+    """A conversation turn whose response is still being generated."""
+
+    def __init__(self, session_id: int, user_input: str):
+        self.session_id = session_id
+        self.user_input = user_input
+        self.chunks: List[str] = []
+        self.row_id: Optional[int] = None  # Set by the writer once inserted
+        self.finished = False
+        self.chars_since_checkpoint = 0
+        self.last_checkpoint = time.monotonic()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+class ConversationWriter:
+    """Single writer task that persists streamed conversations behind the response.
+
+    Handlers only enqueue operations: insert the turn when streaming starts,
+    checkpoint the partial response every N characters or seconds, and mark the
+    turn complete (or interrupted) at the end. The writer drains the queue in
+    batches and applies each batch in one transaction, so many small writes
+    from concurrent streams become a few group commits and no request holds
+    a database connection while it streams.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        checkpoint_chars: int = 256,
+        checkpoint_seconds: float = 2.0,
+        batch_size: int = 200,
+        flush_interval: float = 0.05,
+        on_turn_complete: Optional[Callable[[int], None]] = None
+    ):
+        self.session_factory = session_factory
+        self.checkpoint_chars = checkpoint_chars
+        self.checkpoint_seconds = checkpoint_seconds
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_turn_complete = on_turn_complete
+
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.worker: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.commits = 0
+        self.operations = 0
+        self.checkpoints = 0
+        self.interrupted = 0
+        self.failures = 0
+
+    async def start(self):
+        if self.worker is None:
+            await self._recover()
+            self.worker = asyncio.create_task(self._run())
+
+    async def _recover(self):
+        """Turns left 'streaming' by a previous process will never finish; keep what was checkpointed."""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(Conversation)
+                .where(Conversation.status == "streaming")
+                .values(status="interrupted")
+            )
+            await db.commit()
+        if result.rowcount:
+            logger.info(f"Marked {result.rowcount} unfinished conversations as interrupted")
+
+    async def stop(self):
+        """Flush everything still queued, then stop the writer."""
+        if self.worker:
+            await self.queue.put(None)
+            await self.worker
+            self.worker = None
+
+    def begin(self, session_id: int, user_input: str) -> PendingTurn:
+        turn = PendingTurn(session_id, user_input)
+        self.queue.put_nowait(("insert", turn))
+        return turn
+
+    def append(self, turn: PendingTurn, chunk: str):
+        """Add streamed text; checkpoints when enough text or time has passed.
+
+        Chunks are whatever the stream sends (a token or a merged frame), so
+        progress is counted in characters.
+        """
+        turn.chunks.append(chunk)
+        turn.chars_since_checkpoint += len(chunk)
+        now = time.monotonic()
+        if (turn.chars_since_checkpoint >= self.checkpoint_chars
+                or now - turn.last_checkpoint >= self.checkpoint_seconds):
+            turn.chars_since_checkpoint = 0
+            turn.last_checkpoint = now
+            self.checkpoints += 1
+            self.queue.put_nowait(("checkpoint", turn))
+
+    def finish(self, turn: PendingTurn, status: str = "complete"):
+        if turn.finished:
+            return
+        turn.finished = True
+        if status == "interrupted":
+            self.interrupted += 1
+        self.queue.put_nowait(("finish", turn, status))
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            op = await self.queue.get()
+            if op is None:
+                break
+
+            # Give concurrent streams a moment to add to this group commit
+            if self.flush_interval:
+                await asyncio.sleep(self.flush_interval)
+
+            batch = [op]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                op = self.queue.get_nowait()
+                if op is None:
+                    stopping = True
+                    break
+                batch.append(op)
+
+            try:
+                await self._apply(batch)
+            except Exception as e:
+                logger.warning(f"Group commit of {len(batch)} conversation operations failed, retrying per turn: {str(e)}")
+                await self._apply_per_turn(batch)
+
+    async def _apply_per_turn(self, batch: list, attempts: int = 2):
+        """Commit each turn's operations on its own, so one bad row cannot lose other streams."""
+        by_turn: Dict[int, list] = {}
+        for op in batch:
+            by_turn.setdefault(id(op[1]), []).append(op)
+
+        for ops in by_turn.values():
+            for attempt in range(attempts):
+                try:
+                    await self._apply(ops)
+                    break
+                except Exception as e:
+                    if attempt + 1 < attempts:
+                        await asyncio.sleep(0.1 * (attempt + 1))
+                        continue
+                    # A turn that is still not inserted is inserted again with its next operation
+                    self.failures += 1
+                    turn = ops[0][1]
+                    logger.error(
+                        f"Failed to persist {len(ops)} operations for a turn in session {turn.session_id}: {str(e)}"
+                    )
+
+    async def _apply(self, batch: list):
+        inserts: Dict[int, Conversation] = {}
+        updates: Dict[int, dict] = {}  # id(turn) -> latest values
+        turns: Dict[int, PendingTurn] = {}
+        completed: List[PendingTurn] = []
+
+        for op in batch:
+            kind, turn = op[0], op[1]
+            turns[id(turn)] = turn
+            # Also covers a turn whose insert failed in an earlier batch
+            if turn.row_id is None and id(turn) not in inserts:
+                inserts[id(turn)] = Conversation(
+                    session_id=turn.session_id,
+                    user_input=turn.user_input,
+                    ai_response="",
+                    status="streaming"
+                )
+            values = updates.setdefault(id(turn), {})
+            if kind in ("checkpoint", "finish"):
+                values["ai_response"] = turn.text
+            if kind == "finish":
+                values["status"] = op[2]
+                completed.append(turn)
+
+        async with self.session_factory() as db:
+            try:
+                if inserts:
+                    db.add_all(inserts.values())
+                    await db.flush()
+                    for key, row in inserts.items():
+                        turns[key].row_id = row.id
+
+                for key, values in updates.items():
+                    if not values:
+                        continue
+                    if key in inserts:
+                        # Inserted in this batch: just send the final values with the insert
+                        for field, value in values.items():
+                            setattr(inserts[key], field, value)
+                    elif turns[key].row_id is not None:
+                        await db.execute(
+                            update(Conversation)
+                            .where(Conversation.id == turns[key].row_id)
+                            .values(**values)
+                        )
+
+                session_ids = {turn.session_id for turn in completed}
+                if session_ids:
+                    await db.execute(
+                        update(Session)
+                        .where(Session.id.in_(session_ids))
+                        .values(updated_at=datetime.utcnow())
+                    )
+
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                # Ids assigned by the flush were rolled back with it
+                for key in inserts:
+                    turns[key].row_id = None
+                raise
+
+        self.commits += 1
+        self.operations += len(batch)
+        if self.on_turn_complete:
+            for turn in completed:
+                self.on_turn_complete(turn.session_id)
+
+    def get_stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "commits": self.commits,
+            "operations": self.operations,
+            "avg_batch_size": round(self.operations / self.commits, 2) if self.commits else 0.0,
+            "checkpoints": self.checkpoints,
+            "interrupted": self.interrupted,
+            "failures": self.failures
+        }
@@ -1,16 +1,21 @@
-import aiohttp
 import asyncio
 from bs4 import BeautifulSoup
-from typing import List, Dict, Tuple, AsyncGenerator
+from typing import List, Dict, Optional, Tuple, AsyncGenerator
 import re
 from urllib.parse import quote_plus, urljoin
 import json
 import logging
 import traceback
 from typing import AsyncGenerator, AsyncIterator
-from cachetools import TTLCache
 from urllib.parse import urlparse
 from .content_extractor import ContentExtractor
+from .extraction_pool import ExtractionPool
+from .markdown_stream import segment_markdown
+from .page_cache import PageCache
+from .passages import PassageCorpus
+from .search_cache import SearchCache
+from .search_triage import SnippetTriage
+from .web_client import DownloadRejected, WebClient
 
 
 
@@ -19,6 +24,9 @@ from .content_extractor import ContentExtractor
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class SearchUnavailable(Exception):
+    """The search engine refused or failed the request (as opposed to finding nothing)."""
+
 class SearchResult:
     def __init__(self, title: str, url: str, snippet: str):
         self.title = title
@@ -27,9 +35,13 @@ class SearchResult:
 
 async def generate_search_queries(llm_client, text: str) -> List[str]:
     try:
-        prompt = f"""Generate 2-3 search queries to find information about: {text}
-        Format: Return only a JSON array of strings, nothing else.
-        Example: ["specific query 1", "specific query 2"]"""
+        prompt = "\n".join([
+            "Generate 2-3 search queries to find information about the text below.",
+            "Format: Return only a JSON array of strings, nothing else.",
+            'Example: ["specific query 1", "specific query 2"]',
+            "",
+            f"Text: {text}"
+        ])
 
         response = await llm_client.complete(prompt)
         logger.info(f"LLM Response for queries: {response}")
@@ -45,10 +57,22 @@ async def generate_search_queries(llm_client, text: str) -> List[str]:
         logger.error(f"Error generating queries: {str(e)}")
         return [text]
 
-async def search_duckduckgo(query: str, max_results: int = 3) -> List[SearchResult]:
+async def search_duckduckgo(
+    query: str,
+    max_results: int = 3,
+    web_client: Optional[WebClient] = None,
+    raise_on_error: bool = False
+) -> List[SearchResult]:
     """
     Search DuckDuckGo using the HTML interface
+
+    Failures return no results, or raise when `raise_on_error` is set so
+    callers can tell them apart from searches that found nothing.
     """
+    if web_client is None:
+        async with WebClient() as client:
+            return await search_duckduckgo(query, max_results, client, raise_on_error)
+
     try:
         encoded_query = quote_plus(query)
         url = f"https://html.duckduckgo.com/html/"
@@ -66,132 +90,197 @@ async def search_duckduckgo(query: str, max_results: int = 3) -> List[SearchResu
             'b': ''
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=data) as response:
-                if response.status == 200:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, 'html.parser')
-                    results = []
-
-                    # Find all search results
-                    for result in soup.find_all('div', class_='result'):
-                        try:
-                            # Get title and link
-                            a_tag = result.find('a', class_='result__a')
-                            if not a_tag:
-                                continue
-
-                            title = a_tag.get_text(strip=True)
-                            url = a_tag.get('href', '')
-
-                            # Get snippet
-                            snippet_div = result.find('a', class_='result__snippet')
-                            snippet = snippet_div.get_text(strip=True) if snippet_div else ""
-
-                            if title and url:
-                                # Clean up URL if needed
-                                if url.startswith('/'):
-                                    url = f"https://duckduckgo.com{url}"
-
-                                results.append(SearchResult(title, url, snippet))
-                                if len(results) >= max_results:
-                                    break
-
-                        except Exception as e:
-                            logger.error(f"Error processing result: {str(e)}")
-                            continue
+        response = await web_client.post(url, data, headers=headers)
+        if response.status == 200:
+            html = response.text
+            soup = BeautifulSoup(html, 'html.parser')
+            results = []
+
+            # Find all search results
+            for result in soup.find_all('div', class_='result'):
+                try:
+                    # Get title and link
+                    a_tag = result.find('a', class_='result__a')
+                    if not a_tag:
+                        continue
 
-                    # If no results found with primary method, try alternative parsing
-                    if not results:
-                        logger.info("Trying alternative parsing method...")
-                        for link in soup.find_all('a'):
-                            href = link.get('href', '')
-                            if (href.startswith('http') and
-                                not href.startswith('https://duckduckgo.com') and
-                                not href.startswith('https://html.duckduckgo.com')):
-
-                                title = link.get_text(strip=True)
-                                if title and len(results) < max_results:
-                                    results.append(SearchResult(
-                                        title=title,
-                                        url=href,
-                                        snippet=""
-                                    ))
-
-                    # Log the results for debugging
-                    logger.info(f"Found {len(results)} results for query: {query}")
-                    for r in results:
-                        logger.info(f"Title: {r.title[:30]}... URL: {r.url[:50]}...")
-
-                    return results
-                else:
-                    logger.error(f"Search request failed with status: {response.status}")
-                    return []
+                    title = a_tag.get_text(strip=True)
+                    url = a_tag.get('href', '')
 
-    except Exception as e:
-        logger.error(f"Search error: {str(e)}")
-        return []
+                    # Get snippet
+                    snippet_div = result.find('a', class_='result__snippet')
+                    snippet = snippet_div.get_text(strip=True) if snippet_div else ""
 
-    return []
+                    if title and url:
+                        # Clean up URL if needed
+                        if url.startswith('/'):
+                            url = f"https://duckduckgo.com{url}"
 
+                        results.append(SearchResult(title, url, snippet))
+                        if len(results) >= max_results:
+                            break
 
-async def fetch_webpage_content(url: str) -> str:
-    try:
-        timeout = aiohttp.ClientTimeout(total=30.0)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(
-                url,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                }
-            ) as response:
-                if response.status != 200:
-                    return ""
+                except Exception as e:
+                    logger.error(f"Error processing result: {str(e)}")
+                    continue
 
-                html = await response.text()
-                content_extractor = ContentExtractor()
-                extracted_content = await content_extractor.extract_content(html, url)
+            # If no results found with primary method, try alternative parsing
+            if not results:
+                logger.info("Trying alternative parsing method...")
+                for link in soup.find_all('a'):
+                    href = link.get('href', '')
+                    if (href.startswith('http') and
+                        not href.startswith('https://duckduckgo.com') and
+                        not href.startswith('https://html.duckduckgo.com')):
+
+                        title = link.get_text(strip=True)
+                        if title and len(results) < max_results:
+                            results.append(SearchResult(
+                                title=title,
+                                url=href,
+                                snippet=""
+                            ))
+
+            # Log the results for debugging
+            logger.info(f"Found {len(results)} results for query: {query}")
+            for r in results:
+                logger.info(f"Title: {r.title[:30]}... URL: {r.url[:50]}...")
+
+            return results
+        else:
+            logger.error(f"Search request failed with status: {response.status}")
+            if raise_on_error:
+                raise SearchUnavailable(f"status {response.status}")
+            return []
 
-                # Combine relevant content
-                final_content = []
+    except Exception as e:
+        logger.error(f"Search error: {str(e)}")
+        if raise_on_error:
+            raise
+        return []
+
+    return []
 
-                if extracted_content['title']:
-                    final_content.append(f"Title: {extracted_content['title']}")
 
-                if extracted_content['metadata'].get('description'):
-                    final_content.append(f"\nDescription: {extracted_content['metadata']['description']}")
+async def fetch_webpage_content(
+    url: str,
+    extraction_pool: Optional[ExtractionPool] = None,
+    web_client: Optional[WebClient] = None,
+    page_cache: Optional[PageCache] = None
+) -> str:
+    if web_client is None:
+        async with WebClient() as client:
+            return await fetch_webpage_content(url, extraction_pool, client, page_cache)
 
-                if extracted_content['main_content']:
-                    final_content.append(f"\nContent:\n{extracted_content['main_content']}")
+    cached = await page_cache.get(url) if page_cache else None
+    if cached and page_cache.is_fresh(cached):
+        page_cache.hits += 1
+        return cached.content
 
-                return '\n'.join(final_content)
+    try:
+        # Revalidate a stale copy: a 304 costs no download and no extraction
+        response = await web_client.get(url, cached.conditional_headers() if cached else None)
+        if response.status == 304 and cached:
+            page_cache.revalidated += 1
+            await page_cache.touch(url)
+            return cached.content
+        if page_cache:
+            page_cache.misses += 1
+
+        if response.status != 200:
+            return ""
+
+        html = response.text
+        # Parsing is CPU-bound: keep it off the event loop
+        if extraction_pool:
+            extracted_content = await extraction_pool.extract(html, url)
+        else:
+            extracted_content = await ContentExtractor().extract_content(html, url)
+        if not extracted_content:
+            return ""
+
+        # Combine relevant content
+        final_content = []
+
+        if extracted_content['title']:
+            final_content.append(f"Title: {extracted_content['title']}")
+
+        if extracted_content['metadata'].get('description'):
+            final_content.append(f"\nDescription: {extracted_content['metadata']['description']}")
+
+        if extracted_content['main_content']:
+            final_content.append(f"\nContent:\n{extracted_content['main_content']}")
+
+        content = '\n'.join(final_content)
+        headers = {name.lower(): value for name, value in response.headers.items()}
+        if page_cache and content and 'no-store' not in headers.get('cache-control', ''):
+            await page_cache.put(url, content, headers.get('etag'), headers.get('last-modified'))
+        return content
+    except DownloadRejected:
+        # Not a readable page (wrong type, too large or too slow); already logged
+        return ""
     except Exception as e:
         logger.error(f"Error fetching webpage {url}: {str(e)}")
+        if cached:
+            # The origin is unreachable: a stale copy beats no copy
+            page_cache.stale_served += 1
+            return cached.content
         return ""
 
-async def summarize_search_results(llm_client, query: str, results: List[SearchResult]) -> List[Dict]:
-    summaries = []
+async def summarize_search_results(
+    llm_client,
+    query: str,
+    results: List[SearchResult],
+    extraction_pool: Optional[ExtractionPool] = None,
+    max_concurrency: int = 3,
+    web_client: Optional[WebClient] = None,
+    passage_chars: int = 800,
+    source_context_tokens: int = 400,
+    passage_wait: float = 1.0
+) -> List[Dict]:
+    slots = asyncio.Semaphore(max(1, max_concurrency))
+    corpus = PassageCorpus(query, passage_chars, passage_wait)
     for result in results:
-        try:
-            content = await fetch_webpage_content(result.url)
-            if content:
-                prompt = f"""Summarize this content (max 3 sentences) in relation to: "{query}"
-                Content: {content[:1500]}"""
+        corpus.expect(result.url)
+    corpus.seal()
+
+    async def fetch(result: SearchResult) -> str:
+        content = ""
+        async with slots:
+            try:
+                content = await fetch_webpage_content(result.url, extraction_pool, web_client)
+            except Exception as e:
+                logger.error(f"Error fetching result: {str(e)}")
+            finally:
+                corpus.add(result.url, content)
+        return content
+
+    async def summarize(result: SearchResult) -> Optional[Dict]:
+        # Each page is summarized once it is in, ranked against the pages fetched by then
+        content = await fetch(result)
+        if not content:
+            return None
+        async with slots:
+            try:
+                excerpts = await corpus.select(result.url, source_context_tokens, llm_client.count_tokens)
+                prompt = f'Summarize this content (max 3 sentences) in relation to: "{query}"\n\nContent:\n{excerpts}'
 
                 summary = await llm_client.complete(prompt)
-                summaries.append({
+                return {
                     "title": result.title,
                     "url": result.url,
                     "summary": summary
-                })
-        except Exception as e:
-            logger.error(f"Error summarizing result: {str(e)}")
-            continue
+                }
+            except Exception as e:
+                logger.error(f"Error summarizing result: {str(e)}")
+            return None
 
-    return summaries
+    # Results keep their original order
+    summaries = await asyncio.gather(*[summarize(result) for result in results])
+    return [summary for summary in summaries if summary]
 
-async def retry_with_backoff(func, *args,  max_retries=3, initial_delay=1, **kwargs):
-    """Retry a function with exponential backoff"""
+async def retry_with_backoff(func, *args,  max_retries=3, initial_delay=1, raise_on_failure=False, **kwargs):
+    """Retry a function with exponential backoff; [] (or the last error) once retries run out"""
     delay = initial_delay
     last_exception = None
 
@@ -207,40 +296,52 @@ async def retry_with_backoff(func, *args,  max_retries=3, initial_delay=1, **kwa
             delay *= 2
 
     logger.error(f"All retries failed: {str(last_exception)}")
+    if raise_on_failure:
+        raise last_exception
     return []
 
 class WebSearchEnhancer:
-    def __init__(self, llm_client, max_tokens_per_chunk=4096):
+    def __init__(
+        self,
+        llm_client,
+        max_tokens_per_chunk=4096,
+        extraction_pool: Optional[ExtractionPool] = None,
+        max_concurrent_searches: int = 3,
+        max_concurrent_fetches: int = 6,
+        max_concurrent_summaries: int = 1,
+        web_client: Optional[WebClient] = None,
+        page_cache: Optional[PageCache] = None,
+        search_cache: Optional[SearchCache] = None,
+        triage: Optional[SnippetTriage] = None,
+        passage_chars: int = 800,
+        source_context_tokens: int = 1500,
+        passage_wait: float = 1.0
+    ):
         self.llm_client = llm_client
+        self.extraction_pool = extraction_pool
+        # Without a shared client every search and fetch opens its own session
+        self.web_client = web_client
         self.max_tokens_per_chunk = max_tokens_per_chunk
-        self.max_content_length = 100000
         self.search_config = {
             "max_queries": 3,
             "max_results_per_query": 3,
             "max_retries": 2,
-            "initial_delay": 1
+            "initial_delay": 1,
+            "max_concurrent_searches": max(1, max_concurrent_searches),
+            "max_concurrent_fetches": max(1, max_concurrent_fetches),
+            # Each source goes into its summary prompt as its best passages within this budget
+            "passage_chars": passage_chars,
+            "source_context_tokens": source_context_tokens,
+            # How long a fetched page waits for the others before its passages are ranked
+            "passage_wait": passage_wait
         }
-        # Cache for webpage content with 1-hour TTL
-        self.content_cache = TTLCache(maxsize=100, ttl=3600)
-
-    async def calculate_relevance_score(self, content: str, query: str) -> float:
-        """Calculate relevance score between content and query."""
-        # Simple TF-IDF-like scoring
-        query_terms = set(query.lower().split())
-        content_lower = content.lower()
-
-        # Calculate term frequency
-        term_freq = sum(content_lower.count(term) for term in query_terms)
-
-        # Normalize by content length
-        score = term_freq / (len(content_lower.split()) + 1)
-
-        # Boost if query terms appear in first paragraph
-        first_para = content_lower.split('\n')[0]
-        if any(term in first_para for term in query_terms):
-            score *= 1.5
-
-        return score
+        # Shared by all requests: summaries compete for the same llama-server
+        self.summary_slots = asyncio.Semaphore(max(1, max_concurrent_summaries))
+        # Persistent page cache shared with other workers; None fetches every time
+        self.page_cache = page_cache
+        self.search_cache = search_cache
+        # Without triage every search hit is fetched and summarized
+        self.triage = triage
 
     def extract_structured_info(self, content: str) -> Dict[str, any]:
         """Extract structured information from content."""
@@ -267,21 +368,29 @@ class WebSearchEnhancer:
         return info
 
     async def process_search_results(self, results: List[Dict], query: str) -> List[Dict]:
-        """Process search results in parallel with relevance scoring."""
+        """Process search results in parallel, scoring pages by their best BM25 passage."""
+        corpus = PassageCorpus(query, self.search_config["passage_chars"], self.search_config["passage_wait"])
+        for result in results:
+            corpus.expect(result.url)
+        corpus.seal()
+
         async def process_result(result):
+            content = ""
             try:
-                if result.url in self.content_cache:
-                    content = self.content_cache[result.url]
-                else:
-                    content = await fetch_webpage_content(result.url)
-                    if content:
-                        self.content_cache[result.url] = content
+                try:
+                    content = await fetch_webpage_content(
+                        result.url, self.extraction_pool, self.web_client, self.page_cache
+                    )
+                finally:
+                    corpus.add(result.url, content)
 
                 if not content:
                     return None
 
-                # Calculate relevance score
-                relevance = await self.calculate_relevance_score(content, query)
+                relevance = await corpus.page_score(result.url)
+                excerpts = await corpus.select(
+                    result.url, self.search_config["source_context_tokens"], self.llm_client.count_tokens
+                )
 
                 # Extract structured information
                 structured_info = self.extract_structured_info(content)
@@ -290,6 +399,7 @@ class WebSearchEnhancer:
                     "url": result.url,
                     "title": result.title,
                     "content": content,
+                    "excerpts": excerpts,
                     "relevance": relevance,
                     "structured_info": structured_info,
                     "domain": urlparse(result.url).netloc
@@ -305,6 +415,91 @@ class WebSearchEnhancer:
         valid_results = [r for r in processed_results if r is not None]
         return sorted(valid_results, key=lambda x: x["relevance"], reverse=True)
 
+    async def _search(self, query: str) -> List[SearchResult]:
+        """Search with retries, through the search cache when there is one."""
+        max_results = self.search_config["max_results_per_query"]
+
+        async def fetch(query: str) -> Optional[List[Dict]]:
+            try:
+                results = await retry_with_backoff(
+                    search_duckduckgo,
+                    query,
+                    max_retries=self.search_config["max_retries"],
+                    initial_delay=self.search_config["initial_delay"],
+                    raise_on_failure=True,
+                    max_results=max_results,
+                    web_client=self.web_client,
+                    raise_on_error=True
+                )
+            except Exception:
+                return None
+            return [vars(result) for result in results]
+
+        if self.search_cache:
+            results = await self.search_cache.search(query, fetch, variant=str(max_results))
+        else:
+            results = await fetch(query)
+        return [SearchResult(**result) for result in results or []]
+
+    async def _read_source(
+        self,
+        result: SearchResult,
+        user_query: str,
+        fetch_slots: asyncio.Semaphore,
+        corpus: PassageCorpus,
+        output: asyncio.Queue
+    ):
+        """Fetch one page and stream its summary into `output`.
+
+        Puts whether the page had content first, then the summary chunks, then
+        None once the source is finished (also after errors). The summary starts
+        once `corpus` holds every page, or after its `max_wait` with the pages
+        fetched by then.
+        """
+        content = ""
+        try:
+            try:
+                async with fetch_slots:
+                    content = await fetch_webpage_content(result.url, self.extraction_pool, self.web_client, self.page_cache)
+            finally:
+                corpus.add(result.url, content)
+            await output.put(bool(content))
+            if not content:
+                return
+
+            excerpts = await corpus.select(
+                result.url, self.search_config["source_context_tokens"], self.llm_client.count_tokens
+            )
+            # Fixed instructions first, the page's excerpts last
+            summary_prompt = "\n".join([
+                f'Summarize this content about "{user_query}".',
+                "Write in Markdown format with proper sections and formatting.",
+                "",
+                "Requirements:",
+                "- Use proper Markdown headings (##, ###)",
+                "- Break into clear sections",
+                "- Use bullet points where appropriate",
+                "- Maintain proper Markdown formatting",
+                "- Be precise and factual",
+                "- Focus on key information",
+                "",
+                "Content:",
+                excerpts
+            ])
+
+            async with self.summary_slots:
+                async for chunk in self.stream_markdown_content(
+                    self.llm_client.stream_complete(
+                        summary_prompt,
+                        system_prompt="You are a precise research assistant. Format responses in clear, well-structured Markdown."
+                    )
+                ):
+                    await output.put(chunk)
+        except Exception as e:
+            logger.error(f"Error processing result {result.url}: {str(e)}")
+        finally:
+            output.put_nowait(None)
+
     async def enhance_response(self, user_query: str, context: list = None) -> AsyncGenerator[str, None]:
         try:
             yield "*🔍 Initiating web search...*\n\n"
@@ -313,39 +508,80 @@ class WebSearchEnhancer:
             search_queries = await generate_search_queries(self.llm_client, user_query)
             for query in search_queries:
                 yield f"- `{query}`\n"
-                await asyncio.sleep(0.05)
 
             yield "\n"
 
             all_references = []
-            processed_urls = set()
+            listed_urls = set()
+            search_slots = asyncio.Semaphore(self.search_config["max_concurrent_searches"])
+            fetch_slots = asyncio.Semaphore(self.search_config["max_concurrent_fetches"])
+            sources: Dict[str, asyncio.Queue] = {}
+            tasks: List[asyncio.Task] = []
+            corpus = PassageCorpus(user_query, self.search_config["passage_chars"], self.search_config["passage_wait"])
+
+            def start_sources(results: List[SearchResult]):
+                # Fetching and summarizing begin as soon as any search returns
+                for result in results:
+                    if result.url not in sources:
+                        sources[result.url] = asyncio.Queue()
+                        corpus.expect(result.url)
+                        tasks.append(asyncio.create_task(
+                            self._read_source(result, user_query, fetch_slots, corpus, sources[result.url])
+                        ))
+
+            async def run_search(query: str) -> List[SearchResult]:
+                async with search_slots:
+                    results = await self._search(query)
+                if self.triage is None:
+                    start_sources(results)
+                return results
+
+            async def select_sources():
+                try:
+                    found = await asyncio.gather(*searches)
+                    if self.triage is not None:
+                        # One batched triage over every distinct hit, once all searches are back
+                        candidates: Dict[str, SearchResult] = {}
+                        for results in found:
+                            for result in results:
+                                candidates.setdefault(result.url, result)
+                        start_sources(await self.triage.select(user_query, list(candidates.values())))
+                finally:
+                    # Every source is known: summaries can start once their pages are in
+                    corpus.seal()
+
+            search_queries = search_queries[:self.search_config["max_queries"]]
+            searches = [asyncio.create_task(run_search(query)) for query in search_queries]
+            tasks.extend(searches)
+            selection = asyncio.create_task(select_sources())
+            tasks.append(selection)
 
-            for query in search_queries[:3]:
-                yield f"*🌐 Searching: {query}*\n"
-                await asyncio.sleep(0.2)
+            try:
+                # Everything runs concurrently; output follows query order, then result rank
+                for query, search in zip(search_queries, searches):
+                    yield f"*🌐 Searching: {query}*\n"
 
-                results = await retry_with_backoff(
-                    search_duckduckgo,
-                    query,
-                    max_retries=2,
-                    initial_delay=1,
-                    max_results=3
-                )
+                    results = await search
+                    if not results:
+                        yield f"No results found for this query.\n"
+                        continue
 
-                if not results:
-                    yield f"No results found for this query.\n"
-                    continue
+                    for result in results:
+                        if result.url in listed_urls:
+                            continue
 
-                for result in results:
-                    if result.url in processed_urls:
-                        continue
+                        listed_urls.add(result.url)
+                        if self.triage is not None:
+                            await selection
+                        source = sources.get(result.url)
+                        if source is None:
+                            # Title and snippet did not match the question
+                            continue
 
-                    processed_urls.add(result.url)
-                    yield f"*📄 Reading:* [{result.title}]({result.url})\n"
+                        yield f"*📄 Reading:* [{result.title}]({result.url})\n"
 
-                    try:
-                        content = await fetch_webpage_content(result.url)
-                        if not content:
+                        # The first item says whether the page had content; None ends the source
+                        if not await source.get():
                             continue
 
                         ref_id = len(all_references) + 1
@@ -357,84 +593,33 @@ class WebSearchEnhancer:
 
                         yield f"\n*💡 Key information [{ref_id}]:*\n"
 
-                        summary_prompt = f"""Summarize this content about "{user_query}".
-                        Write in Markdown format with proper sections and formatting.
-
-                        Requirements:
-                        - Use proper Markdown headings (##, ###)
-                        - Break into clear sections
-                        - Use bullet points where appropriate
-                        - Maintain proper Markdown formatting
-                        - Be precise and factual
-                        - Focus on key information"""
-
-                        # Stream by Markdown blocks
-                        buffer = ""
-                        markdown_block = ""
-
-                        async for chunk in self.stream_markdown_content(
-                            self.llm_client.stream_complete(
-                                summary_prompt,
-                                system_prompt="You are a precise research assistant. Format responses in clear, well-structured Markdown."
-                            )
-                        ):
+                        # Already split into whole Markdown blocks by _read_source
+                        while (chunk := await source.get()) is not None:
                             yield chunk
 
-                            # Look for complete Markdown blocks or sentences
-                            while True:
-                                # Check for Markdown headings
-                                heading_match = re.search(r'^(#{1,6}[^#\n]+)\n', buffer)
-                                if heading_match:
-                                    end = heading_match.end()
-                                    yield buffer[:end]
-                                    buffer = buffer[end:]
-                                    continue
-
-                                # Check for bullet points
-                                bullet_match = re.search(r'^([*-]\s+[^\n]+)\n', buffer)
-                                if bullet_match:
-                                    end = bullet_match.end()
-                                    yield buffer[:end]
-                                    buffer = buffer[end:]
-                                    continue
-
-                                # Check for complete sentences
-                                sentence_match = re.search(r'([.!?])\s+(?=[A-Z])', buffer)
-                                if sentence_match:
-                                    end = sentence_match.end()
-                                    yield buffer[:end]
-                                    buffer = buffer[end:]
-                                    continue
-
-                                break
-
-                            await asyncio.sleep(0.02)
-
-                        if buffer:  # Flush remaining content
-                            yield buffer
-
                         yield "\n\n"
-
-                    except Exception as e:
-                        logger.error(f"Error processing result: {str(e)}")
-                        continue
+            finally:
+                # The client may disconnect mid-answer: stop fetches and summaries still running
+                for task in tasks:
+                    task.cancel()
 
             if all_references:
                 yield "\n*🎯 Final Analysis:*\n"
 
-                conclusion_prompt = f"""Provide a comprehensive answer about "{user_query}" based on the gathered information.
-                Write in Markdown format with proper sections.
-
-                Requirements:
-                - Use proper Markdown headings
-                - Break into clear sections
-                - Use bullet points where appropriate
-                - Cite sources using [n]
-                - Maintain proper formatting
-                - Be clear and precise"""
+                conclusion_prompt = "\n".join([
+                    f'Provide a comprehensive answer about "{user_query}" based on the gathered information.',
+                    "Write in Markdown format with proper sections.",
+                    "",
+                    "Requirements:",
+                    "- Use proper Markdown headings",
+                    "- Break into clear sections",
+                    "- Use bullet points where appropriate",
+                    "- Cite sources using [n]",
+                    "- Maintain proper formatting",
+                    "- Be clear and precise"
+                ])
 
                 # Stream by Markdown blocks
-                buffer = ""
                 async for chunk in self.stream_markdown_content(
                     self.llm_client.stream_complete(
                         conclusion_prompt,
@@ -443,44 +628,10 @@ class WebSearchEnhancer:
                 ):
                     yield chunk
 
-                    # Look for complete Markdown blocks or sentences
-                    while True:
-                        # Check for Markdown headings
-                        heading_match = re.search(r'^(#{1,6}[^#\n]+)\n', buffer)
-                        if heading_match:
-                            end = heading_match.end()
-                            yield buffer[:end]
-                            buffer = buffer[end:]
-                            continue
-
-                        # Check for bullet points
-                        bullet_match = re.search(r'^([*-]\s+[^\n]+)\n', buffer)
-                        if bullet_match:
-                            end = bullet_match.end()
-                            yield buffer[:end]
-                            buffer = buffer[end:]
-                            continue
-
-                        # Check for complete sentences
-                        sentence_match = re.search(r'([.!?])\s+(?=[A-Z])', buffer)
-                        if sentence_match:
-                            end = sentence_match.end()
-                            yield buffer[:end]
-                            buffer = buffer[end:]
-                            continue
-
-                        break
-
-                    await asyncio.sleep(0.02)
-
-                if buffer:
-                    yield buffer
-
                 # Add references
                 yield "\n\n---\n*📚 Sources:*\n"
                 for ref in all_references:
                     yield f"[{ref['id']}] [{ref['title']}]({ref['url']})\n"
-                    await asyncio.sleep(0.1)
             else:
                 yield "\n\n*⚠️ No relevant information found. Try rephrasing your question.*"
 
@@ -490,80 +641,84 @@ class WebSearchEnhancer:
 
     def create_summary_prompt(self, query: str, result: Dict) -> str:
         """Create an optimized summary prompt using structured information."""
-        return f"""Summarize the relevant information about "{query}" from this source.
-
-    Content: {result['content'][:self.max_content_length]}
-
-    Key Data Points:
-    - Dates mentioned: {', '.join(result['structured_info']['dates'][:3])}
-    - Key statistics: {', '.join(result['structured_info']['numbers'][:3])}
-    - Important points: {'; '.join(result['structured_info']['key_points'][:3])}
-
-    Format your response with proper Markdown spacing and structure:
-
-    ## Main Topic
-
-    Provide a brief overview here.
-
-    ### Key Points
-
-    - First important point
-    - Second important point
-    - Third important point
-
-    ### Details
-
-    Add detailed information here with proper paragraphs.
-
-    Requirements:
-    - Add empty lines between sections
-    - Use proper heading hierarchy
-    - Include bullet points with proper spacing
-    - Format dates and numbers clearly
-    - Use emphasis where appropriate
-    - Start with most important information
-    """
+        info = result['structured_info']
+        # Fixed instructions first, the page's data and excerpts last
+        return "\n".join([
+            f'Summarize the relevant information about "{query}" from this source.',
+            "",
+            "Format your response with proper Markdown spacing and structure:",
+            "",
+            "## Main Topic",
+            "",
+            "Provide a brief overview here.",
+            "",
+            "### Key Points",
+            "",
+            "- First important point",
+            "- Second important point",
+            "- Third important point",
+            "",
+            "### Details",
+            "",
+            "Add detailed information here with proper paragraphs.",
+            "",
+            "Requirements:",
+            "- Add empty lines between sections",
+            "- Use proper heading hierarchy",
+            "- Include bullet points with proper spacing",
+            "- Format dates and numbers clearly",
+            "- Use emphasis where appropriate",
+            "- Start with most important information",
+            "",
+            "Key Data Points:",
+            f"- Dates mentioned: {', '.join(info['dates'][:3])}",
+            f"- Key statistics: {', '.join(info['numbers'][:3])}",
+            f"- Important points: {'; '.join(info['key_points'][:3])}",
+            "",
+            "Content:",
+            result['excerpts']
+        ])
 
     def create_conclusion_prompt(self, query: str, references: List[Dict]) -> str:
         """Create an optimized conclusion prompt using all gathered information."""
-        structured_summary = self.summarize_structured_info(references)
-
-        return f"""Provide a comprehensive answer about "{query}" based on all sources.
-
-    {structured_summary}
-
-    Format your response following this structure:
-
-    ## Overview
-
-    Provide a concise introduction here.
-
-    ### Key Findings
-
-    - Important finding one [n]
-    - Important finding two [n]
-    - Important finding three [n]
-
-    ### Detailed Analysis
-
-    Break down the main points here with proper citations [n].
-
-    ### Additional Context
-
-    Add any relevant context or background information.
-
-    ### Conclusion
-
-    Summarize the key takeaways.
-
-    Requirements:
-    - Add empty lines between sections
-    - Use consistent heading levels
-    - Include proper citations [n]
-    - Use bullet points with spacing
-    - Format dates and numbers clearly
-    - Break paragraphs for readability
-    """
+        return "\n".join([
+            f'Provide a comprehensive answer about "{query}" based on all sources.',
+            "",
+            "Format your response following this structure:",
+            "",
+            "## Overview",
+            "",
+            "Provide a concise introduction here.",
+            "",
+            "### Key Findings",
+            "",
+            "- Important finding one [n]",
+            "- Important finding two [n]",
+            "- Important finding three [n]",
+            "",
+            "### Detailed Analysis",
+            "",
+            "Break down the main points here with proper citations [n].",
+            "",
+            "### Additional Context",
+            "",
+            "Add any relevant context or background information.",
+            "",
+            "### Conclusion",
+            "",
+            "Summarize the key takeaways.",
+            "",
+            "Requirements:",
+            "- Add empty lines between sections",
+            "- Use consistent heading levels",
+            "- Include proper citations [n]",
+            "- Use bullet points with spacing",
+            "- Format dates and numbers clearly",
+            "- Break paragraphs for readability",
+            "",
+            "Gathered information:",
+            self.summarize_structured_info(references)
+        ])
 
     def summarize_structured_info(self, references: List[Dict]) -> str:
         """Summarize structured information from all references."""
@@ -577,11 +732,12 @@ class WebSearchEnhancer:
             all_numbers.extend(info["numbers"])
             all_key_points.extend(info["key_points"])
 
-        return f"""
-- Timeline: {', '.join(sorted(set(all_dates[:5])))}
-- Key Statistics: {', '.join(set(all_numbers[:5]))}
-- Main Points: {'; '.join(set(all_key_points[:3]))}
-- Sources: {', '.join(set(ref['domain'] for ref in references))}"""
+        return "\n".join([
+            f"- Timeline: {', '.join(sorted(set(all_dates[:5])))}",
+            f"- Key Statistics: {', '.join(set(all_numbers[:5]))}",
+            f"- Main Points: {'; '.join(set(all_key_points[:3]))}",
+            f"- Sources: {', '.join(set(ref['domain'] for ref in references))}"
+        ])
 
     def format_references(self, references: List[Dict]) -> str:
         """Format references with additional metadata."""
@@ -590,90 +746,7 @@ class WebSearchEnhancer:
             for ref in references
         )
 
-    async def handle_markdown_streaming(self, buffer: str) -> tuple[str, str]:
-        """Handle markdown streaming with smoother output"""
-        # Handle special Markdown elements first
-        patterns = [
-            # Headers
-            (r'^(#{1,6}\s+[^\n]+)\n', '\n\n'),
-            # Bullet points
-            (r'^([*-]\s+[^\n]+)\n', '\n'),
-            # Code blocks
-            (r'^(```[^\n]*\n[\s\S]*?```)\n', '\n\n'),
-            # Blockquotes
-            (r'^(>\s+[^\n]+)\n', '\n'),
-        ]
-
-        for pattern, spacing in patterns:
-            match = re.search(pattern, buffer)
-            if match:
-                end = match.end()
-                content = buffer[:end] + spacing
-                return content, buffer[end:]
-
-        # If no special elements, try to break at natural points
-        natural_breaks = [
-            # End of sentence followed by space and capital letter
-            r'([.!?])\s+(?=[A-Z])',
-            # Comma followed by space
-            r'(,)\s+',
-            # Natural word breaks
-            r'(\s+)'
-        ]
-
-        for pattern in natural_breaks:
-            match = re.search(pattern, buffer)
-            if match:
-                end = match.end()
-                return buffer[:end], buffer[end:]
-
-        # If buffer is getting too long without breaks, force a break at a space
-        if len(buffer) > 50:  # Adjust this threshold as needed
-            space_idx = buffer.rfind(' ')
-            if space_idx > 0:
-                return buffer[:space_idx+1], buffer[space_idx+1:]
-
-        return "", buffer
-
     async def stream_markdown_content(self, content_generator):
-        """Stream content with smoother output"""
-        buffer = ""
-        last_yield_time = asyncio.get_event_loop().time()
-        min_chunk_size = 10  # Minimum characters to yield
-        max_delay = 0.05  # Maximum time to hold content
-
-        async for chunk in content_generator:
-            buffer += chunk
-            current_time = asyncio.get_event_loop().time()
-
-            # Process buffer if it's long enough or enough time has passed
-            while buffer:
-                output, new_buffer = await self.handle_markdown_streaming(buffer)
-
-                if output:
-                    # For very small chunks, accumulate more unless too much time has passed
-                    if len(output) < min_chunk_size and (current_time - last_yield_time) < max_delay:
-                        buffer = output + new_buffer
-                        continue
-
-                    # Yield the output
-                    yield output
-                    buffer = new_buffer
-                    last_yield_time = current_time
-
-                    # Small delay for natural flow
-                    await asyncio.sleep(0.01)
-                else:
-                    break
-
-            # Don't hold content for too long
-            if buffer and (current_time - last_yield_time) > max_delay:
-                words = buffer.split()
-                if len(words) > 1:
-                    yield words[0] + " "
-                    buffer = " ".join(words[1:])
-                    last_yield_time = current_time
-
-        # Flush any remaining content
-        if buffer:
-            yield buffer
+        """Stream content as complete Markdown blocks (see utils.markdown_stream)"""
+        async for segment in segment_markdown(content_generator):
+            yield segment
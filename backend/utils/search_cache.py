@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_results (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    results TEXT NOT NULL,
+    result_count INTEGER NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_search_results_fetched_at ON search_results (fetched_at);
+"""
+
+# Words, keeping symbols that change the meaning of one ("c++", "c#", "f#", ".net")
+QUERY_TOKEN_RE = re.compile(r"\.?\w+(?:[+#]+|\.\w+)*", re.UNICODE)
+
+# Only articles and filler: unlike the BM25 list this keeps negations and question
+# words, so "when"/"where" or "working"/"not working" stay different searches
+QUERY_STOPWORDS = frozenset("a an the of please".split())
+
+def normalize_query(query: str) -> str:
+    """Case, width, punctuation, whitespace and filler words do not change the key."""
+    tokens = QUERY_TOKEN_RE.findall(unicodedata.normalize("NFKC", query).lower())
+    # A query made only of filler ("the the") keeps it
+    return " ".join([token for token in tokens if token not in QUERY_STOPWORDS] or tokens)
+
+# Bumped whenever normalize_query changes, so entries stored under older keys are never served
+KEY_VERSION = 2
+
+SearchFetch = Callable[[str], Awaitable[Optional[List[Dict]]]]
+
+class SearchCache:
+    """Search results by normalized query, persisted in SQLite and shared by workers.
+
+    Results younger than `ttl` are served directly. For `stale_seconds` after
+    that they are still served at once while a background search refreshes
+    them (stale-while-revalidate). Queries that returned nothing are
+    remembered for `negative_ttl`. Failed searches are never cached, so a
+    throttled search engine does not turn into "no results".
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        ttl: float = 1800,
+        stale_seconds: float = 86400,
+        negative_ttl: float = 300
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.negative_ttl = negative_ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.refreshing: Dict[str, asyncio.Task] = {}
+
+        # Metrics (this process only)
+        self.hits = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SEARCH_CACHE_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def close(self):
+        for task in list(self.refreshing.values()):
+            task.cancel()
+        await asyncio.gather(*self.refreshing.values(), return_exceptions=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _get(self, key: str) -> Optional[Tuple[List[Dict], float]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT results, fetched_at FROM search_results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _put(self, key: str, query: str, results: List[Dict]):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, query, results, result_count, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, query, json.dumps(results), len(results), now)
+            )
+            # Nothing older than the stale window can be served again
+            conn.execute(
+                "DELETE FROM search_results WHERE fetched_at < ?",
+                (now - max(self.ttl + self.stale_seconds, self.negative_ttl),)
+            )
+
+    async def _store(self, key: str, query: str, results: List[Dict]):
+        try:
+            await asyncio.to_thread(self._put, key, query, results)
+        except sqlite3.Error as e:
+            logger.error(f"Search cache write failed for {query!r}: {str(e)}")
+
+    async def _fetch(self, key: str, query: str, fetch: SearchFetch) -> Optional[List[Dict]]:
+        results = await fetch(query)
+        if results is None:
+            self.failures += 1
+        else:
+            await self._store(key, query, results)
+        return results
+
+    def _refresh(self, key: str, query: str, fetch: SearchFetch):
+        if key in self.refreshing:
+            return
+        self.refreshes += 1
+        task = asyncio.create_task(self._fetch(key, query, fetch))
+        self.refreshing[key] = task
+        task.add_done_callback(lambda _: self.refreshing.pop(key, None))
+
+    async def search(self, query: str, fetch: SearchFetch, variant: str = "") -> Optional[List[Dict]]:
+        """Cached results for `query`, calling `fetch(query)` when needed.
+
+        `fetch` returns a list of JSON-serializable results, or None when the
+        search failed. `variant` separates cache entries for the same query
+        searched with different options (e.g. the number of results).
+        """
+        key = f"{KEY_VERSION}:{variant}:{normalize_query(query)}"
+        try:
+            cached = await asyncio.to_thread(self._get, key)
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Search cache read failed for {query!r}: {str(e)}")
+            cached = None
+
+        if cached is not None:
+            results, fetched_at = cached
+            age = time.time() - fetched_at
+            if not results:
+                if age < self.negative_ttl:
+                    self.negative_hits += 1
+                    return results
+            elif age < self.ttl:
+                self.hits += 1
+                return results
+            elif age < self.ttl + self.stale_seconds:
+                self.stale_hits += 1
+                self._refresh(key, query, fetch)
+                return results
+
+        self.misses += 1
+        return await self._fetch(key, query, fetch)
+
+    def get_stats(self) -> Dict:
+        try:
+            with self._lock:
+                entries = self._connect().execute("SELECT COUNT(*) FROM search_results").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        lookups = self.hits + self.stale_hits + self.negative_hits + self.misses
+        return {
+            "entries": entries,
+            "ttl": self.ttl,
+            "stale_seconds": self.stale_seconds,
+            "negative_ttl": self.negative_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits + self.negative_hits) / lookups, 3) if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "refreshing": len(self.refreshing),
+            "failures": self.failures
+        }
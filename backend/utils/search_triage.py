@@ -0,0 +1,107 @@
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from .bm25 import BM25Index, tokenize
+
+logger = logging.getLogger(__name__)
+
+# BM25 scores are positive exactly when a snippet shares a word with the question
+BM25_MIN_SCORE = 1e-6
+
+class SnippetTriage:
+    """Decides which search hits are worth fetching, from their title and snippet alone.
+
+    All hits of a question are scored against it in one batch: by cosine
+    similarity of llama-server embeddings, or with BM25 over the snippets when
+    the server cannot embed. Only the best `max_sources` scoring at least
+    `min_similarity` (embeddings) or sharing a word with the question (BM25)
+    are fetched; every other hit saves a download, an extraction and a summary.
+    """
+
+    def __init__(
+        self,
+        llm_client,
+        max_sources: int = 4,
+        min_similarity: float = 0.2,
+        use_embeddings: bool = True,
+        max_chars: int = 500
+    ):
+        self.llm_client = llm_client
+        self.max_sources = max_sources
+        self.min_similarity = min_similarity
+        self.use_embeddings = use_embeddings
+        self.max_chars = max_chars
+
+        # Metrics
+        self.batches = 0
+        self.embedding_batches = 0
+        self.bm25_batches = 0
+        self.embedding_failures = 0
+        self.kept = 0
+        self.skipped = 0
+
+    @staticmethod
+    def _text(result) -> str:
+        return f"{result.title}\n{result.snippet}"
+
+    async def _embedding_scores(self, query: str, texts: List[str]) -> Optional[np.ndarray]:
+        try:
+            vectors = await self.llm_client.embed([query[:self.max_chars]] + [text[:self.max_chars] or " " for text in texts])
+        except Exception as e:
+            self.embedding_failures += 1
+            logger.info(f"Snippet embeddings unavailable, ranking with BM25: {str(e)}")
+            return None
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.maximum(norms, 1e-12)
+        return matrix[1:] @ matrix[0]
+
+    @staticmethod
+    def _bm25_scores(query_tokens: List[str], texts: List[str]) -> np.ndarray:
+        index = BM25Index([tokenize(text) for text in texts])
+        return np.asarray(index.scores(query_tokens), dtype=np.float32)
+
+    async def score(self, query: str, results: Sequence) -> Tuple[np.ndarray, float]:
+        """Score of every result and the minimum score worth fetching."""
+        texts = [self._text(result) for result in results]
+        if self.use_embeddings:
+            scores = await self._embedding_scores(query, texts)
+            if scores is not None:
+                self.embedding_batches += 1
+                return scores, self.min_similarity
+        self.bm25_batches += 1
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            # Nothing to match on (only stop words): keep the search engine's ranking
+            return np.zeros(len(texts), dtype=np.float32), 0.0
+        scores = self._bm25_scores(query_tokens, texts)
+        return scores, BM25_MIN_SCORE
+
+    async def select(self, query: str, results: Sequence) -> List:
+        """The results worth fetching, best first."""
+        if not results:
+            return []
+        self.batches += 1
+        scores, threshold = await self.score(query, results)
+        # Stable sort: equal scores keep the search engine's order
+        order = np.argsort(-scores, kind="stable")
+        selected = [results[i] for i in order[:self.max_sources] if scores[i] >= threshold]
+        self.kept += len(selected)
+        self.skipped += len(results) - len(selected)
+        logger.info(f"Fetching {len(selected)} of {len(results)} search results for {query!r}")
+        return selected
+
+    def get_stats(self) -> Dict:
+        total = self.kept + self.skipped
+        return {
+            "max_sources": self.max_sources,
+            "min_similarity": self.min_similarity,
+            "batches": self.batches,
+            "embedding_batches": self.embedding_batches,
+            "bm25_batches": self.bm25_batches,
+            "embedding_failures": self.embedding_failures,
+            "kept": self.kept,
+            "skipped": self.skipped,
+            "skip_rate": round(self.skipped / total, 3) if total else 0.0
+        }
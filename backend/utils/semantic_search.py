@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select, tuple_
+
+from db_models import Artifact, Conversation
+from .vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+class SemanticIndexer:
+    """Background stage that embeds new conversations and artifacts into a VectorIndex.
+
+    Conversations are picked up by id above a high-water mark stored with the
+    index, artifacts by (created_at, id) above theirs. Vectors from
+    different models are not comparable, so the index starts over whenever
+    the loaded model changes.
+    """
+
+    def __init__(
+        self,
+        llm_client,
+        session_factory: Callable,
+        artifact_store,
+        index: VectorIndex,
+        current_model: Callable[[], Optional[str]],
+        batch_size: int = 32,
+        max_chars: int = 2000,
+        interval: float = 30.0
+    ):
+        self.llm_client = llm_client
+        self.session_factory = session_factory
+        self.artifact_store = artifact_store
+        self.index = index
+        self.current_model = current_model
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.interval = interval
+
+        self.wakeup = asyncio.Event()
+        self.worker: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.embedded = 0
+        self.failures = 0
+
+    async def start(self):
+        if self.worker is None:
+            self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def notify(self, *args):
+        """Something new was written; index it soon."""
+        self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Semantic indexing failed: {str(e)}")
+
+    def _ensure_model(self) -> bool:
+        model = self.current_model()
+        if not model:
+            return False
+        if self.index.model != model:
+            logger.info(f"Embedding model changed to {model}, rebuilding semantic index")
+            self.index.reset(model)
+        return True
+
+    async def _append(self, keys: List[str], texts: List[str], state: Optional[Dict] = None):
+        vectors = await self.llm_client.embed([text[:self.max_chars] or " " for text in texts])
+        await asyncio.to_thread(self.index.append, keys, vectors, state)
+        self.embedded += len(keys)
+
+    async def sync(self):
+        """Embed everything written since the last pass."""
+        if not self._ensure_model():
+            return
+        while await self._sync_conversations():
+            pass
+        while await self._sync_artifacts():
+            pass
+
+    async def _sync_conversations(self) -> bool:
+        last_id = self.index.state.get("conversation_id", 0)
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(Conversation.id, Conversation.user_input, Conversation.ai_response, Conversation.status)
+                .where(Conversation.id > last_id)
+                .order_by(Conversation.id)
+                .limit(self.batch_size)
+            )).all()
+
+        # Stop at a turn that is still streaming so the high-water mark never skips it
+        ready = []
+        for row in rows:
+            if row.status == "streaming":
+                break
+            ready.append(row)
+        if not ready:
+            return False
+
+        await self._append(
+            [f"conversation:{row.id}" for row in ready],
+            [f"{row.user_input}\n{row.ai_response}" for row in ready],
+            state={"conversation_id": ready[-1].id}
+        )
+        return len(ready) == self.batch_size
+
+    async def _sync_artifacts(self) -> bool:
+        mark = self.index.state.get("artifact_mark")  # [created_at, id] of the last artifact embedded
+        query = select(Artifact.id, Artifact.title, Artifact.content_hash, Artifact.created_at).where(
+            Artifact.content_hash.is_not(None)
+        )
+        if mark:
+            query = query.where(
+                tuple_(Artifact.created_at, Artifact.id) > tuple_(datetime.fromisoformat(mark[0]), mark[1])
+            )
+        else:
+            # Indexes from before the mark existed: skip what they already hold
+            indexed = await asyncio.to_thread(self.index.keys_with_prefix, "artifact:")
+
+        # Read phase; the connection is released before the embedding calls
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                query.order_by(Artifact.created_at, Artifact.id).limit(self.batch_size)
+            )).all()
+            keys, texts = [], []
+            for art in rows:
+                if not mark and f"artifact:{art.id}" in indexed:
+                    continue
+                blob = await self.artifact_store.get_blob(db, art.content_hash)
+                head = b"".join(self.artifact_store.iter_content(blob, 0, self.max_chars * 4)) if blob else b""
+                keys.append(f"artifact:{art.id}")
+                texts.append(f"{art.title}\n{head.decode('utf-8', errors='ignore')}")
+
+        if not rows:
+            return False
+        state = {"artifact_mark": [rows[-1].created_at.isoformat(), rows[-1].id]}
+        if keys:
+            await self._append(keys, texts, state=state)
+        else:
+            await asyncio.to_thread(self.index.append, [], [], state)
+        return len(rows) == self.batch_size
+
+    async def search(self, query: str, limit: int = 10, kind: Optional[str] = None) -> List[Tuple[str, str, float]]:
+        """Top matches as (kind, id, score)."""
+        if not self._ensure_model():
+            return []
+        vector = (await self.llm_client.embed([query[:self.max_chars]]))[0]
+        hits = await asyncio.to_thread(self.index.search, vector, limit, f"{kind}:" if kind else None)
+        results = []
+        for key, score in hits:
+            hit_kind, _, hit_id = key.partition(":")
+            results.append((hit_kind, hit_id, score))
+        return results
+
+    def get_stats(self):
+        return {
+            **self.index.get_stats(),
+            "embedded": self.embedded,
+            "failures": self.failures,
+            "running": self.worker is not None and not self.worker.done()
+        }
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+class SlotAffinity:
+    """Pins chat sessions to llama-server slots so follow-up turns reuse the cached prompt prefix.
+
+    Each slot holds the KV cache of the last prompt it evaluated. Sending a
+    session's turns to the same slot (`id_slot` + `cache_prompt`) lets the
+    server skip re-evaluating the shared system prompt and history. When all
+    slots are taken, the least recently used session loses its slot.
+
+    Background prompts (summaries, compaction, search queries) borrow a
+    `scratch_slot()` instead of letting the server pick one, so they only take
+    slots that are idle and the map knows whose cached prefix they overwrite.
+    One idle slot is always left for chat when there are several.
+    """
+
+    def __init__(self, n_slots: int = 1):
+        self.released = asyncio.Event()
+        self.reset(n_slots)
+
+    def reset(self, n_slots: Optional[int] = None):
+        """Drop all assignments, e.g. after the server restarts with a new model."""
+        if n_slots is not None:
+            self.n_slots = max(1, n_slots)
+        self.sessions: "OrderedDict[int, int]" = OrderedDict()  # session_id -> slot, LRU order
+        self.slot_owner: Dict[int, int] = {}  # slot -> session_id
+        self.in_flight: Dict[int, int] = {}  # slot -> active requests
+        # Wake scratch requests waiting on the old slots
+        self.released.set()
+
+        self.requests = 0
+        self.affinity_hits = 0
+        self.evictions = 0
+        self.scratch_requests = 0
+        self.scratch_waits = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def _evict(self, session_id: int) -> int:
+        slot = self.sessions.pop(session_id)
+        del self.slot_owner[slot]
+        self.evictions += 1
+        logger.debug(f"Evicted session {session_id} from slot {slot}")
+        return slot
+
+    def _pick_slot(self) -> int:
+        # Prefer a slot nobody owns yet, idle ones (not running scratch work) first
+        unowned = [slot for slot in range(self.n_slots) if slot not in self.slot_owner]
+        if unowned:
+            return next((slot for slot in unowned if not self.in_flight.get(slot)), unowned[0])
+
+        # Otherwise evict the least recently used idle session, falling back to the LRU one
+        return self._evict(next(
+            (sid for sid, slot in self.sessions.items() if not self.in_flight.get(slot)),
+            next(iter(self.sessions))
+        ))
+
+    def _pick_scratch_slot(self) -> Optional[int]:
+        idle = [slot for slot in range(self.n_slots) if not self.in_flight.get(slot)]
+        if len(idle) <= (1 if self.n_slots > 1 else 0):
+            return None
+        # An unowned slot costs nobody a cached prefix; else the LRU idle session gives its slot up
+        for slot in idle:
+            if slot not in self.slot_owner:
+                return slot
+        return self._evict(next(sid for sid, slot in self.sessions.items() if slot in idle))
+
+    def acquire(self, session_id: int) -> int:
+        """Return the slot for a session, assigning one if needed."""
+        self.requests += 1
+        slot = self.sessions.get(session_id)
+        if slot is not None:
+            self.sessions.move_to_end(session_id)
+            self.affinity_hits += 1
+        else:
+            slot = self._pick_slot()
+            self.sessions[session_id] = slot
+            self.slot_owner[slot] = session_id
+        self.in_flight[slot] = self.in_flight.get(slot, 0) + 1
+        return slot
+
+    def release(self, slot: int):
+        if self.in_flight.get(slot):
+            self.in_flight[slot] -= 1
+        self.released.set()
+
+    @contextmanager
+    def session_slot(self, session_id: int) -> Iterator[int]:
+        slot = self.acquire(session_id)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    @asynccontextmanager
+    async def scratch_slot(self) -> AsyncIterator[int]:
+        """An idle slot for a prompt no session will reuse; waits while none is free."""
+        self.scratch_requests += 1
+        while (slot := self._pick_scratch_slot()) is None:
+            self.scratch_waits += 1
+            self.released.clear()
+            await self.released.wait()
+        self.in_flight[slot] = self.in_flight.get(slot, 0) + 1
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def forget(self, session_id: int):
+        """Free the slot of a deleted session."""
+        slot = self.sessions.pop(session_id, None)
+        if slot is not None:
+            self.slot_owner.pop(slot, None)
+
+    def record_timings(self, timings: Optional[Dict]):
+        """Record prompt evaluation stats from a llama-server response."""
+        if not timings:
+            return
+        self.prompt_tokens += timings.get("prompt_n", 0) or 0
+        self.cached_tokens += timings.get("cache_n", 0) or 0
+
+    def get_stats(self) -> Dict:
+        prompt_total = self.prompt_tokens + self.cached_tokens
+        return {
+            "slots": self.n_slots,
+            "assigned_sessions": len(self.sessions),
+            "busy_slots": sum(1 for count in self.in_flight.values() if count),
+            "requests": self.requests,
+            "affinity_hits": self.affinity_hits,
+            "affinity_hit_rate": round(self.affinity_hits / self.requests, 3) if self.requests else 0.0,
+            "evictions": self.evictions,
+            "scratch_requests": self.scratch_requests,
+            "scratch_waits": self.scratch_waits,
+            "prompt_tokens_evaluated": self.prompt_tokens,
+            "prompt_tokens_cached": self.cached_tokens,
+            "prefix_hit_rate": round(self.cached_tokens / prompt_total, 3) if prompt_total else 0.0
+        }
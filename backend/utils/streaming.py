@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class StreamMode:
+    max_delay: float  # Longest a buffered chunk may wait for company, in seconds
+    max_bytes: int  # Flush as soon as this much text is buffered
+
+STREAM_MODES: Dict[str, StreamMode] = {
+    "latency": StreamMode(max_delay=0.0, max_bytes=512),
+    "smooth": StreamMode(max_delay=0.04, max_bytes=512),
+    "bulk": StreamMode(max_delay=0.25, max_bytes=8192),
+}
+
+def get_stream_mode(name: Optional[str], default: str = "smooth") -> StreamMode:
+    """Stream mode by name, falling back to the default for unknown names."""
+    return STREAM_MODES.get((name or "").lower(), STREAM_MODES.get(default, STREAM_MODES["smooth"]))
+
+def sse_event(content: str) -> str:
+    return f"data: {json.dumps({'content': content})}\n\n"
+
+_DONE = object()
+
+async def _next(iterator: AsyncIterator[str]):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _DONE
+
+async def coalesce(source: AsyncIterator[str], mode: StreamMode) -> AsyncIterator[str]:
+    """Merge a stream of small chunks into fewer, larger ones without sleeping.
+
+    A chunk is held at most `mode.max_delay` seconds for more text to join it
+    and is sent early once `mode.max_bytes` are buffered; chunks that are
+    already available are merged even in latency mode. The source is read at
+    most one chunk ahead of the consumer, so a slow client slows the upstream
+    reader down instead of building an unbounded buffer.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = source.__aiter__()
+    pending: Optional[asyncio.Task] = None
+    buffer: List[str] = []
+    size = 0
+    deadline = 0.0
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.create_task(_next(iterator))
+            if buffer and not pending.done():
+                # With the window closed (always, in latency mode) a read that
+                # completes without waiting on the network still gets one pass
+                await asyncio.wait({pending}, timeout=max(0.0, deadline - loop.time()))
+                if not pending.done():
+                    # Window closed with nothing new: send what there is
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+                    continue
+            elif not buffer:
+                await asyncio.wait({pending})
+
+            chunk = pending.result()
+            pending = None
+            if chunk is _DONE:
+                break
+            if not chunk:
+                continue
+
+            if not buffer:
+                deadline = loop.time() + mode.max_delay
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= mode.max_bytes:
+                yield "".join(buffer)
+                buffer, size = [], 0
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        # The client went away (or the stream ended): stop reading upstream
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.wait({pending})
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, List, Optional
+from sqlalchemy import exists, literal, select
+from sqlalchemy.dialects.sqlite import insert
+
+from db_models import Conversation, Session, SessionSummary
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = "You maintain concise running summaries of conversations between a user and an AI assistant."
+
+class SessionCompactor:
+    """Background stage that folds older turns of long sessions into a rolling summary.
+
+    Summaries are incremental: each pass only reads the turns after the stored
+    high-water mark and merges them into the existing summary, so no turn is
+    summarized twice. The most recent turns are always left verbatim.
+    """
+
+    def __init__(
+        self,
+        llm_client,
+        session_factory: Callable,
+        trigger_tokens: int = 2000,
+        keep_recent_turns: int = 4,
+        summary_max_tokens: int = 512
+    ):
+        self.llm_client = llm_client
+        self.session_factory = session_factory
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.summary_max_tokens = summary_max_tokens
+
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: set = set()
+        self.worker: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.compactions = 0
+        self.turns_compacted = 0
+        self.failures = 0
+
+    async def start(self):
+        if self.worker is None:
+            self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def schedule(self, session_id: int):
+        """Queue a session for compaction; duplicate requests are merged."""
+        if session_id not in self.pending:
+            self.pending.add(session_id)
+            self.queue.put_nowait(session_id)
+
+    async def _run(self):
+        while True:
+            session_id = await self.queue.get()
+            self.pending.discard(session_id)
+            try:
+                await self.compact(session_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Compaction failed for session {session_id}: {str(e)}")
+
+    def _format_turns(self, turns: List[Conversation]) -> str:
+        return "\n\n".join(
+            f"User: {turn.user_input}\nAssistant: {turn.ai_response}"
+            for turn in turns
+        )
+
+    async def _summarize(self, previous: str, turns: List[Conversation]) -> str:
+        prompt = (
+            "Update the running summary of this conversation with the new turns below.\n"
+            "Keep facts, decisions, names, numbers and open questions. Drop small talk.\n"
+            f"Return only the updated summary, at most {self.summary_max_tokens // 2} words.\n\n"
+            f"Current summary:\n{previous or '(none yet)'}\n\n"
+            f"New turns:\n{self._format_turns(turns)}"
+        )
+
+        return (await self.llm_client.complete(
+            prompt,
+            max_tokens=self.summary_max_tokens,
+            temperature=0.2,
+            system_prompt=SUMMARY_SYSTEM_PROMPT
+        )).strip()
+
+    async def compact(self, session_id: int) -> bool:
+        """Fold turns older than the recent window into the summary once they pass the threshold."""
+        # Read phase; the connection is released before the slow LLM calls
+        async with self.session_factory() as db:
+            record = await db.get(SessionSummary, session_id)
+            turns = (await db.scalars(
+                select(Conversation)
+                .where(
+                    Conversation.session_id == session_id,
+                    Conversation.id > (record.last_conversation_id if record else 0)
+                )
+                .order_by(Conversation.id)
+            )).all()
+
+        # A turn still streaming has a partial response; stop before it so the
+        # high-water mark never passes a turn that has not finished
+        streaming = next((i for i, turn in enumerate(turns) if turn.status == "streaming"), len(turns))
+        turns = turns[:streaming]
+        candidates = turns[:-self.keep_recent_turns] if self.keep_recent_turns else turns
+        if not candidates:
+            return False
+
+        counts = await asyncio.gather(*[
+            self.llm_client.count_tokens(f"{turn.user_input}\n{turn.ai_response}")
+            for turn in candidates
+        ])
+        if sum(counts) < self.trigger_tokens:
+            return False
+
+        # Merge in batches that fit the trigger size so each prompt stays bounded
+        batches, batch, batch_tokens = [], [], 0
+        for turn, tokens in zip(candidates, counts):
+            if batch and batch_tokens + tokens > self.trigger_tokens:
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(turn)
+            batch_tokens += tokens
+        batches.append(batch)
+
+        new_summary = record.summary if record else ""
+        for batch in batches:
+            new_summary = await self._summarize(new_summary, batch)
+            if not new_summary:
+                # Keep the old summary and mark; the next turn retries
+                self.failures += 1
+                return False
+
+        # Upsert only while the session exists: one statement, so a delete that lands
+        # during the LLM calls cannot leave an orphan summary behind
+        values = select(
+            literal(session_id), literal(new_summary), literal(candidates[-1].id), literal(datetime.utcnow())
+        ).where(exists().where(Session.id == session_id))
+        upsert = insert(SessionSummary).from_select(
+            ["session_id", "summary", "last_conversation_id", "updated_at"], values
+        )
+        upsert = upsert.on_conflict_do_update(
+            index_elements=["session_id"],
+            set_={
+                "summary": upsert.excluded.summary,
+                "last_conversation_id": upsert.excluded.last_conversation_id,
+                "updated_at": upsert.excluded.updated_at
+            }
+        )
+        async with self.session_factory() as db:
+            written = (await db.execute(upsert)).rowcount
+            await db.commit()
+        if not written:
+            logger.info(f"Session {session_id} was deleted during compaction")
+            return False
+
+        self.compactions += 1
+        self.turns_compacted += len(candidates)
+        logger.info(f"Compacted {len(candidates)} turns of session {session_id}")
+        return True
+
+    def get_stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "compactions": self.compactions,
+            "turns_compacted": self.turns_compacted,
+            "failures": self.failures
+        }
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class VectorIndex:
+    """Append-only, memory-mapped embedding matrix with a parallel key map.
+
+    Vectors are L2-normalized and stored in `vectors.bin` either as int8 with
+    a float32 scale per row in `scales.bin` (default: a quarter of the size of
+    float32 and the fastest to score) or as plain float16 rows.
+    `keys.bin` holds one fixed-width key per row ("conversation:42").
+    `meta.json` records the committed row count, so a crash halfway through
+    an append only leaves trailing bytes that are cut off on the next load.
+    Searching maps the files read-only and scores them in blocks, which keeps
+    memory flat and lets the OS page cache do the rest.
+    """
+
+    KEY_DTYPE = np.dtype("S64")
+
+    def __init__(self, directory: Path, dtype: str = "int8", block_rows: int = 4096):
+        self.directory = Path(directory)
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype("int8"), np.dtype("float16")):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.quantized = self.dtype == np.dtype("int8")
+        # Small blocks keep the float32 copy of each block in CPU cache
+        self.block_rows = block_rows
+        self.vectors_path = self.directory / "vectors.bin"
+        self.scales_path = self.directory / "scales.bin"
+        self.keys_path = self.directory / "keys.bin"
+        self.meta_path = self.directory / "meta.json"
+
+        self.meta: Optional[Dict] = None
+        self._vectors: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        self._keys: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict:
+        """Read metadata on first use and drop any uncommitted tail."""
+        if self.meta is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if self.meta_path.exists():
+                self.meta = json.loads(self.meta_path.read_text())
+            if not self.meta or self.meta.get("dtype") != self.dtype.name:
+                # Missing or written with another storage type: start empty
+                self._clear(self.meta.get("model") if self.meta else None)
+            count, dim = self.meta["count"], self.meta["dim"]
+            for path, row_bytes in ((self.vectors_path, dim * self.dtype.itemsize),
+                                    (self.scales_path, 4),
+                                    (self.keys_path, self.KEY_DTYPE.itemsize)):
+                if path.exists() and path.stat().st_size > count * row_bytes:
+                    with open(path, "r+b") as f:
+                        f.truncate(count * row_bytes)
+        return self.meta
+
+    def _write_meta(self):
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.meta))
+        os.replace(tmp, self.meta_path)
+
+    def _clear(self, model: Optional[str]):
+        self._vectors = self._scales = self._keys = None
+        for path in (self.vectors_path, self.scales_path, self.keys_path):
+            path.unlink(missing_ok=True)
+        self.meta = {"model": model, "dtype": self.dtype.name, "dim": 0, "count": 0, "state": {}}
+        self._write_meta()
+
+    def _maps(self) -> Tuple[Optional[np.memmap], Optional[np.memmap], Optional[np.memmap]]:
+        """Read-only maps of the committed rows, remapped after appends."""
+        meta = self._load()
+        count = meta["count"]
+        if not count:
+            return None, None, None
+        if self._vectors is None or len(self._vectors) != count:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(count, meta["dim"]))
+            if self.quantized:
+                self._scales = np.memmap(self.scales_path, dtype=np.float32, mode="r", shape=(count,))
+            self._keys = np.memmap(self.keys_path, dtype=self.KEY_DTYPE, mode="r", shape=(count,))
+        return self._vectors, self._scales, self._keys
+
+    @property
+    def count(self) -> int:
+        return self._load()["count"]
+
+    @property
+    def model(self) -> Optional[str]:
+        return self._load()["model"]
+
+    @property
+    def state(self) -> Dict:
+        """Indexer bookkeeping (high-water marks), committed together with the rows."""
+        return self._load()["state"]
+
+    def reset(self, model: Optional[str] = None):
+        """Drop every vector, e.g. when the embedding model changes."""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._clear(model)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def append(self, keys: Sequence[str], vectors: Sequence[Sequence[float]], state: Optional[Dict] = None):
+        """Append rows at the end of the files; existing rows are never rewritten."""
+        with self._lock:
+            meta = self._load()
+            matrix = np.asarray(vectors, dtype=np.float32)
+            if len(keys):
+                if matrix.ndim != 2 or len(matrix) != len(keys):
+                    raise ValueError("Expected one vector per key")
+                if meta["dim"] and matrix.shape[1] != meta["dim"]:
+                    raise ValueError(f"Vector size {matrix.shape[1]} does not match index size {meta['dim']}")
+
+                matrix = self._normalize(matrix)
+                if self.quantized:
+                    scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127.0
+                    rows = np.round(matrix / scales[:, None]).astype(np.int8)
+                    with open(self.scales_path, "ab") as f:
+                        f.write(scales.astype(np.float32).tobytes())
+                else:
+                    rows = matrix.astype(self.dtype)
+                with open(self.vectors_path, "ab") as f:
+                    f.write(rows.tobytes())
+                with open(self.keys_path, "ab") as f:
+                    f.write(np.array([key.encode("utf-8") for key in keys], dtype=self.KEY_DTYPE).tobytes())
+                meta["dim"] = matrix.shape[1]
+                meta["count"] += len(keys)
+
+            if state:
+                meta["state"].update(state)
+            self._write_meta()
+
+    def keys_with_prefix(self, prefix: str) -> set:
+        _, _, keys = self._maps()
+        if keys is None:
+            return set()
+        matches = keys[np.char.startswith(keys, prefix.encode("utf-8"))]
+        return {key.decode("utf-8") for key in matches}
+
+    def search(self, query: Sequence[float], k: int = 10, prefix: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Top-k keys by cosine similarity; blocks are upcast to float32 for BLAS."""
+        vectors, scales, keys = self._maps()
+        if vectors is None or k <= 0:
+            return []
+        q = self._normalize(np.asarray([query], dtype=np.float32))[0]
+        if len(q) != vectors.shape[1]:
+            raise ValueError(f"Query size {len(q)} does not match index size {vectors.shape[1]}")
+
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        encoded_prefix = prefix.encode("utf-8") if prefix else None
+        for start in range(0, len(vectors), self.block_rows):
+            block = vectors[start:start + self.block_rows]
+            scores = np.asarray(block, dtype=np.float32) @ q
+            if scales is not None:
+                scores *= scales[start:start + len(block)]
+            if encoded_prefix:
+                scores[~np.char.startswith(keys[start:start + len(block)], encoded_prefix)] = -np.inf
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(len(scores))
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_rows = np.concatenate([best_rows, top + start])
+            if len(best_scores) > k:
+                keep = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+
+        order = np.argsort(-best_scores)
+        return [
+            (keys[best_rows[i]].decode("utf-8"), float(best_scores[i]))
+            for i in order if np.isfinite(best_scores[i])
+        ]
+
+    def get_stats(self) -> Dict:
+        meta = self._load()
+        return {
+            "model": meta["model"],
+            "vectors": meta["count"],
+            "dim": meta["dim"],
+            "dtype": self.dtype.name,
+            "bytes": meta["count"] * meta["dim"] * self.dtype.itemsize
+        }
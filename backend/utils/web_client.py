@@ -0,0 +1,228 @@
+import aiohttp
+import asyncio
+import codecs
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ALLOWED_TYPES = ('text/html', 'application/xhtml+xml', 'text/plain')
+
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.IGNORECASE)
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+class DownloadRejected(Exception):
+    """A response was not read because of its type, size or transfer speed."""
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"{reason}: {url}")
+        self.url = url
+        self.reason = reason
+
+def _codec(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.strip()).name
+    except LookupError:
+        return None
+
+def decode_body(body: bytes, header_charset: Optional[str]) -> str:
+    """Decode with the charset from the headers, else from a <meta> tag, else UTF-8."""
+    encoding = _codec(header_charset)
+    if encoding is None:
+        match = META_CHARSET_RE.search(body[:4096])
+        encoding = _codec(match.group(1).decode('ascii')) if match else None
+    return body.decode(encoding or 'utf-8', errors='replace')
+
+@dataclass
+class WebResponse:
+    url: str
+    status: int
+    headers: Dict[str, str]
+    text: str
+
+class WebClient:
+    """One long-lived aiohttp session for search requests and page fetches.
+
+    The connector caches DNS lookups, keeps connections alive between requests
+    and caps connections both overall and per host, so a burst of fetches
+    cannot exhaust sockets or hammer one site. Concurrent identical requests
+    share a single in-flight fetch. The owner (the FastAPI lifespan) calls
+    `start()` and `close()`; it also works as an `async with` block.
+
+    Bodies are only read for 200 responses whose Content-Type is allowed,
+    incrementally and up to `max_bytes`; a body that is too large, arrives
+    slower than `read_timeout` per chunk or takes longer than
+    `download_timeout` overall is abandoned with DownloadRejected.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_connections_per_host: int = 8,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 30.0,
+        timeout: float = 30.0,
+        user_agent: str = DEFAULT_USER_AGENT,
+        max_bytes: int = 5 * 1024 * 1024,
+        allowed_types: Sequence[str] = DEFAULT_ALLOWED_TYPES,
+        read_timeout: float = 10.0,
+        download_timeout: float = 20.0
+    ):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.max_bytes = max_bytes
+        self.allowed_types = frozenset(t.strip().lower() for t in allowed_types if t.strip())
+        self.read_timeout = read_timeout
+        self.download_timeout = download_timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.inflight: Dict[Hashable, asyncio.Task] = {}
+
+        # Metrics
+        self.requests = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.rejected: Dict[str, int] = {}
+        self.bytes_read = 0
+        self.created_at: Optional[float] = None
+
+    async def __aenter__(self) -> "WebClient":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        if self.session is not None and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout, sock_read=self.read_timeout),
+            headers={'User-Agent': self.user_agent}
+        )
+        self.created_at = time.time()
+        logger.info(
+            f"Opened web session (limit {self.max_connections}, "
+            f"{self.max_connections_per_host} per host, DNS TTL {self.dns_cache_ttl}s)"
+        )
+
+    async def close(self):
+        if self.session is not None:
+            session, self.session = self.session, None
+            await session.close()
+            logger.info("Closed web session")
+
+    async def _coalesce(self, key: Hashable, fetch: Callable[[], Awaitable[WebResponse]]) -> WebResponse:
+        """Run `fetch` once for all concurrent callers with the same key."""
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fetch())
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        # One caller giving up must not cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        # Mark the error as retrieved even if every caller was cancelled
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    async def _request(self, method: str, url: str, headers: Optional[Dict[str, str]], data) -> WebResponse:
+        if self.session is None or self.session.closed:
+            await self.start()
+        self.requests += 1
+        async with self.session.request(method, url, headers=headers, data=data) as response:
+            text = ""
+            # Other statuses carry nothing callers use; leave their bodies unread
+            if response.status == 200:
+                try:
+                    text = await self._read_body(response, url)
+                except DownloadRejected as e:
+                    self.rejected[e.reason] = self.rejected.get(e.reason, 0) + 1
+                    logger.info(str(e))
+                    raise
+            return WebResponse(
+                url=str(response.url),
+                status=response.status,
+                headers=dict(response.headers),
+                text=text
+            )
+
+    async def _read_body(self, response: aiohttp.ClientResponse, url: str) -> str:
+        # No Content-Type at all is allowed through; the extractor copes with it
+        content_type = response.content_type if 'Content-Type' in response.headers else None
+        if content_type and self.allowed_types and content_type not in self.allowed_types:
+            raise DownloadRejected(url, "content_type")
+        if response.content_length is not None and response.content_length > self.max_bytes:
+            raise DownloadRejected(url, "too_large")
+
+        chunks = []
+
+        async def read():
+            size = 0
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                size += len(chunk)
+                self.bytes_read += len(chunk)
+                if size > self.max_bytes:
+                    raise DownloadRejected(url, "too_large")
+                chunks.append(chunk)
+
+        try:
+            await asyncio.wait_for(read(), self.download_timeout)
+        except asyncio.TimeoutError:
+            # Either one read stalled past sock_read or the whole body dripped in too slowly
+            raise DownloadRejected(url, "too_slow")
+        return decode_body(b"".join(chunks), response.charset)
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> WebResponse:
+        key = ("GET", url, tuple(sorted((headers or {}).items())))
+        return await self._coalesce(key, lambda: self._request("GET", url, headers, None))
+
+    async def post(self, url: str, data: Dict[str, str], headers: Optional[Dict[str, str]] = None) -> WebResponse:
+        key = ("POST", url, tuple(sorted(data.items())), tuple(sorted((headers or {}).items())))
+        return await self._coalesce(key, lambda: self._request("POST", url, headers, data))
+
+    def get_stats(self) -> Dict:
+        connector = self.session.connector if self.session and not self.session.closed else None
+        stats = {
+            "open": connector is not None,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "rejected": dict(self.rejected),
+            "bytes_read": self.bytes_read,
+            "max_bytes": self.max_bytes,
+            "inflight": len(self.inflight),
+            "max_connections": self.max_connections,
+            "max_connections_per_host": self.max_connections_per_host,
+            "dns_cache_ttl": self.dns_cache_ttl,
+            "uptime": round(time.time() - self.created_at, 1) if connector and self.created_at else 0.0
+        }
+        # aiohttp does not expose pool state publicly; the connector keeps it privately
+        idle = getattr(connector, "_conns", None)
+        acquired = getattr(connector, "_acquired", None)
+        if idle is not None and acquired is not None:
+            stats["idle_connections"] = sum(len(conns) for conns in idle.values())
+            stats["active_connections"] = len(acquired)
+        return stats